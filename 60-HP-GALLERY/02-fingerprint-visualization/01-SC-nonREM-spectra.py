@@ -12,9 +12,8 @@ if __name__ == '__main__':
   for p in PATH_LIST: sys.path.append(os.path.join(SOLUTION_DIR, p))
 
 # -----------------------------------------------------------------------------
-from spectra_explorer import SpectraExplorer, SignalGroup
+from spectra_explorer import SpectraExplorer
 from roma import finder
-from roma import io
 
 import sc as hub
 
@@ -29,18 +28,14 @@ CHANNELS = ['EEG Fpz-Cz', 'EEG Pz-Oz']
 N = 10
 
 # -----------------------------------------------------------------------------
-# (2) Select .sg files and visualize
+# (2) Select .sg files and visualize, signal groups will be loaded on demand
 # -----------------------------------------------------------------------------
 sg_file_list = finder.walk(hub.SG_DIR, pattern=PATTERN)
 sg_file_list = sg_file_list[:N]
 
-signal_groups = []
-for path in sg_file_list:
-  sg: SignalGroup = io.load_file(path, verbose=True)
-  sg = sg.extract_channels(CHANNELS)
-  signal_groups.append(sg)
-
-sg_label_list = [sg.label for sg in signal_groups]
+# sg file name obeys the pattern `<sg_label>(...).sg`
+sg_path_dict = {os.path.basename(p).split('(')[0]: p for p in sg_file_list}
+sg_label_list = list(sg_path_dict.keys())
 # Load meta
 meta = hub.sc_tools.load_sc_meta(hub.XLSX_PATH, sg_label_list)
 
@@ -51,11 +46,8 @@ lbs_1, lbs_2 = hub.sc_tools.get_paired_sg_labels(
 lbs_1 = sorted(lbs_1, key=lambda lb: int(meta[lb]['age']))
 lbs_2 = sorted(lbs_2, key=lambda lb: int(meta[lb]['age']))
 
-sg_pairs = []
-for lb1, lb2 in zip(lbs_1, lbs_2):
-  sg1 = [sg for sg in signal_groups if sg.label == lb1][0]
-  sg2 = [sg for sg in signal_groups if sg.label == lb2][0]
-  sg_pairs.append((sg1, sg2))
+sg_pairs = [(sg_path_dict[lb1], sg_path_dict[lb2])
+            for lb1, lb2 in zip(lbs_1, lbs_2)]
 
 # Visualize signal groups
 ee = SpectraExplorer.explore(sg_pairs, channels=CHANNELS, meta=meta,
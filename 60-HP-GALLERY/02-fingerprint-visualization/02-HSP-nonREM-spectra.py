@@ -12,8 +12,7 @@ if __name__ == '__main__':
   for p in PATH_LIST: sys.path.append(os.path.join(SOLUTION_DIR, p))
 
 # -----------------------------------------------------------------------------
-from spectra_explorer import SpectraExplorer, SignalGroup
-from roma import io
+from spectra_explorer import SpectraExplorer
 
 import a00_common as hub
 import numpy as np
@@ -31,7 +30,7 @@ CHANNELS = ['EEG F3-M2', 'EEG C3-M2', 'EEG O1-M2',
 N = 50
 
 # -----------------------------------------------------------------------------
-# (2) Generate sg tuples
+# (2) Generate sg path tuples, signal groups will be loaded on demand
 # -----------------------------------------------------------------------------
 # (2.1) Get patient_dict
 sg_groups = []
@@ -41,19 +40,13 @@ patient_dict = hub.ha.load_subset_dict(SUBSET_FN, max_subjects=N)
 for pid, ses_dict in patient_dict.items():
   group = []
   for ses_id, ses_info in ses_dict.items():
-    bids_id = pid.split(ses_info['site_id'])[1]
-    lb = f"{bids_id[2:]}-{ses_id.split('-')[1]}"
-
-    # (2.2.1) Load sg
+    # (2.2.1) Get sg path
     ho = hub.HSPOrganization(ses_id=ses_id, sub_id=pid, data_dir=hub.DATA_DIR)
     sg_fn = ho.get_sg_file_name(np.float16, 128)
-    sg_path = os.path.join(hub.SG_DIR, sg_fn)
-    sg: SignalGroup = io.load_file(sg_path, verbose=True)
-    sg.label = lb
-    group.append(sg)
+    group.append(os.path.join(hub.SG_DIR, sg_fn))
 
-    # (2.2.2) Set meta
-    meta[lb] = {k: ses_info[k] for k in ('age', 'gender')}
+    # (2.2.2) Set meta, note that sg.label is set to ho.sg_label in conversion
+    meta[ho.sg_label] = {k: ses_info[k] for k in ('age', 'gender')}
 
   sg_groups.append(group)
 
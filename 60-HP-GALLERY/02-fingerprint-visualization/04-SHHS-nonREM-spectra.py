@@ -12,8 +12,7 @@ if __name__ == '__main__':
   for p in PATH_LIST: sys.path.append(os.path.join(SOLUTION_DIR, p))
 
 # -----------------------------------------------------------------------------
-from spectra_explorer import SpectraExplorer, SignalGroup
-from roma import io
+from spectra_explorer import SpectraExplorer
 
 import shhs as hub
 
@@ -27,7 +26,7 @@ CHANNELS = ['EEG C3-A2', 'EEG C4-A1']
 N = 100
 
 # -----------------------------------------------------------------------------
-# (2) Select .sg files and visualize
+# (2) Select .sg files and visualize, signal groups will be loaded on demand
 # -----------------------------------------------------------------------------
 patient_dict = hub.sa.actual_two_visits_dict
 
@@ -38,7 +37,7 @@ for i, pid in enumerate(patient_dict.keys()):
   sg_labels = [hub.sa.get_sg_label(pid, sid) for sid in ('1', '2')]
   sg_file_names = [hub.sa.get_sg_file_name(lb) for lb in sg_labels]
   sg_paths = [os.path.join(hub.SG_DIR, fn) for fn in sg_file_names]
-  sg_pairs.append([io.load_file(p, True) for p in sg_paths])
+  sg_pairs.append(sg_paths)
 
 meta = {}
 for pid in patient_dict.keys():
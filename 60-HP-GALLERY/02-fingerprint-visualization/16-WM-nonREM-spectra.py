@@ -11,10 +11,8 @@ if __name__ == '__main__':
   for p in PATH_LIST: sys.path.append(os.path.join(SOLUTION_DIR, p))
 
 # -----------------------------------------------------------------------------
-from spectra_explorer import SpectraExplorer, SignalGroup
-from roma import io, finder
+from spectra_explorer import SpectraExplorer
 
-import numpy as np
 import srrsh as hub
 
 
@@ -27,19 +25,12 @@ CHANNELS = ['EEG F3-M2', 'EEG C3-M2', 'EEG O1-M2',
             'EEG F4-M1', 'EEG C4-M1', 'EEG O2-M1']
 
 # -----------------------------------------------------------------------------
-# (2) Get sg list
+# (2) Get sg path list, signal groups will be loaded on demand
 # -----------------------------------------------------------------------------
 SG_DIR = r'E:\data\william\wm_sg'
 path_groups = hub.SRRSHAgent.get_filepath_groups_from_sg_dir(
   SG_DIR, return_dict=True)
-
-sg_groups = []
-for lb, path_list in path_groups.items():
-  sg_group = []
-  for sg in [io.load_file(p, True) for p in path_list]:
-    stage_anno = sg.annotations['stage Ground-Truth']
-    sg_group.append(sg)
-  sg_groups.append(sg_group)
+sg_groups = list(path_groups.values())
 
 # -----------------------------------------------------------------------------
 # (3) Visualize
@@ -1,4 +1,5 @@
 from collections import OrderedDict
+from freud.data_io.instrumentation import instrument, profiled
 from freud.datasets.dataset_base import HypnoDataset
 from pictor.objects import SignalGroup
 from roma import console, Nomear, io
@@ -11,6 +12,7 @@ import os
 class Algorithm(Nomear):
   """A base class of algorithm used in SOPs"""
 
+  version = '1.0.0'
   prompt = f'[Algo] >>'
 
   save_type_III_features = True  # Save Type III probes by default
@@ -36,6 +38,16 @@ class Algorithm(Nomear):
     console.supplement(f'Time resolution: {self.time_resolution} s')
 
 
+  def get_cache_config(self) -> dict:
+    """Settings determining extracted features, used by `BenchmarkSOP` to
+    identify cached features. Subclasses should add their own settings and
+    bump `version` once the feature extraction logic is changed."""
+    return {'algorithm': self.__class__.__name__,
+            'version': self.version,
+            'time_resolution': self.time_resolution,
+            'type_III_probes': list(self._type_III_probe_dict.keys())}
+
+
   def extract_features(self, **kwargs):
     """Extract feature vectors from a list of signal group filenames.
 
@@ -54,39 +66,72 @@ class Algorithm(Nomear):
     return features, {'feature_names': feature_names}
 
 
+  @profiled('algo.gather_type_III_features')
   def gather_type_III_features(self) -> OrderedDict:
-    N = len(self.hypno_data.sg_labels)
+    """Type-III features of each probe group are kept in a feature table
+    `<group_key>.ftab` under cloud directory. Only recordings missing in
+    tables, or whose source file has been changed since, (or all if
+    `overwrite_type_III`) are processed."""
+    from freud.data_io.feature_table import FeatureTable, get_source_stat
+
+    sg_labels = self.hypno_data.sg_labels
+    N = len(sg_labels)
     od = OrderedDict()  # od['<probe_key>'].shape = (N,)
 
+    # (1) Load feature tables
+    tables = OrderedDict()
+    for group_key in self._type_III_probe_dict.keys():
+      table_path = os.path.join(self.hypno_data.cloud_dir,
+                                group_key + FeatureTable.EXTENSION)
+      tables[group_key] = FeatureTable.load(table_path)
+    outdated = {group_key: set(table.get_outdated_labels(sg_labels))
+                for group_key, table in tables.items()}
+
+    # (2) Generate features of missing recordings
     self.show_status('Gathering type-III features ...')
-    for i, (pid, sg_path) in enumerate(zip(self.hypno_data.sg_labels,
-                                        self.hypno_data.sg_file_list)):
+    rows = {group_key: OrderedDict() for group_key in tables}
+    provenance = {group_key: {} for group_key in tables}
+    for i, (pid, sg_path) in enumerate(zip(sg_labels,
+                                           self.hypno_data.sg_file_list)):
       console.print_progress(i, N)
 
       assert pid in sg_path  # Sanity check
       sg = None
 
-      # Gather type-III features from groups
-      for group_key, func in self._type_III_probe_dict.items():
-        # Try to load group from disk
-        group_fn = f'{group_key}.od'
-        group_path = os.path.join(self.hypno_data.cloud_dir, pid, group_fn)
-
-        if os.path.exists(group_path) and not self.overwrite_type_III:
-          group_dict = io.load_file(group_path, verbose=True)
-        else:
-          # If not exists, create a new group
-          if sg is None: sg: SignalGroup = io.load_file(sg_path)
-          group_dict = func(sg)
-
-          # Save if required
-          if self.save_type_III_features:
-            io.save_file(group_dict, group_path, verbose=True)
-
-        # Generate type_III features for each sg
-        for pk, value in group_dict.items():
-          if pk not in od: od[pk] = np.zeros(N, dtype=np.float32)
-          od[pk][i] = value
+      with instrument.item('algo.gather_type_III_features', pid):
+        for group_key, func in self._type_III_probe_dict.items():
+          if (pid not in outdated[group_key]
+              and not self.overwrite_type_III): continue
+
+          # Try to load group from legacy per-recording file, unless row of
+          #  an outdated recording was produced from sg file
+          group_fn = f'{group_key}.od'
+          group_path = os.path.join(self.hypno_data.cloud_dir, pid, group_fn)
+          prov = tables[group_key].provenance.get(pid, {})
+
+          if (os.path.exists(group_path) and not self.overwrite_type_III
+              and prov.get('source', group_path) == group_path):
+            group_dict = io.load_file(group_path, verbose=True)
+            source = group_path
+          else:
+            # If not exists, create a new group
+            if sg is None: sg: SignalGroup = io.load_file(sg_path)
+            group_dict = func(sg)
+            source = sg_path
+
+          rows[group_key][pid] = group_dict
+          provenance[group_key][pid] = {
+            'source': source, 'source_stat': get_source_stat(source),
+            'algorithm': self.__class__.__name__}
+
+    # (3) Append to tables (saved if required) and gather features
+    for group_key, table in tables.items():
+      if rows[group_key]:
+        table.append(rows[group_key], provenance[group_key],
+                     save=self.save_type_III_features)
+
+      features, feature_names = table.get_matrix(sg_labels, dtype=np.float32)
+      for j, pk in enumerate(feature_names): od[pk] = features[:, j]
 
     self.show_status(f'Gathered type-III features from {N} signal groups.')
     return od
@@ -0,0 +1,187 @@
+"""Parallel counterpart of `Pipeline.fit_traverse_spaces`. Each
+(sub-space x model config) job runs all its repeats of k-fold fitting in a
+worker process. Repeats are seeded deterministically, and each fitted package
+is cached on disk under a key of (sub-space data, model config, seed), so that
+adding a model to `ml_config` does not refit existing ones.
+
+Unlike the serial path, hyper-parameter tuning (when `nested` is False) is
+seeded with the seed of the first repeat, so that cached packages are
+reproducible.
+
+Packages are put into pipeline in the same order as the serial path does,
+thus `Pipeline.report` and `Pipeline.plot_matrix` work as usual.
+"""
+from collections import OrderedDict
+from roma import console, io
+
+import os
+import zlib
+import numpy as np
+
+
+
+def get_sub_space_fingerprint(omix) -> str:
+  """Fingerprint of a sub-space, which is an Omix, or a tuple
+  (omix, method, kwargs) in case of nested dimension reduction."""
+  import hashlib
+
+  method_str = ''
+  if isinstance(omix, tuple):
+    omix, method, kwargs = omix
+    method_str = f'{method}:{sorted(kwargs.items())}'
+
+  md5 = hashlib.md5()
+  md5.update(np.ascontiguousarray(omix.features).tobytes())
+  md5.update(np.ascontiguousarray(omix.targets).tobytes())
+  md5.update(repr(list(omix.feature_labels)).encode('utf-8'))
+  md5.update(method_str.encode('utf-8'))
+  return md5.hexdigest()
+
+
+def get_job_seed(base_seed: int, fingerprint: str, model_key, repeat: int):
+  """Deterministic seed of each repeat, independent of execution order"""
+  text = f'{base_seed}|{fingerprint}|{model_key}|{repeat}'
+  return zlib.crc32(text.encode('utf-8')) % (2 ** 31)
+
+
+
+def _fit_job(omix, model_key, seeds, nested, save_models, fit_kwargs):
+  """Fit model on omix once for each seed, return list of FitPackage.
+  If `nested` is False, hyper-parameters are tuned once with `seeds[0]` as
+  random state and shared by all repeats."""
+  from pictor.xomics.ml import get_model_class
+
+  model = get_model_class(model_key)()
+
+  # Tune hyper-parameters once as `Pipeline.fit_traverse_spaces` does
+  hp = None
+  if not nested:
+    if isinstance(omix, tuple):
+      raise AssertionError('!! nested dimension reduction should be used '
+                           'with callable nested hp tuning')
+    hp = model.tune_hyperparameters(
+      omix, verbose=fit_kwargs.get('verbose', 0), random_state=seeds[0],
+      hp_space=fit_kwargs.get('hp_space', None))
+
+  return [model.fit_k_fold(omix, hp=hp, save_models=save_models,
+                           nested_ml=nested, random_state=seed, **fit_kwargs)
+          for seed in seeds]
+
+
+
+class CVExecutor(object):
+
+  prompt = '[CV_EXECUTOR] >>'
+
+  def __init__(self, pipeline, n_workers=1, seed=0, cache_dir=None):
+    self.pipeline = pipeline
+    self.n_workers = n_workers
+    self.seed = seed
+    self.cache_dir = cache_dir
+    if cache_dir is not None and not os.path.exists(cache_dir):
+      os.makedirs(cache_dir)
+
+  # region: Private Methods
+
+  def _get_cache_path(self, fingerprint, model_key, fit_kwargs, nested, seed):
+    if self.cache_dir is None: return None
+    import hashlib
+
+    # Verbosity does not affect fitted packages
+    fit_kwargs = {k: v for k, v in fit_kwargs.items() if k != 'verbose'}
+    text = (f'{fingerprint}|{model_key}|{sorted(fit_kwargs.items())}|'
+            f'{nested}|{self.pipeline.save_models}|{seed}')
+    key = hashlib.md5(text.encode('utf-8')).hexdigest()
+    return os.path.join(self.cache_dir, f'{key}.pkg')
+
+
+  def _run_jobs(self, jobs: list) -> list:
+    """jobs = [(args, ...)], return results in the same order"""
+    if self.n_workers <= 1 or len(jobs) < 2:
+      return [_fit_job(*args) for args in jobs]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+      futures = {executor.submit(_fit_job, *args): i
+                 for i, args in enumerate(jobs)}
+      for n, future in enumerate(futures):
+        console.print_progress(n, len(jobs))
+        results[futures[future]] = future.result()
+    return results
+
+
+  @staticmethod
+  def _get_model_name(model_key) -> str:
+    from pictor.xomics.ml import get_model_class
+    return str(get_model_class(model_key)())
+
+  # endregion: Private Methods
+
+  # region: Public Methods
+
+  def fit_traverse_spaces(self, ml_config: list):
+    """Fit each model config in `ml_config` on all sub-spaces.
+
+    :param ml_config: [(model_key, config), ...], config is the same as
+                      kwargs of `Pipeline.fit_traverse_spaces`
+    """
+    pi = self.pipeline
+    sub_spaces = pi.sub_spaces
+    fingerprints = [get_sub_space_fingerprint(omix) for omix in sub_spaces]
+
+    # (1) Collect jobs of missing packages
+    slots = OrderedDict()   # (config_index, space_index) -> [pkg, ...]
+    jobs, job_slots = [], []
+    for c, (model_key, config) in enumerate(ml_config):
+      fit_kwargs = {'verbose': 1}
+      fit_kwargs.update(config)
+      repeats = fit_kwargs.pop('repeats', 1)
+      nested = fit_kwargs.pop('nested', 1)
+      fit_kwargs.pop('show_progress', None)
+      fixed_seed = fit_kwargs.pop('random_state', None)
+
+      for s, (omix, fp) in enumerate(zip(sub_spaces, fingerprints)):
+        seeds = [fixed_seed if fixed_seed is not None
+                 else get_job_seed(self.seed, fp, model_key, r)
+                 for r in range(repeats)]
+        paths = [self._get_cache_path(fp, model_key, fit_kwargs, nested, seed)
+                 for seed in seeds]
+
+        pkgs = [io.load_file(p) if p is not None and os.path.exists(p)
+                else None for p in paths]
+        slots[(c, s)] = pkgs
+
+        missing = [r for r, pkg in enumerate(pkgs) if pkg is None]
+        if not missing: continue
+        jobs.append((omix, model_key, [seeds[r] for r in missing], nested,
+                     pi.save_models, fit_kwargs))
+        job_slots.append(((c, s), missing, [paths[r] for r in missing]))
+
+    n_total = sum([len(pkgs) for pkgs in slots.values()])
+    n_missing = sum([len(m) for _, m, _ in job_slots])
+    console.show_status(
+      f'Fitting {n_missing} packages ({n_total - n_missing} cached) with '
+      f'{len(jobs)} jobs using {self.n_workers} workers ...',
+      prompt=self.prompt)
+
+    # (2) Run jobs and cache results
+    for (slot_key, missing, paths), pkgs in zip(job_slots,
+                                                self._run_jobs(jobs)):
+      for r, path, pkg in zip(missing, paths, pkgs):
+        slots[slot_key][r] = pkg
+        if path is not None: io.save_file(pkg, path)
+
+    # (3) Put packages into pipeline in serial order
+    for (c, s), pkgs in slots.items():
+      model_key = ml_config[c][0]
+      pkg_dict = pi.get_fit_packages(sub_spaces[s])
+      model_name = self._get_model_name(model_key)
+      if model_name not in pkg_dict: pkg_dict[model_name] = []
+      pkg_dict[model_name].extend(pkgs)
+
+    console.show_status(f'Traversed through {len(sub_spaces)} subspaces.',
+                        prompt=self.prompt)
+
+  # endregion: Public Methods
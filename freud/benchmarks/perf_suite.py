@@ -0,0 +1,286 @@
+"""Offline performance benchmark of freud hot paths on a synthetic cohort.
+Each case is timed `repeats` times and results are saved to a JSON file for
+regression tracking. Cases whose dependencies are missing are marked as
+skipped instead of failing the whole suite.
+
+Cases:
+  edf_read          reading HSP EDF files via mne
+  hsp_conversion    HSP EDF + csv -> SignalGroup
+  shhs_conversion   SHHS EDF + xml -> SignalGroup
+  sg_load           loading .sg files
+  tape_extraction   stacking sg channels into tapes of shape [L, C]
+  batch_sampling    sampling training batches from a TapeStore
+  cloud_generation  generating clouds via hypnomics
+  nebula_load_*     loading clouds from per-file storage / NebulaStore
+  medbase           MedBase parse and export
+"""
+from collections import OrderedDict
+from freud.benchmarks.synthetic import SyntheticCohort
+from roma import console, io
+
+import os
+import time
+import numpy as np
+
+
+
+class PerfSuite(object):
+
+  prompt = '[PERF] >>'
+
+  CASES = ('edf_read', 'hsp_conversion', 'shhs_conversion', 'sg_load',
+           'tape_extraction', 'batch_sampling', 'cloud_generation',
+           'nebula_load_files', 'nebula_load_store', 'medbase')
+
+  def __init__(self, cohort: SyntheticCohort, work_dir=None, repeats=3):
+    self.cohort = cohort
+    self.work_dir = (os.path.join(cohort.root, 'perf') if work_dir is None
+                     else work_dir)
+    self.repeats = repeats
+    if not os.path.exists(self.work_dir): os.makedirs(self.work_dir)
+
+  # region: Public Methods
+
+  def run(self, cases=None) -> OrderedDict:
+    if cases is None: cases = self.CASES
+    results = OrderedDict()
+    for key in cases:
+      console.show_status(f'Running `{key}` ...', prompt=self.prompt)
+      try:
+        results[key] = self._time(*getattr(self, f'_case_{key}')())
+      except ImportError as e:
+        results[key] = {'status': 'skipped', 'reason': str(e)}
+      except Exception as e:
+        results[key] = {'status': 'failed',
+                        'reason': f'{type(e).__name__}: {e}'}
+      self._report(key, results[key])
+    return results
+
+
+  def save(self, results: dict, path):
+    """Save results along with environment and cohort configuration"""
+    import json, platform
+
+    record = OrderedDict()
+    record['time'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    record['platform'] = platform.platform()
+    record['python'] = platform.python_version()
+    record['numpy'] = np.__version__
+    record['cohort'] = self.cohort.config
+    record['repeats'] = self.repeats
+    record['results'] = results
+
+    with open(path, 'w') as f: json.dump(record, f, indent=2)
+    console.show_status(f'Results saved to `{path}`.', prompt=self.prompt)
+
+  # endregion: Public Methods
+
+  # region: Private Methods
+
+  def _time(self, func, n_units, unit) -> dict:
+    times = []
+    for _ in range(self.repeats):
+      tic = time.perf_counter()
+      func()
+      times.append(time.perf_counter() - tic)
+
+    median = float(np.median(times))
+    return {'status': 'ok', 'times': times, 'min': float(min(times)),
+            'median': median, 'throughput': n_units / max(median, 1e-9),
+            'unit': f'{unit}/sec'}
+
+
+  def _report(self, key, result: dict):
+    if result['status'] != 'ok':
+      console.supplement(f'{key}: {result["status"]} ({result["reason"]})')
+      return
+    console.supplement(f'{key}: median {result["median"] * 1000:.1f} ms, '
+                       f'{result["throughput"]:.3g} {result["unit"]}')
+
+
+  @property
+  def n_samples_per_night(self):
+    return self.cohort.n_epochs * 30 * self.cohort.sfreq
+
+
+  def _load_signal_groups(self) -> list:
+    return [io.load_file(self.cohort.get_sg_path(i))
+            for i in range(self.cohort.n_nights)]
+
+  # endregion: Private Methods
+
+  # region: Cases
+
+  # Each case prepares its data and returns (func, n_units, unit)
+
+  def _case_edf_read(self):
+    from freud.data_io.mne_based import read_digital_signals_mne
+    from freud.talos_utils.sleep_sets.hsp import HSPSet
+
+    paths = [self.cohort.get_hsp_paths(i)[0]
+             for i in range(self.cohort.n_nights)]
+    n = len(self.cohort.hsp_channels)
+    func = lambda: [read_digital_signals_mne(
+      p, chn_map=HSPSet.channel_map, groups=HSPSet.GROUPS) for p in paths]
+    return func, n * self.n_samples_per_night * len(paths), 'samples'
+
+
+  def _case_hsp_conversion(self):
+    from freud.talos_utils.sleep_sets.hsp import HSPSet
+
+    edf_paths = [self.cohort.get_hsp_paths(i)[0]
+                 for i in range(self.cohort.n_nights)]
+    ses_dirs = [os.path.dirname(os.path.dirname(p)) for p in edf_paths]
+    func = lambda: [HSPSet.load_sg_from_raw_files(d) for d in ses_dirs]
+    return func, len(ses_dirs), 'nights'
+
+
+  def _case_shhs_conversion(self):
+    from freud.talos_utils.sleep_sets.shhs import SHHSet
+
+    args = [self.cohort.get_shhs_paths(i) + (pid,)
+            for i, pid in enumerate(self.cohort.shhs_pids)]
+    func = lambda: [SHHSet.load_sg_from_raw_files(*a) for a in args]
+    return func, len(args), 'nights'
+
+
+  def _case_sg_load(self):
+    return self._load_signal_groups, self.cohort.n_nights, 'nights'
+
+
+  def _case_tape_extraction(self):
+    """Tapes are extracted as in `SleepSet.extract_sg_tapes` (case 1, i.e.,
+    all channels fused into one tape)"""
+    sgs = self._load_signal_groups()
+    func = lambda: [np.stack([sg[ck] for ck in sg.channel_names], axis=-1)
+                    for sg in sgs]
+    n = sum([len(sg.channel_names) for sg in sgs])
+    return func, n * self.n_samples_per_night, 'samples'
+
+
+  def _case_batch_sampling(self, batch_size=32, n_batches=50):
+    from freud.talos_utils.tape_store import TapeStore
+
+    # (1) Write tapes into a store
+    sgs = self._load_signal_groups()
+    tapes = [np.stack([sg[ck] for ck in sg.channel_names], axis=-1)
+             for sg in sgs]
+    offsets = np.cumsum([0] + [len(t) for t in tapes]).tolist()
+    shape = (offsets[-1], tapes[0].shape[1])
+    path = os.path.join(self.work_dir, 'perf.tapes')
+    mm = np.memmap(path, dtype=tapes[0].dtype, mode='w+', shape=shape)
+    for i, t in enumerate(tapes): mm[offsets[i]:offsets[i + 1]] = t
+    mm.flush()
+    del mm
+
+    # (2) Build epoch index from hypnograms
+    from freud.data_io.sidecar import load_sidecar
+
+    stage_ids = [
+      load_sidecar(self.cohort.get_sg_path(i))['hypnogram'].astype(int)
+      for i in range(self.cohort.n_nights)]
+    epoch_index = [np.array([(i, j * 30.) for i, ids in enumerate(stage_ids)
+                             for j in np.flatnonzero(ids == sid)],
+                            dtype=float).reshape(-1, 2) for sid in range(5)]
+    store = TapeStore(path, shape, tapes[0].dtype, offsets,
+                      [self.cohort.sfreq] * len(tapes), stage_ids,
+                      epoch_index, num_stages=5)
+
+    rng = np.random.RandomState(0)
+    func = lambda: [store.sample_batch(rng, batch_size)
+                    for _ in range(n_batches)]
+    return func, n_batches, 'batches'
+
+
+  def _case_cloud_generation(self):
+    from hypnomics.freud.freud import Freud
+    from freud.hypno_tools.probe_tools import get_extractor_dict
+
+    cloud_dir = os.path.join(self.work_dir, 'clouds')
+    channels = [f'EEG {ck}' for ck in ('C3-M2', 'C4-M1')]
+    extractor_dict = get_extractor_dict(['AMP-1', 'FREQ-20'],
+                                        fs=self.cohort.sfreq)
+    func = lambda: Freud(cloud_dir).generate_clouds(
+      self.cohort.sg_dir, pattern='*.sg', channels=channels,
+      time_resolutions=[30], overwrite=True, extractor_dict=extractor_dict)
+    return func, self.cohort.n_nights, 'nights'
+
+
+  def _prepare_clouds(self):
+    """Write synthetic clouds both as per-file storage and into a NebulaStore,
+    so that nebula cases do not depend on hypnomics. Return (cloud_dir,
+    store_dir, keys)."""
+    from freud.hypno_tools.nebula_store import NebulaStore
+
+    cloud_dir = os.path.join(self.work_dir, 'synthetic_clouds')
+    store_dir = os.path.join(self.work_dir, 'nebula')
+    labels, channels = self.cohort.sg_labels, ['EEG C3-M2', 'EEG C4-M1']
+    probe_keys = [f'PROBE-{i}' for i in range(20)]
+    keys = [(lb, ck, pk) for lb in labels for ck in channels
+            for pk in probe_keys]
+
+    rng = np.random.RandomState(0)
+    for lb, ck, pk in keys:
+      path = os.path.join(cloud_dir, lb, ck, '30s', f'{pk}.clouds')
+      if os.path.exists(path): continue
+      if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      io.save_file({sk: rng.randn(rng.randint(20, 400))
+                    for sk in ('W', 'N1', 'N2', 'N3', 'R')}, path)
+
+    if not os.path.exists(store_dir): os.makedirs(store_dir)
+    NebulaStore(store_dir, 30).import_clouds(
+      cloud_dir, labels, channels, probe_keys, verbose=False)
+    return cloud_dir, store_dir, keys
+
+
+  def _case_nebula_load_files(self):
+    cloud_dir, _, keys = self._prepare_clouds()
+
+    def func():
+      for lb, ck, pk in keys: io.load_file(
+        os.path.join(cloud_dir, lb, ck, '30s', f'{pk}.clouds'))
+    return func, len(keys), 'clouds'
+
+
+  def _case_nebula_load_store(self):
+    from freud.hypno_tools.nebula_store import NebulaStore
+
+    _, store_dir, keys = self._prepare_clouds()
+
+    def func():
+      store = NebulaStore(store_dir, 30)
+      for key in keys: store.get_clouds(*key)
+    return func, len(keys), 'clouds'
+
+
+  def _case_medbase(self):
+    from freud.database.med_base import MedBase
+
+    batch_path = self.cohort.medbase_batch_path
+    if not os.path.exists(batch_path): raise ImportError(
+      f'`{batch_path}` not found (openpyxl may be missing)')
+
+    def func():
+      db = MedBase(self.work_dir, db_name='perf_db')
+      db.read_raw_data(batch_path, primary_key='pid', verbose=False)
+      db.export(groups=('root',))
+    return func, self.cohort.n_nights, 'records'
+
+  # endregion: Cases
+
+
+
+if __name__ == '__main__':
+  # Configuration
+  ROOT = os.path.join(os.path.expanduser('~'), 'freud_perf')
+  N_NIGHTS, HOURS, SFREQ = 4, 8.0, 128
+  REPEATS = 3
+
+  cohort = SyntheticCohort(ROOT, n_nights=N_NIGHTS, hours=HOURS, sfreq=SFREQ)
+  cohort.generate()
+
+  suite = PerfSuite(cohort, repeats=REPEATS)
+  results = suite.run()
+  suite.save(results, os.path.join(
+    suite.work_dir, time.strftime('perf-%Y%m%d-%H%M%S.json')))
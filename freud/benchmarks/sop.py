@@ -1,6 +1,6 @@
 from freud.benchmarks.algorithm import Algorithm
 from freud.datasets.dataset_base import HypnoDataset
-from roma import console, Nomear
+from roma import console, Nomear, io
 from pictor.xomics.omix import Omix
 from pictor.xomics.evaluation.pipeline import Pipeline
 
@@ -25,17 +25,65 @@ class BenchmarkSOP(Nomear):
   def omix_path(self):
     return os.path.join(self.hypno_data.omix_dir, f'{self.study_name}.omix')
 
+  @property
+  def feature_cache_dir(self):
+    path = os.path.join(self.hypno_data.omix_dir, 'feature_cache')
+    if not os.path.exists(path): os.mkdir(path)
+    return path
+
+  # region: Feature Cache
+
+  def get_cache_config(self) -> dict:
+    """Everything features depend on: signal group files (name, size and
+    modification time), channels and algorithm settings."""
+    sg_files = []
+    for path in self.hypno_data.sg_file_list:
+      stat = os.stat(path)
+      sg_files.append((os.path.basename(path), stat.st_size,
+                       stat.st_mtime_ns))
+
+    return {'sg_files': sg_files,
+            'channels': list(self.hypno_data.channels),
+            'model': self.model.get_cache_config()}
+
+
+  @staticmethod
+  def get_config_hash(config: dict) -> str:
+    import hashlib, json
+
+    text = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
 
-  def generate_omix(self, target_key, target_labels, data_name='Omix',
-                    target_collection=None) -> Omix:
-    if not self.overwrite and self.study_name is not None:
-      if os.path.exists(self.omix_path): return Omix.load(self.omix_path)
 
-    # Extract features
+  def extract_features(self):
+    """Extract features via model, reusing cached results if the full
+    configuration is unchanged. Return (features, feature_names)."""
+    config = self.get_cache_config()
+    cache_path = os.path.join(self.feature_cache_dir,
+                              f'{self.get_config_hash(config)}.features')
+
+    if not self.overwrite and os.path.exists(cache_path):
+      cache: dict = io.load_file(cache_path)
+      console.show_status(f'Features loaded from `{cache_path}`.',
+                          prompt='[SOP] >>')
+      return cache['features'], cache['feature_names']
+
     console.show_status('Extracting features ...', prompt='[SOP] >>')
     features, pkg = self.model.extract_features()
     feature_names = pkg['feature_names']
 
+    io.save_file({'features': features, 'feature_names': feature_names,
+                  'sg_labels': self.hypno_data.sg_labels, 'config': config},
+                 cache_path, verbose=True)
+    return features, feature_names
+
+  # endregion: Feature Cache
+
+  def generate_omix(self, target_key, target_labels, data_name='Omix',
+                    target_collection=None) -> Omix:
+    # Extract features (cached by configuration)
+    features, feature_names = self.extract_features()
+
     # Generate targets
     meta = self.hypno_data.load_meta()
     targets = [meta[sg_lb][target_key] for sg_lb in self.hypno_data.sg_labels]
@@ -68,7 +116,13 @@ class BenchmarkSOP(Nomear):
                           ml_config: list,
                           report = True,
                           plot_matrix = False,
+                          n_workers = 1,
+                          seed = None,
+                          cache_dir = None,
                           **kwargs):
+    """If `n_workers` > 1, `seed` or `cache_dir` is provided, models are
+    fitted by `CVExecutor`, i.e., in a process pool with deterministic seeds
+    (0 by default), and fitted packages are cached in `cache_dir`."""
 
     # (0) Create pipeline
     pi = Pipeline(omix, ignore_warnings=1, save_models=0)
@@ -80,10 +134,21 @@ class BenchmarkSOP(Nomear):
       pi.create_sub_space(key, **kwargs)
 
     # (2) Machine learning
+    _ml_config = []
     for key, config in ml_config:
       kwargs = {'repeats': 1, 'nested': 1, 'show_progress': 1, 'verbose': 1}
       kwargs.update(config)
-      pi.fit_traverse_spaces(key, **kwargs)
+      _ml_config.append((key, kwargs))
+
+    if n_workers > 1 or seed is not None or cache_dir is not None:
+      from freud.benchmarks.cv_executor import CVExecutor
+
+      if seed is None: seed = 0
+      executor = CVExecutor(pi, n_workers=n_workers, seed=seed,
+                            cache_dir=cache_dir)
+      executor.fit_traverse_spaces(_ml_config)
+    else:
+      for key, kwargs in _ml_config: pi.fit_traverse_spaces(key, **kwargs)
 
     # (3) Finalize
     if report:
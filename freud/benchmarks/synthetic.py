@@ -0,0 +1,398 @@
+"""Synthetic PSG data for offline benchmarking. Hypnograms are sampled from a
+Markov chain whose transitions drift across the night (more N3 early, more
+REM late), and signals are composed of stage-dependent rhythms (alpha, theta,
+spindles, delta, eye movements, muscle tone) on top of 1/f background noise.
+
+Generated files follow the layouts read by freud:
+  hsp/sub-<id>/ses-1/eeg/sub-<id>_ses-1_task-psg_{eeg.edf,annotations.csv}
+  shhs/polysomnography/edfs/shhs1/shhs1-<pid>.edf
+  shhs/polysomnography/annotations-events-nsrr/shhs1/shhs1-<pid>-nsrr.xml
+  sg/<label>(synthetic,<fs>Hz).sg
+  medbase/records.xlsx (if openpyxl is available)
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from freud.dsp_tools.kernels import moving_average
+from roma import console
+
+import os
+import zlib
+import numpy as np
+
+
+
+STAGES = ['W', 'N1', 'N2', 'N3', 'R']
+EPOCH_DURATION = 30
+
+HSP_CHANNELS = ['F3-M2', 'F4-M1', 'C3-M2', 'C4-M1', 'O1-M2', 'O2-M1',
+                'E1-M2', 'E2-M1', 'Chin1-Chin2']
+SHHS_CHANNELS = ['EEG', 'EEG(sec)', 'EMG', 'EOG(L)', 'EOG(R)']
+
+# Amplitudes (uV) of rhythms in each stage (W, N1, N2, N3, R)
+RHYTHMS = OrderedDict([
+  # name: (frequency, amplitudes)
+  ('alpha', (10.0, [20, 6, 2, 1, 4])),
+  ('theta', (6.0, [4, 14, 8, 6, 12])),
+  ('sigma', (13.0, [0, 1, 10, 4, 0])),
+  ('delta', (1.0, [4, 10, 25, 75, 6])),
+])
+EOG_AMPLITUDES = [40, 15, 3, 2, 60]
+EMG_AMPLITUDES = [25, 12, 8, 6, 2]
+
+# Base transition matrix (from row stage to column stage) per epoch
+TRANSITIONS = np.array([
+  [0.90, 0.08, 0.02, 0.00, 0.00],
+  [0.05, 0.60, 0.30, 0.00, 0.05],
+  [0.02, 0.02, 0.88, 0.05, 0.03],
+  [0.01, 0.00, 0.10, 0.89, 0.00],
+  [0.02, 0.03, 0.05, 0.00, 0.90],
+])
+
+PHYSICAL_RANGE = 500.  # uV
+
+
+
+# region: Hypnograms and Signals
+
+def generate_hypnogram(n_epochs: int, rng: np.random.RandomState):
+  """Return AASM stage IDs (0: W, 1: N1, 2: N2, 3: N3, 4: R) of each epoch"""
+  hypnogram = np.zeros(n_epochs, dtype=np.uint8)
+  sid = 0
+  for i in range(1, n_epochs):
+    # Night progress in [0, 1], N3 fades out and REM increases
+    p = TRANSITIONS[sid].copy()
+    progress = i / n_epochs
+    p[3] *= 2 * (1 - progress)
+    p[4] *= 0.5 + progress
+    sid = rng.choice(5, p=p / p.sum())
+    hypnogram[i] = sid
+  return hypnogram
+
+
+def pink_noise(n: int, rng: np.random.RandomState) -> np.ndarray:
+  """1/f noise with unit standard deviation"""
+  spectrum = np.fft.rfft(rng.randn(n))
+  f = np.arange(len(spectrum))
+  spectrum[1:] /= np.sqrt(f[1:])
+  x = np.fft.irfft(spectrum, n)
+  return x / (x.std() + 1e-12)
+
+
+def generate_channel(hypnogram, sfreq, kind, rng: np.random.RandomState):
+  """Generate signal (uV) of a channel, `kind` in ('EEG', 'EOG', 'EMG')"""
+  L = len(hypnogram) * EPOCH_DURATION * int(sfreq)
+  t = np.arange(L) / sfreq
+
+  # Per-sample amplitude envelopes, smoothed at epoch boundaries
+  def envelope(amplitudes):
+    a = np.repeat(np.asarray(amplitudes, dtype=float)[hypnogram],
+                  EPOCH_DURATION * int(sfreq))
+    return moving_average(a, int(sfreq))
+
+  if kind == 'EMG':
+    return envelope(EMG_AMPLITUDES) * rng.randn(L) * 0.5
+
+  x = 5 * pink_noise(L, rng)
+  if kind == 'EOG':
+    # Slow eye movements as low-passed random walk
+    eye = np.cumsum(rng.randn(L))
+    eye = eye - moving_average(eye, int(sfreq) * 4)
+    x += envelope(EOG_AMPLITUDES) * eye / (eye.std() + 1e-12)
+
+  for name, (freq, amplitudes) in RHYTHMS.items():
+    if kind == 'EOG' and name != 'delta': continue
+    # Slowly drifting phase makes rhythms look less like pure tones
+    phase = np.cumsum(rng.randn(L)) * 0.02
+    x += envelope(amplitudes) * np.sin(2 * np.pi * freq * t + phase)
+  return x
+
+
+def get_channel_kind(channel_name: str) -> str:
+  if channel_name.startswith('E') and channel_name[1] in '12(O':
+    return 'EOG'
+  if 'EMG' in channel_name or 'Chin' in channel_name: return 'EMG'
+  return 'EEG'
+
+
+def generate_psg(hypnogram, channels, sfreq, rng) -> np.ndarray:
+  """Return signals of shape [L, C] in uV"""
+  signals = [generate_channel(hypnogram, sfreq, get_channel_kind(ck), rng)
+             for ck in channels]
+  return np.stack(signals, axis=1).astype(np.float32)
+
+# endregion: Hypnograms and Signals
+
+# region: Writers
+
+def write_edf(path, data: np.ndarray, sfreq: int, channel_names,
+              start_time: datetime = None):
+  """Write [L, C] signals (uV) to an EDF file with 1-second data records"""
+  if start_time is None: start_time = datetime(2020, 1, 1, 22, 0, 0)
+  sfreq, (L, C) = int(sfreq), data.shape
+  n_records = L // sfreq
+  dig_max, phys_max = 32767, PHYSICAL_RANGE
+
+  field = lambda v, n: str(v)[:n].ljust(n).encode('ascii')
+  header = b''.join([
+    field(0, 8), field('X X X X', 80),
+    field('Startdate X X X synthetic', 80),
+    field(start_time.strftime('%d.%m.%y'), 8),
+    field(start_time.strftime('%H.%M.%S'), 8),
+    field(256 * (C + 1), 8), field('', 44),
+    field(n_records, 8), field(1, 8), field(C, 4)])
+  for values, n in [
+    (channel_names, 16), (['AgAgCl electrode'] * C, 80), (['uV'] * C, 8),
+    ([-phys_max] * C, 8), ([phys_max] * C, 8), ([-dig_max] * C, 8),
+    ([dig_max] * C, 8), ([''] * C, 80), ([sfreq] * C, 8), ([''] * C, 32)]:
+    header += b''.join([field(v, n) for v in values])
+
+  # Records are laid out as [n_records, C, sfreq]
+  digital = np.clip(np.round(data[:n_records * sfreq] / phys_max * dig_max),
+                    -dig_max, dig_max).astype('<i2')
+  digital = digital.reshape(n_records, sfreq, C).transpose(0, 2, 1)
+
+  with open(path, 'wb') as f:
+    f.write(header)
+    f.write(np.ascontiguousarray(digital).tobytes())
+
+
+def write_hsp_annotation(path, hypnogram, start_time: datetime = None):
+  """Write annotations in HSP csv format (epoch, time, duration, event)"""
+  import pandas as pd
+
+  if start_time is None: start_time = datetime(2020, 1, 1, 22, 0, 0)
+  rows = [{'epoch': 1, 'time': start_time.strftime('%H:%M:%S'),
+           'duration': 0, 'event': 'Start Recording'}]
+  for i, sid in enumerate(hypnogram):
+    t = start_time + timedelta(seconds=i * EPOCH_DURATION)
+    rows.append({'epoch': i + 1, 'time': t.strftime('%H:%M:%S'),
+                 'duration': EPOCH_DURATION,
+                 'event': f'Sleep_stage_{STAGES[sid]}'})
+  pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def write_shhs_annotation(path, hypnogram):
+  """Write stage annotations in NSRR xml format"""
+  import xml.etree.ElementTree as ET
+
+  concepts = ['Wake|0', 'Stage 1 sleep|1', 'Stage 2 sleep|2',
+              'Stage 3 sleep|3', 'REM sleep|5']
+
+  root = ET.Element('PSGAnnotation')
+  ET.SubElement(root, 'SoftwareVersion').text = 'synthetic'
+  ET.SubElement(root, 'EpochLength').text = str(EPOCH_DURATION)
+  events = ET.SubElement(root, 'ScoredEvents')
+  for sid, start, n in get_stage_runs(hypnogram):
+    e = ET.SubElement(events, 'ScoredEvent')
+    ET.SubElement(e, 'EventType').text = 'Stages|Stages'
+    ET.SubElement(e, 'EventConcept').text = concepts[sid]
+    ET.SubElement(e, 'Start').text = f'{start * EPOCH_DURATION:.1f}'
+    ET.SubElement(e, 'Duration').text = f'{n * EPOCH_DURATION:.1f}'
+  ET.ElementTree(root).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def get_stage_runs(hypnogram) -> list:
+  """Return [(stage_id, start_epoch, n_epochs), ...]"""
+  change = np.flatnonzero(np.diff(hypnogram)) + 1
+  starts = np.concatenate([[0], change])
+  ends = np.concatenate([change, [len(hypnogram)]])
+  return [(int(hypnogram[a]), int(a), int(b - a))
+          for a, b in zip(starts, ends)]
+
+
+def make_signal_group(data, sfreq, channel_names, hypnogram, label):
+  from freud.data_io.sidecar import AASM_LABELS, ANNO_KEY_GT_STAGE
+  from pictor.objects.signals.signal_group import Annotation
+  from pictor.objects.signals.signal_group import DigitalSignal, SignalGroup
+
+  ds = DigitalSignal(data, sfreq=sfreq, channel_names=channel_names,
+                     label=','.join(channel_names))
+  sg = SignalGroup([ds], label=label)
+
+  intervals, annotations = [], []
+  for sid, start, n in get_stage_runs(hypnogram):
+    intervals.append((start * EPOCH_DURATION, (start + n) * EPOCH_DURATION))
+    annotations.append(sid)
+  sg.annotations[ANNO_KEY_GT_STAGE] = Annotation(
+    intervals, annotations, labels=AASM_LABELS)
+  return sg
+
+
+def write_medbase_batch(path, labels, rng: np.random.RandomState):
+  """Write a clinical record sheet (one row per recording) for MedBase"""
+  import pandas as pd
+
+  rows = []
+  for i, label in enumerate(labels):
+    date = datetime(2020, 1, 1) + timedelta(days=int(rng.randint(0, 1500)))
+    rows.append({'pid': f'PT{100000 + i}',
+                 'gender': ['female', 'male'][rng.randint(2)],
+                 'age': int(rng.randint(18, 90)),
+                 'date': date.strftime('%Y-%m-%d'),
+                 'AHI': round(float(rng.gamma(2, 6)), 1),
+                 'ESS': int(rng.randint(0, 24)),
+                 'recording': label})
+  pd.DataFrame(rows).to_excel(path, index=False)
+
+# endregion: Writers
+
+# region: Cohort
+
+class SyntheticCohort(object):
+  """Generates a synthetic cohort under `root`. Each night is written in HSP,
+  SHHS and .sg formats (as selected by `formats`)."""
+
+  FORMATS = ('hsp', 'shhs', 'sg', 'medbase')
+
+  def __init__(self, root, n_nights=4, hours=8.0, sfreq=128,
+               hsp_channels=None, shhs_channels=None, seed=0,
+               formats=FORMATS):
+    self.root = root
+    self.n_nights = n_nights
+    self.hours = hours
+    self.sfreq = int(sfreq)
+    self.hsp_channels = HSP_CHANNELS if hsp_channels is None else hsp_channels
+    self.shhs_channels = (SHHS_CHANNELS if shhs_channels is None
+                          else shhs_channels)
+    self.seed = seed
+    self.formats = formats
+
+  # region: Properties
+
+  @property
+  def n_epochs(self): return int(self.hours * 3600 / EPOCH_DURATION)
+
+  @property
+  def config(self) -> dict:
+    return {'n_nights': self.n_nights, 'hours': self.hours,
+            'sfreq': self.sfreq, 'hsp_channels': self.hsp_channels,
+            'shhs_channels': self.shhs_channels, 'seed': self.seed}
+
+  @property
+  def hsp_dir(self): return os.path.join(self.root, 'hsp')
+
+  @property
+  def shhs_dir(self): return os.path.join(self.root, 'shhs')
+
+  @property
+  def sg_dir(self): return os.path.join(self.root, 'sg')
+
+  @property
+  def medbase_dir(self): return os.path.join(self.root, 'medbase')
+
+  @property
+  def sg_labels(self):
+    return [f'sub-S{i + 1:010d}_ses-1' for i in range(self.n_nights)]
+
+  @property
+  def shhs_pids(self): return [str(200001 + i) for i in range(self.n_nights)]
+
+  # endregion: Properties
+
+  # region: Paths
+
+  def get_hsp_paths(self, i):
+    """Return (edf_path, anno_path) of i-th night"""
+    sub_id, ses_id = self.sg_labels[i].split('_')
+    prefix = os.path.join(self.hsp_dir, sub_id, ses_id, 'eeg',
+                          f'{sub_id}_{ses_id}_task-psg')
+    return prefix + '_eeg.edf', prefix + '_annotations.csv'
+
+  def get_shhs_paths(self, i):
+    pid = self.shhs_pids[i]
+    edf_path = os.path.join(
+      self.shhs_dir, f'polysomnography/edfs/shhs1/shhs1-{pid}.edf')
+    anno_path = os.path.join(
+      self.shhs_dir,
+      f'polysomnography/annotations-events-nsrr/shhs1/shhs1-{pid}-nsrr.xml')
+    return edf_path, anno_path
+
+  def get_sg_path(self, i):
+    return os.path.join(
+      self.sg_dir, f'{self.sg_labels[i]}(synthetic,{self.sfreq}Hz).sg')
+
+  @property
+  def medbase_batch_path(self):
+    return os.path.join(self.medbase_dir, 'records.xlsx')
+
+  # endregion: Paths
+
+  # region: Public Methods
+
+  def get_rng(self, i, key) -> np.random.RandomState:
+    """Independent random state of i-th night for `key` (e.g., 'hypnogram'
+    or a format), so that regenerating one format of a night yields the same
+    signals as a fresh run"""
+    text = f'{self.seed}|{i}|{key}'
+    return np.random.RandomState(zlib.crc32(text.encode('utf-8')))
+
+
+  def generate(self, overwrite=False, verbose=True):
+    """Generate files of all nights, existing files are kept unless
+    `overwrite`."""
+    if verbose: console.show_status(
+      f'Generating {self.n_nights} synthetic nights ({self.hours} h, '
+      f'{self.sfreq} Hz) under `{self.root}` ...')
+
+    for i in range(self.n_nights):
+      if verbose: console.print_progress(i, self.n_nights)
+      hypnogram = generate_hypnogram(self.n_epochs,
+                                     self.get_rng(i, 'hypnogram'))
+
+      if 'hsp' in self.formats:
+        edf_path, anno_path = self.get_hsp_paths(i)
+        if overwrite or not os.path.exists(edf_path):
+          os.makedirs(os.path.dirname(edf_path), exist_ok=True)
+          data = generate_psg(hypnogram, self.hsp_channels, self.sfreq,
+                              self.get_rng(i, 'hsp'))
+          write_edf(edf_path, data, self.sfreq, self.hsp_channels)
+          write_hsp_annotation(anno_path, hypnogram)
+
+      if 'shhs' in self.formats:
+        edf_path, anno_path = self.get_shhs_paths(i)
+        if overwrite or not os.path.exists(edf_path):
+          for p in (edf_path, anno_path):
+            os.makedirs(os.path.dirname(p), exist_ok=True)
+          data = generate_psg(hypnogram, self.shhs_channels, self.sfreq,
+                              self.get_rng(i, 'shhs'))
+          write_edf(edf_path, data, self.sfreq, self.shhs_channels)
+          write_shhs_annotation(anno_path, hypnogram)
+
+      if 'sg' in self.formats:
+        from freud.data_io.sidecar import save_sg
+
+        sg_path = self.get_sg_path(i)
+        if overwrite or not os.path.exists(sg_path):
+          os.makedirs(self.sg_dir, exist_ok=True)
+          channels = [f'EEG {ck}' if get_channel_kind(ck) == 'EEG' else ck
+                      for ck in self.hsp_channels]
+          data = generate_psg(hypnogram, channels, self.sfreq,
+                              self.get_rng(i, 'sg'))
+          save_sg(make_signal_group(data, self.sfreq, channels, hypnogram,
+                                    self.sg_labels[i]), sg_path)
+
+    if 'medbase' in self.formats:
+      os.makedirs(self.medbase_dir, exist_ok=True)
+      if overwrite or not os.path.exists(self.medbase_batch_path):
+        try:
+          write_medbase_batch(self.medbase_batch_path, self.sg_labels,
+                              np.random.RandomState(self.seed))
+        except ImportError as e:
+          console.warning(f'MedBase batch not generated: {e}')
+
+    if verbose: console.show_status('Synthetic cohort generated.')
+    return self
+
+  # endregion: Public Methods
+
+# endregion: Cohort
+
+
+
+if __name__ == '__main__':
+  import tempfile
+
+  cohort = SyntheticCohort(tempfile.mkdtemp(), n_nights=2, hours=1)
+  cohort.generate()
+  for root, _, files in os.walk(cohort.root):
+    for fn in files: print(os.path.join(root, fn))
@@ -1,5 +1,7 @@
 from freud.talos_utils.sleep_sets.sleepeason import SleepEason
 
+import os
+
 
 
 # Set directories
@@ -11,23 +13,27 @@ src_folder = ['sleepedfx', 'ucddb', 'rrsh-night',
 src_dir = data_dir + src_folder
 tgt_dir = data_dir + 'sleepeasonx'
 
-# Set src_pattern
+# Set src_pattern, preprocessed derivatives are kept in `derivatives/`
 src_pattern = '*.sg'
 
 file_prefix = src_folder + '-'
 if 'sleepedfx' in src_folder:
-  src_pattern = '*(trim1800;iqr,1,20;128).sg'
+  src_pattern = '*(raw)(128;trim1800;iqr,1,20).ppsg'
 elif 'sleep-cassette' in src_folder:
-  src_pattern = '*(trim1800;iqr,1,20;128).sg'
+  src_pattern = '*(raw)(128;trim1800;iqr,1,20).ppsg'
   file_prefix = 'sleepedfx'
 elif 'ucddb' in src_folder:
-  src_pattern = '*(iqr,1,20;128).sg'
+  src_pattern = '*(raw)(128;iqr,1,20).ppsg'
   file_prefix = ''
 elif 'rrsh' in src_folder:
-  src_pattern = '*(trim;iqr,1,20).sg'
+  src_pattern = '*(max_sf_128)(trim;iqr,1,20).ppsg'
   file_prefix = 'rrsh-'
 
-# src_pattern = '*SC4661*(trim1800;iqr,1,20;128).sg'
+if src_pattern.endswith(SleepEason.PP_EXTENSION):
+  src_dir = os.path.join(src_dir, SleepEason.PP_DIR_NAME)
+
+# src_pattern = '*SC4661*(raw)(128;trim1800;iqr,1,20).ppsg'
 # Convert to signal groups
-SleepEason.convert_to_eason_sg(src_dir, tgt_dir, src_pattern=src_pattern,
-                               file_prefix=file_prefix)
\ No newline at end of file
+if __name__ == '__main__':
+  SleepEason.convert_to_eason_sg(src_dir, tgt_dir, src_pattern=src_pattern,
+                                 file_prefix=file_prefix, n_workers=4)
\ No newline at end of file
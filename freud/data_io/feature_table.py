@@ -0,0 +1,200 @@
+"""Append-only columnar feature tables. Features of all recordings in a study
+(recording x feature) are kept in one `.ftab` file, so that loading a feature
+matrix takes a single read instead of one file per recording.
+
+Table dict keys:
+  labels      list of recording labels (rows)
+  columns     OrderedDict {feature_name: float64 array of shape [N]}, the
+              order of which defines the schema
+  provenance  {label: dict}, e.g., source path or settings used to produce
+              features of each row. If provenance of a row contains
+              'source' and 'source_stat' (see `get_source_stat`), the row
+              is regarded as outdated once its source file is changed.
+
+Rows are never modified in place. Appending re-reads the table under an
+exclusive file lock and replaces it atomically, so that concurrent writers
+(e.g., multiple feature extraction processes) do not lose each other's rows.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from roma import io
+
+import os
+import numpy as np
+
+
+
+def get_source_stat(path):
+  """Return (size, mtime_ns) of file, or None if it does not exist"""
+  try: stat = os.stat(path)
+  except FileNotFoundError: return None
+  return stat.st_size, stat.st_mtime_ns
+
+
+
+@contextmanager
+def file_lock(path):
+  """Exclusive lock on `path`.lock, blocking until acquired"""
+  lock_path = path + '.lock'
+  with open(lock_path, 'a+') as f:
+    if os.name == 'posix':
+      import fcntl
+      fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+      try: yield
+      finally: fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+      import msvcrt
+      f.seek(0)
+      msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+      try: yield
+      finally:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+
+class FeatureTable(object):
+
+  EXTENSION = '.ftab'
+
+  def __init__(self, path):
+    self.path = path
+    self.labels = []
+    self.columns = OrderedDict()
+    self.provenance = {}
+
+    self._row_index = {}
+
+  # region: Properties
+
+  @property
+  def feature_names(self): return list(self.columns.keys())
+
+  # endregion: Properties
+
+  # region: Public Methods
+
+  @classmethod
+  def load(cls, path) -> 'FeatureTable':
+    table = cls(path)
+    table._read()
+    return table
+
+
+  def get_missing_labels(self, labels) -> list:
+    return [lb for lb in labels if lb not in self._row_index]
+
+
+  def get_outdated_labels(self, labels) -> list:
+    """Return labels missing in table, or whose source file (recorded in
+    provenance) has been changed since the row was appended. Rows whose
+    source no longer exists are kept."""
+    outdated = []
+    for lb in labels:
+      if lb not in self._row_index:
+        outdated.append(lb)
+        continue
+      prov = self.provenance.get(lb, {})
+      if 'source_stat' not in prov: continue
+      stat = get_source_stat(prov['source'])
+      if stat is not None and stat != tuple(prov['source_stat']):
+        outdated.append(lb)
+    return outdated
+
+
+  def append(self, rows: OrderedDict, provenance: dict = None, save=True):
+    """Append rows to table.
+
+    :param rows: {label: {feature_name: value}}. Rows with existing labels
+                 replace previous ones.
+    :param provenance: {label: dict}, optional
+    :param save: whether to write table to disk. Table on disk is re-read
+                 under lock before merging so that rows written by other
+                 processes are kept.
+    """
+    if not save:
+      self._merge(rows, provenance)
+      return
+
+    with file_lock(self.path):
+      self._read()
+      self._merge(rows, provenance)
+      self._write()
+
+
+  def get_matrix(self, labels=None, feature_names=None, dtype=np.float64):
+    """Return (features of shape [N, F], feature_names)"""
+    if labels is None: labels = self.labels
+    if feature_names is None: feature_names = self.feature_names
+
+    missing = self.get_missing_labels(labels)
+    if missing: raise KeyError(
+      f'!! {len(missing)} labels not found in `{self.path}`, e.g., '
+      f'{missing[0]}')
+
+    indices = [self._row_index[lb] for lb in labels]
+    matrix = np.stack([self.columns[fn][indices] for fn in feature_names],
+                      axis=1) if feature_names else np.zeros((len(labels), 0))
+    return matrix.astype(dtype), list(feature_names)
+
+  # endregion: Public Methods
+
+  # region: Private Methods
+
+  def _read(self):
+    if not os.path.exists(self.path): return
+    table: dict = io.load_file(self.path)
+    self.labels = table['labels']
+    self.columns = table['columns']
+    self.provenance = table['provenance']
+    self._row_index = {lb: i for i, lb in enumerate(self.labels)}
+
+
+  def _write(self):
+    tmp_path = self.path + '.tmp'
+    io.save_file({'labels': self.labels, 'columns': self.columns,
+                  'provenance': self.provenance}, tmp_path)
+    os.replace(tmp_path, self.path)
+
+
+  def _merge(self, rows: OrderedDict, provenance: dict = None):
+    # (1) Extend rows
+    new_labels = [lb for lb in rows if lb not in self._row_index]
+    N0, N = len(self.labels), len(self.labels) + len(new_labels)
+    for i, lb in enumerate(new_labels): self._row_index[lb] = N0 + i
+    self.labels = self.labels + new_labels
+
+    # (2) Extend columns, missing values are filled with NaN
+    for fn in self.columns:
+      self.columns[fn] = np.concatenate(
+        [self.columns[fn], np.full(N - N0, np.nan)])
+    for row in rows.values():
+      for fn in row:
+        if fn not in self.columns: self.columns[fn] = np.full(N, np.nan)
+
+    # (3) Set values
+    for lb, row in rows.items():
+      i = self._row_index[lb]
+      for fn, value in row.items(): self.columns[fn][i] = value
+      if provenance is not None and lb in provenance:
+        self.provenance[lb] = provenance[lb]
+
+  # endregion: Private Methods
+
+  def __contains__(self, label): return label in self._row_index
+
+  def __len__(self): return len(self.labels)
+
+
+
+if __name__ == '__main__':
+  import tempfile
+
+  path = os.path.join(tempfile.mkdtemp(), 'demo' + FeatureTable.EXTENSION)
+  table = FeatureTable.load(path)
+  table.append(OrderedDict([('sg-1', {'a': 1., 'b': 2.}),
+                            ('sg-2', {'a': 3., 'b': 4.})]))
+  table = FeatureTable.load(path)
+  table.append(OrderedDict([('sg-3', {'a': 5., 'b': 6., 'c': 7.})]),
+               provenance={'sg-3': {'source': 'demo'}})
+  print(FeatureTable.load(path).get_matrix(['sg-3', 'sg-1']))
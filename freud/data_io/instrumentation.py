@@ -0,0 +1,233 @@
+"""Opt-in instrumentation of long-running freud loops. Once enabled (via
+`instrument.enable()` or environment variable `FREUD_PROFILE`), each stage
+and item records wall time, CPU time, bytes read/written and peak RSS of the
+current process. Records are kept in memory and, if a log path is given,
+appended to a JSON-lines file. When disabled, `stage` and `item` are no-ops.
+
+Usage:
+  from freud.data_io.instrumentation import instrument, profiled
+
+  @profiled('hsp.convert')
+  def convert(...):
+    for path in paths:
+      with instrument.item('hsp.convert', path): ...
+
+  instrument.enable('profile.jsonl')
+  convert(...)
+  instrument.summary()
+
+Setting FREUD_PROFILE=1 enables instrumentation without logging to file, any
+other value is used as log path.
+"""
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from roma import console
+
+import os
+import sys
+import time
+
+
+
+# region: Resource Probes
+
+def get_io_bytes():
+  """Return (read_bytes, write_bytes) of current process, or (None, None) if
+  not available on this platform"""
+  try:
+    import psutil
+    counters = psutil.Process().io_counters()
+    return counters.read_bytes, counters.write_bytes
+  except Exception: pass
+
+  try:
+    values = {}
+    with open('/proc/self/io') as f:
+      for line in f:
+        key, value = line.split(':')
+        values[key] = int(value)
+    # rchar/wchar count bytes passed to read/write, including page cache hits
+    return values['rchar'], values['wchar']
+  except Exception: return None, None
+
+
+def get_peak_rss():
+  """Return peak resident set size (bytes) of current process, or None"""
+  try:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+  except ImportError: pass
+
+  try:
+    import psutil
+    info = psutil.Process().memory_info()
+    return getattr(info, 'peak_wset', info.rss)
+  except Exception: return None
+
+
+class Snapshot(object):
+
+  def __init__(self):
+    self.wall = time.perf_counter()
+    self.cpu = time.process_time()
+    self.read_bytes, self.write_bytes = get_io_bytes()
+    self.peak_rss = get_peak_rss()
+
+
+  def diff(self, start: 'Snapshot') -> dict:
+    delta = lambda a, b: None if a is None or b is None else a - b
+    return {'wall': self.wall - start.wall, 'cpu': self.cpu - start.cpu,
+            'read_bytes': delta(self.read_bytes, start.read_bytes),
+            'write_bytes': delta(self.write_bytes, start.write_bytes),
+            'peak_rss': self.peak_rss,
+            'rss_growth': delta(self.peak_rss, start.peak_rss)}
+
+# endregion: Resource Probes
+
+# region: Instrumentation
+
+class Instrumentation(object):
+
+  prompt = '[PROFILE] >>'
+
+  def __init__(self):
+    self.enabled = False
+    self.log_path = None
+    self.records = []
+
+    env = os.environ.get('FREUD_PROFILE', '')
+    if env not in ('', '0'): self.enable(None if env == '1' else env)
+
+  # region: Public Methods
+
+  def enable(self, log_path=None):
+    self.enabled = True
+    self.log_path = log_path
+    if log_path is not None:
+      log_dir = os.path.dirname(os.path.abspath(log_path))
+      if not os.path.exists(log_dir): os.makedirs(log_dir)
+
+
+  def disable(self): self.enabled = False
+
+
+  def reset(self): self.records = []
+
+
+  def stage(self, name, **info):
+    if not self.enabled: return nullcontext()
+    return self._measure('stage', name, None, info)
+
+
+  def item(self, stage, label, **info):
+    if not self.enabled: return nullcontext()
+    return self._measure('item', stage, str(label), info)
+
+
+  def summary(self, top=10):
+    """Print slowest stages and items"""
+    stages = [r for r in self.records if r['type'] == 'stage']
+    items = [r for r in self.records if r['type'] == 'item']
+    if not self.records:
+      console.show_status('No records.', prompt=self.prompt)
+      return
+
+    # (1) Stages aggregated by name
+    agg = {}
+    for r in stages:
+      a = agg.setdefault(r['stage'], {'n': 0, 'wall': 0., 'cpu': 0.,
+                                      'peak_rss': 0})
+      a['n'] += 1
+      a['wall'] += r['wall']
+      a['cpu'] += r['cpu']
+      a['peak_rss'] = max(a['peak_rss'], r['peak_rss'] or 0)
+
+    console.show_status(f'Slowest stages (top {top}):', prompt=self.prompt)
+    for name, a in sorted(agg.items(), key=lambda x: -x[1]['wall'])[:top]:
+      console.supplement(
+        f'{name}: {a["wall"]:.2f}s wall, {a["cpu"]:.2f}s cpu, '
+        f'x{a["n"]}, peak RSS {self._format_bytes(a["peak_rss"])}')
+
+    # (2) Items
+    if not items: return
+    console.show_status(f'Slowest items (top {top}):', prompt=self.prompt)
+    for r in sorted(items, key=lambda x: -x['wall'])[:top]:
+      io_str = ''
+      if r['read_bytes'] is not None:
+        io_str = (f', read {self._format_bytes(r["read_bytes"])}, '
+                  f'written {self._format_bytes(r["write_bytes"])}')
+      console.supplement(f'[{r["stage"]}] {r["item"]}: {r["wall"]:.2f}s wall, '
+                         f'{r["cpu"]:.2f}s cpu{io_str}')
+
+  # endregion: Public Methods
+
+  # region: Private Methods
+
+  @contextmanager
+  def _measure(self, record_type, stage, item, info):
+    start = Snapshot()
+    status = 'ok'
+    try: yield
+    except BaseException:
+      status = 'error'
+      raise
+    finally:
+      record = {'type': record_type, 'stage': stage, 'item': item,
+                'status': status, 'time': time.time()}
+      record.update(Snapshot().diff(start))
+      record.update(info)
+      self._emit(record)
+
+
+  def _emit(self, record: dict):
+    import json
+
+    self.records.append(record)
+    if self.log_path is None: return
+    with open(self.log_path, 'a') as f:
+      f.write(json.dumps(record, default=str) + '\n')
+
+
+  @staticmethod
+  def _format_bytes(n):
+    if n is None: return 'N/A'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+      if abs(n) < 1024: return f'{n:.1f}{unit}'
+      n /= 1024
+    return f'{n:.1f}TB'
+
+  # endregion: Private Methods
+
+
+instrument = Instrumentation()
+
+
+def profiled(name=None):
+  """Decorator recording a function call as a stage"""
+  def decorator(func):
+    stage_name = func.__qualname__ if name is None else name
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+      with instrument.stage(stage_name): return func(*args, **kwargs)
+    return wrapper
+  return decorator
+
+# endregion: Instrumentation
+
+
+
+if __name__ == '__main__':
+  import numpy as np
+
+  @profiled('demo')
+  def demo(n):
+    for i in range(n):
+      with instrument.item('demo', f'item-{i}'):
+        np.sort(np.random.rand(10 ** (5 + i % 3)))
+
+  if not instrument.enabled: instrument.enable()
+  demo(6)
+  instrument.summary(top=3)
@@ -0,0 +1,257 @@
+"""Level-of-detail (LOD) utilities for browsing whole-night recordings.
+
+A LODPyramid stores per-channel min/max envelopes of a DigitalSignal at
+several zoom levels. Level k summarizes every `BASE_BIN * FACTOR**k` samples,
+so that a window of any duration can be drawn with a bounded number of
+points. Pyramids are persisted beside the source file (.sg or .edf) with
+extension `.lod`.
+"""
+from pictor.objects.signals.digital_signal import DigitalSignal
+from pictor.objects.signals.signal_group import SignalGroup
+from roma import io, console
+
+import os
+import numpy as np
+
+
+
+class LODPyramid(object):
+
+  BASE_BIN = 8
+  FACTOR = 4
+  MIN_BINS = 1000
+
+  # Key for putting pyramids into sg's pocket
+  POCKET_KEY = 'LODPyramid::pyramids'
+
+  def __init__(self, sfreq, channel_names, off_set=0.):
+    self.sfreq = sfreq
+    self.channel_names = list(channel_names)
+    self.off_set = off_set
+
+    # Number of samples summarized
+    self.length = 0
+    # List of (mins, maxs) of shape [n_bins, C]
+    self.levels = []
+
+    self._remainder = None
+    self._level_0 = []
+
+  # region: Properties
+
+  @property
+  def bin_sizes(self):
+    return [self.BASE_BIN * self.FACTOR ** k for k in range(len(self.levels))]
+
+  # endregion: Properties
+
+  # region: Building
+
+  @classmethod
+  def build(cls, ds: DigitalSignal) -> 'LODPyramid':
+    """Build a pyramid from an in-memory DigitalSignal"""
+    pyramid = cls(ds.sfreq, ds.channels_names, ds.ticks[0])
+    pyramid.update(ds.data)
+    pyramid.finalize()
+    return pyramid
+
+
+  def update(self, chunk: np.ndarray):
+    """Summarize a chunk of shape [L, C]. Chunks can be fed successively so
+    that whole recording is never loaded into memory."""
+    assert not self.levels, '!! Pyramid has been finalized'
+    self.length += len(chunk)
+    if self._remainder is not None:
+      chunk = np.concatenate([self._remainder, chunk], axis=0)
+
+    # Only complete bins are summarized, the rest is left for next chunk
+    n = len(chunk) // self.BASE_BIN * self.BASE_BIN
+    if n > 0: self._level_0.append(self._reduce(chunk[:n], self.BASE_BIN))
+    self._remainder = chunk[n:] if n < len(chunk) else None
+
+
+  def finalize(self):
+    # Summarize the last incomplete bin
+    if self._remainder is not None:
+      self._level_0.append(self._reduce(self._remainder, self.BASE_BIN))
+      self._remainder = None
+
+    mins = np.concatenate([m for m, _ in self._level_0], axis=0)
+    maxs = np.concatenate([m for _, m in self._level_0], axis=0)
+    self._level_0 = []
+    self.levels = [(mins, maxs)]
+
+    # Build coarser levels until the number of bins is small enough
+    while len(self.levels[-1][0]) > self.MIN_BINS:
+      mins, maxs = self.levels[-1]
+      indices = np.arange(0, len(mins), self.FACTOR)
+      self.levels.append((np.minimum.reduceat(mins, indices, axis=0),
+                          np.maximum.reduceat(maxs, indices, axis=0)))
+
+
+  @staticmethod
+  def _reduce(x: np.ndarray, bin_size):
+    indices = np.arange(0, len(x), bin_size)
+    return (np.minimum.reduceat(x, indices, axis=0),
+            np.maximum.reduceat(x, indices, axis=0))
+
+  # endregion: Building
+
+  # region: Querying
+
+  def get_level(self, n_samples: int, max_points: int) -> int:
+    """Return the finest level on which a window of `n_samples` can be
+    drawn with at most `max_points` points (2 points per bin)."""
+    for k, b in enumerate(self.bin_sizes):
+      if n_samples / b <= max_points // 2: return k
+    return len(self.levels) - 1
+
+
+  def get_envelope(self, name, start_time, end_time, max_points):
+    """Return (x, y) in which min and max of each bin are interleaved, so
+    that drawing them as a single line renders the signal envelope."""
+    ci = self.channel_names.index(name)
+    i0 = max(int((start_time - self.off_set) * self.sfreq), 0)
+    i1 = min(int(np.ceil((end_time - self.off_set) * self.sfreq)) + 1,
+             self.length)
+
+    k = self.get_level(i1 - i0, max_points)
+    b = self.bin_sizes[k]
+    mins, maxs = self.levels[k]
+    j0, j1 = i0 // b, min(int(np.ceil(i1 / b)), len(mins))
+
+    ticks = (np.arange(j0, j1) * b + (b - 1) / 2) / self.sfreq + self.off_set
+    x = np.repeat(ticks, 2)
+    y = np.empty(2 * (j1 - j0), dtype=mins.dtype)
+    y[0::2], y[1::2] = mins[j0:j1, ci], maxs[j0:j1, ci]
+    return x, y
+
+
+  def get_overview(self, max_bins=100000, dtype=np.float32) -> DigitalSignal:
+    """Generate a coarse DigitalSignal covering the whole recording. This is
+    for lazily opened recordings whose full-rate data are not in memory."""
+    k = min([k for k, (mins, _) in enumerate(self.levels)
+             if len(mins) <= max_bins] + [len(self.levels) - 1])
+    b = self.bin_sizes[k]
+    mins, maxs = self.levels[k]
+    data = (mins.astype(dtype) + maxs.astype(dtype)) / 2
+    off_set = self.off_set + (b - 1) / 2 / self.sfreq
+    return DigitalSignal(data, sfreq=self.sfreq / b,
+                         channel_names=self.channel_names,
+                         label=','.join(self.channel_names), off_set=off_set)
+
+  # endregion: Querying
+
+  # region: IO
+
+  @staticmethod
+  def get_lod_path(src_path: str) -> str:
+    return os.path.splitext(src_path)[0] + '.lod'
+
+
+  @classmethod
+  def load_or_build_for_sg(cls, sg: SignalGroup, sg_path: str = None,
+                           overwrite=False) -> list:
+    """Get pyramids of each DigitalSignal in sg. If `sg_path` is provided,
+    pyramids will be loaded from (or saved to) the file beside it."""
+    if sg.in_pocket(cls.POCKET_KEY) and not overwrite:
+      return sg.get_from_pocket(cls.POCKET_KEY)
+
+    lod_path = None if sg_path is None else cls.get_lod_path(sg_path)
+    if lod_path is not None and os.path.exists(lod_path) and not overwrite:
+      pyramids = io.load_file(lod_path, verbose=True)
+    else:
+      pyramids = [cls.build(ds) for ds in sg.digital_signals]
+      if lod_path is not None: io.save_file(pyramids, lod_path, verbose=True)
+
+    sg.put_into_pocket(cls.POCKET_KEY, pyramids, exclusive=False)
+    return pyramids
+
+  # endregion: IO
+
+
+
+class EDFWindowReader(object):
+  """Read full-rate data of a time window from an EDF file without loading
+  the whole recording."""
+
+  def __init__(self, edf_path: str, dtype=np.float32):
+    self.edf_path = edf_path
+    self.dtype = dtype
+    self._raw = None
+    self._last_window = (None, None)
+
+  @property
+  def raw(self):
+    import mne.io
+
+    if self._raw is None:
+      self._raw = mne.io.read_raw_edf(self.edf_path, preload=False,
+                                      verbose=False)
+    return self._raw
+
+  @property
+  def sfreq(self): return self.raw.info['sfreq']
+
+  @property
+  def channel_names(self): return self.raw.ch_names
+
+  @property
+  def n_samples(self): return self.raw.n_times
+
+
+  def read_samples(self, start: int, stop: int) -> np.ndarray:
+    """Return data of shape [stop - start, C]"""
+    data = self.raw.get_data(start=start, stop=stop)
+    return np.transpose(data).astype(self.dtype)
+
+
+  def read_window(self, start_time, end_time) -> dict:
+    """Return {name: (ticks, data)} of given window. The last window is
+    cached since all channels are usually requested in a row."""
+    key = (start_time, end_time)
+    if self._last_window[0] == key: return self._last_window[1]
+
+    start = max(int(start_time * self.sfreq), 0)
+    stop = min(int(np.ceil(end_time * self.sfreq)) + 1, self.n_samples)
+    data = self.read_samples(start, stop)
+    ticks = np.arange(start, stop) / self.sfreq
+    od = {name: (ticks, data[:, i])
+          for i, name in enumerate(self.channel_names)}
+
+    self._last_window = (key, od)
+    return od
+
+
+  def build_pyramid(self, chunk_duration=600) -> LODPyramid:
+    """Build pyramid by reading EDF chunk by chunk"""
+    pyramid = LODPyramid(self.sfreq, self.channel_names)
+    chunk_size = int(chunk_duration * self.sfreq)
+    for start in range(0, self.n_samples, chunk_size):
+      console.print_progress(start, self.n_samples)
+      stop = min(start + chunk_size, self.n_samples)
+      pyramid.update(self.read_samples(start, stop))
+    pyramid.finalize()
+    return pyramid
+
+
+
+def open_edf_lazily(edf_path: str, label=None, dtype=np.float32,
+                    overwrite=False) -> SignalGroup:
+  """Open an EDF file without loading full-rate data. The returned sg holds
+  a coarse overview signal, its LOD pyramid and an EDFWindowReader in pocket.
+  """
+  reader = EDFWindowReader(edf_path, dtype=dtype)
+
+  lod_path = LODPyramid.get_lod_path(edf_path)
+  if os.path.exists(lod_path) and not overwrite:
+    pyramid: LODPyramid = io.load_file(lod_path, verbose=True)[0]
+  else:
+    pyramid = reader.build_pyramid()
+    io.save_file([pyramid], lod_path, verbose=True)
+
+  if label is None: label = os.path.basename(edf_path)
+  sg = SignalGroup([pyramid.get_overview(dtype=dtype)], label=label)
+  sg.put_into_pocket(LODPyramid.POCKET_KEY, [pyramid], exclusive=False)
+  sg.put_into_pocket(EDFWindowReader.__name__, reader, exclusive=False)
+  return sg
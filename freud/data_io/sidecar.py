@@ -0,0 +1,201 @@
+"""Annotation-only sidecars of .sg files. Each `xxx.sg` is accompanied by
+`xxx.sgmeta` holding its hypnogram and basic information, so that label
+statistics can be computed without loading signals. A CohortIndex gathers
+sidecars of a directory into one file.
+
+Sidecar dict keys:
+  label, hypnogram (uint8, one AASM stage per 30-s epoch), stage_counts,
+  duration, channels, sfreqs ({channel: sfreq}), sg_mtime
+"""
+from pictor.objects.signals.signal_group import SignalGroup, Annotation
+from roma import io, console
+
+import os
+import numpy as np
+
+
+
+SIDECAR_EXT = '.sgmeta'
+ANNO_KEY_GT_STAGE = 'stage Ground-Truth'
+EPOCH_DURATION = 30.0
+
+# 0: W, 1: N1, 2: N2, 3: N3, 4: REM, 5: unknown
+AASM_LABELS = ['Wake', 'N1', 'N2', 'N3', 'REM', '?']
+UNKNOWN = 5
+
+
+# region: Sidecar
+
+def get_sidecar_path(sg_path: str) -> str:
+  return os.path.splitext(sg_path)[0] + SIDECAR_EXT
+
+
+def get_aasm_id(label: str) -> int:
+  """Map raw stage label to AASM stage ID, see `SleepSet.get_map_dict`"""
+  if 'W' in label: return 0
+  if '1' in label: return 1
+  if '2' in label: return 2
+  if '3' in label or '4' in label: return 3
+  if 'R' in label: return 4
+  return UNKNOWN
+
+
+def get_hypnogram(sg: SignalGroup, anno_key=ANNO_KEY_GT_STAGE) -> np.ndarray:
+  """Return AASM stage IDs of each 30-s epoch as an uint8 array"""
+  if anno_key not in sg.annotations: return np.zeros(0, dtype=np.uint8)
+  anno: Annotation = sg.annotations[anno_key]
+
+  id_map = [get_aasm_id(label) for label in anno.labels]
+  n_epochs = [int(round((t2 - t1) / EPOCH_DURATION))
+              for t1, t2 in anno.intervals]
+  stages = [id_map[a] if a is not None and a < len(id_map) else UNKNOWN
+            for a in anno.annotations]
+  return np.repeat(np.array(stages, dtype=np.uint8), n_epochs)
+
+
+def build_sidecar(sg: SignalGroup, sg_path: str = None) -> dict:
+  hypnogram = get_hypnogram(sg)
+  sfreqs = {}
+  for ds in sg.digital_signals:
+    for name in ds.channels_names: sfreqs[name] = ds.sfreq
+
+  return {
+    'label': sg.label,
+    'hypnogram': hypnogram,
+    'stage_counts': np.bincount(hypnogram, minlength=len(AASM_LABELS)),
+    'duration': sg.total_duration,
+    'channels': list(sfreqs.keys()),
+    'sfreqs': sfreqs,
+    'sg_mtime': None if sg_path is None else os.stat(sg_path).st_mtime_ns,
+  }
+
+
+def write_sidecar(sg: SignalGroup, sg_path: str) -> dict:
+  sidecar = build_sidecar(sg, sg_path)
+  io.save_file(sidecar, get_sidecar_path(sg_path))
+  return sidecar
+
+
+def save_sg(sg: SignalGroup, sg_path: str, verbose=False):
+  """Save sg file along with its sidecar. All .sg writes should go through
+  this function."""
+  io.save_file(sg, sg_path, verbose=verbose)
+  write_sidecar(sg, sg_path)
+
+
+def load_sidecar(sg_path: str, build_if_missing=True, save=True) -> dict:
+  """Load sidecar of given .sg file. If sidecar is missing or out of date,
+  it will be rebuilt from .sg file (if `build_if_missing`), and written to
+  disk if `save`."""
+  sidecar_path = get_sidecar_path(sg_path)
+  sidecar = None
+  if os.path.exists(sidecar_path):
+    sidecar = io.load_file(sidecar_path)
+    if (os.path.exists(sg_path) and
+        sidecar['sg_mtime'] != os.stat(sg_path).st_mtime_ns): sidecar = None
+
+  if sidecar is None:
+    if not build_if_missing: return None
+    sg = io.load_file(sg_path)
+    sidecar = (write_sidecar(sg, sg_path) if save
+               else build_sidecar(sg, sg_path))
+  return sidecar
+
+# endregion: Sidecar
+
+# region: Cohort Index
+
+class CohortIndex(object):
+  """Sidecars of all .sg files in a directory, saved as `cohort.index`.
+  Index is refreshed incrementally, i.e., only sidecars of new or modified
+  .sg files are (re)loaded."""
+
+  FILE_NAME = 'cohort.index'
+
+  def __init__(self, sg_dir, pattern='*.sg'):
+    self.sg_dir = sg_dir
+    self.pattern = pattern
+    # {sg_file_name: sidecar}
+    self.records = {}
+
+  # region: Properties
+
+  @property
+  def file_names(self): return list(self.records.keys())
+
+  @property
+  def stage_counts(self) -> np.ndarray:
+    """Stage counts of shape [N, 6]"""
+    return np.stack([r['stage_counts'] for r in self.records.values()]) \
+      if self.records else np.zeros((0, len(AASM_LABELS)), dtype=int)
+
+  @property
+  def durations(self) -> np.ndarray:
+    return np.array([r['duration'] for r in self.records.values()])
+
+  # endregion: Properties
+
+  # region: Public Methods
+
+  @classmethod
+  def load(cls, sg_dir, pattern='*.sg', refresh=True, save=True,
+           verbose=True) -> 'CohortIndex':
+    index_path = os.path.join(sg_dir, cls.FILE_NAME)
+    index = None
+    if os.path.exists(index_path):
+      index = io.load_file(index_path)
+      if index.pattern != pattern: index = None
+    if index is None: index = CohortIndex(sg_dir, pattern)
+    index.sg_dir = sg_dir
+
+    if refresh and index.refresh(verbose=verbose, save_sidecars=save) and save:
+      io.save_file(index, index_path)
+    return index
+
+
+  def refresh(self, verbose=True, save_sidecars=True) -> bool:
+    """Sync index with .sg files in directory. Return True if modified.
+    Missing or outdated sidecars are rebuilt, and written to disk only if
+    `save_sidecars`."""
+    from roma.spqr.finder import walk
+
+    file_names = walk(self.sg_dir, 'file', self.pattern, return_basename=True)
+    modified = False
+
+    # Remove records of deleted files
+    for fn in [fn for fn in self.records if fn not in file_names]:
+      self.records.pop(fn)
+      modified = True
+
+    N = len(file_names)
+    for i, fn in enumerate(file_names):
+      sg_path = os.path.join(self.sg_dir, fn)
+      mtime = os.stat(sg_path).st_mtime_ns
+      if fn in self.records and self.records[fn]['sg_mtime'] == mtime: continue
+      if verbose: console.print_progress(i, N)
+      self.records[fn] = load_sidecar(sg_path, save=save_sidecars)
+      modified = True
+
+    # Keep records in the order of file names
+    self.records = {fn: self.records[fn] for fn in file_names}
+
+    if verbose: console.show_status(
+      f'Cohort index of `{self.sg_dir}` contains {len(self.records)} files.')
+    return modified
+
+
+  def get_stage_distribution(self, file_names=None) -> np.ndarray:
+    """Return total epoch number of each AASM stage (W, N1, N2, N3, R, ?)"""
+    if file_names is None: file_names = self.file_names
+    return sum([self.records[fn]['stage_counts'] for fn in file_names],
+               np.zeros(len(AASM_LABELS), dtype=int))
+
+
+  def get_hypnogram(self, file_name) -> np.ndarray:
+    return self.records[file_name]['hypnogram']
+
+  # endregion: Public Methods
+
+  def __len__(self): return len(self.records)
+
+# endregion: Cohort Index
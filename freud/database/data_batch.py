@@ -1,4 +1,5 @@
 from collections import OrderedDict
+from freud.data_io.instrumentation import instrument, profiled
 from freud.database.rule import Rule
 from freud.database.record import Record
 from roma import Nomear, io, console
@@ -52,6 +53,11 @@ class DataBatch(Nomear):
     return []
 
 
+  @property
+  def is_parsed(self) -> bool:
+    return len(self.registered_record_dict) > 0 or len(self.pending_data) > 0
+
+
   @property
   def total_registered_records(self) -> int:
     """Total number of registered records."""
@@ -62,6 +68,7 @@ class DataBatch(Nomear):
 
   # region: Public Methods
 
+  @profiled('db.data_batch.parse')
   def parse(self, rule: Rule, overwrite=False, **kwargs):
     make_up_primary_key = kwargs.get('make_up_primary_key', False)
 
@@ -73,7 +80,7 @@ class DataBatch(Nomear):
       self.registered_record_dict.clear()
       self.pending_data.clear()
     else:
-      if len(self.registered_record_dict) > 0 or len(self.pending_data) > 0:
+      if self.is_parsed:
         console.warning('Data batch already parsed. Use `overwrite=True` to '
                         're-parse the data.')
         return
@@ -3,6 +3,7 @@ from freud.database.data_batch import DataBatch
 from freud.database.record import Record
 from freud.database.rule import Rule
 from freud.database.patient import Patient
+from freud.database.query import QueryIndex, Selector
 from freud.database.structure import DBStructure
 from roma import Nomear, io, console
 
@@ -44,17 +45,30 @@ class MedBase(Nomear):
     return od
 
 
-  @property
+  @Nomear.property(local=True)
   def registered_record_dict(self) -> OrderedDict:
-    """Registered data gathered from all DataBatches."""
+    """Registered data gathered from all DataBatches. This registry is
+    updated incrementally in `register_batch`, it is aggregated here only for
+    databases pickled before the registry was introduced."""
     od = OrderedDict()
     for batch in self.batch_dict.values():
-      for key, records in batch.registered_record_dict.items():
-        if key not in od: od[key] = []
-        od[key].extend(records)
+      self._merge_records(od, batch.registered_record_dict)
     return od
 
 
+  @Nomear.property(local=True)
+  def batch_hash_dict(self) -> OrderedDict:
+    """key: data hash of a DataBatch; value: file name of the DataBatch"""
+    return OrderedDict((batch.data_hash, fn)
+                       for fn, batch in self.batch_dict.items())
+
+
+  @Nomear.property(local=True)
+  def query_index(self) -> QueryIndex:
+    """Per-attribute index for selecting patients, see `export`"""
+    return self._build_query_index()
+
+
   @property
   def pending_data(self) -> list:
     """Pending data gathered from all DataBatches."""
@@ -135,14 +149,15 @@ class MedBase(Nomear):
     batch.med_base = self
 
     # (1) Check if the file already exists in the database
-    for fn, old_batch in self.batch_dict.items():
-      if batch.data_hash == old_batch.data_hash:
-        console.warning(f'`{batch.file_name}` already exists (as `{old_batch.file_name}`).')
-        # (1.1) If it exists, return the existing DataBatch
-        return old_batch
+    if batch.data_hash in self.batch_hash_dict:
+      old_batch = self.batch_dict[self.batch_hash_dict[batch.data_hash]]
+      console.warning(f'`{batch.file_name}` already exists (as `{old_batch.file_name}`).')
+      # (1.1) If it exists, return the existing DataBatch
+      return old_batch
 
     # (1.2) If it does not exist, add it to the database
     self.batch_dict[batch.file_name] = batch
+    self.batch_hash_dict[batch.data_hash] = batch.file_name
     if verbose: self.show_status(
       f'Added `{batch.file_name}` '
       f'({batch.raw_data.shape[0]} rows) to data dict.')
@@ -164,9 +179,28 @@ class MedBase(Nomear):
     """Register a DataBatch to the database"""
     if verbose: self.show_status(f'Registering batch `{batch.file_name}` ...')
 
+    # (0) Make sure registry and patient dict are built before parsing, so
+    #     that records from this batch will be merged exactly once
+    registry, patient_dict = self.registered_record_dict, self.patient_dict
+    if batch.is_parsed:
+      console.warning(f'`{batch.file_name}` has already been registered.')
+      return
+
     # (1) Parse the batch
     batch.parse(rule=self.rule, overwrite=False)
 
+    # (2) Merge new records into registry and patient dict
+    self._merge_records(registry, batch.registered_record_dict)
+    for key, record_list in batch.registered_record_dict.items():
+      if key not in patient_dict:
+        patient_dict[key] = Patient(key, med_base=self)
+      patient_dict[key].records.extend(record_list)
+
+    # (3) Index new records
+    index = self._get_valid_query_index()
+    for key, record_list in batch.registered_record_dict.items():
+      index.add_records(key, record_list)
+
   # endregion: Data Processing
 
   # region: Queries
@@ -256,29 +290,48 @@ class MedBase(Nomear):
       self.show_status(f'Exported data saved to `{save_path}`.')
 
 
+  def select(self, selector='*') -> list:
+    """Select primary keys of patients satisfying the given selector, e.g.,
+    'gender == female; age >= 40; date in 2023-01-01..2023-12-31; has lab'.
+    See `freud.database.query.Clause` for details.
+    """
+    selector = Selector(selector, self.structure)
+    return selector.select(self._get_valid_query_index(),
+                           self.patient_dict.keys())
+
+
   def export(self, selector='*', groups=('root',),
              merge_radius=0, save_to_file=False, mask=True,
-             include_internal_key=False):
+             include_internal_key=False, columns=None):
     """Export a dataframe from the database.
 
-    :param selector:
+    :param selector: Selector string, clauses are separated by `;`, e.g.,
+           'gender == female; age >= 40; date in 2023-01-01..; has lab'.
+           Clauses on shared attributes (e.g., date) also filter records.
     :param groups:
     :param merge_radius: Radius (in days) for merging related records.
     :param save_to_file: If True, save the exported data to a file.
     :param mask: If True, mask the data (e.g., remove sensitive information).
+    :param columns: Attributes (of leaf groups) to export. If None, all
+           attributes in `groups` will be exported. Root and shared
+           attributes are always exported.
 
     !! Exceptions:
     (1) Ambiguity caused by large `merge_radius`
     """
-    # (1) Select records to export
-    # TODO: restrict selector to a specific format for now
-    assert selector == '*', 'Currently only `*` selector is supported.'
+    # (1) Select patients to export using the query index
+    selector = Selector(selector, self.structure)
+    keys = selector.select(self._get_valid_query_index(),
+                           self.patient_dict.keys())
+    rec_filter = None if selector.select_all else selector.filter_record
+    if columns is not None: columns = set(columns)
 
     # (2) Initialize a list of row dict, each row dict shares the same keys
     row_dict_list = []
 
     # For each patient:
-    for pid, patient in self.patient_dict.items():
+    for pid in keys:
+      patient = self.patient_dict[pid]
       # record_list contains all records of the same patient with 'pid'
 
       # (2.1) Get patient info from root group
@@ -289,21 +342,25 @@ class MedBase(Nomear):
       # (2.2) Initialize candidate group dict:
       #       {'group_1': [rec_dict_1_1, rec_dict_1_2, ...],
       #        'group_2': [rec_dict_2_1]}
-      dict_of_rec_lists: OrderedDict = patient.get_dict_of_rec_lists(groups)
+      dict_of_rec_lists: OrderedDict = patient.get_dict_of_rec_lists(
+        groups, attributes=columns, rec_filter=rec_filter)
 
       # (2.3) Iteratively scan and reduce dict_of_rec_lists until all records
       #       are merged
       if len(dict_of_rec_lists) == 0:
+        # Skip patients whose records are all filtered out by the selector
+        if rec_filter is not None and 'root' not in groups: continue
+
         # Handle situation that only root group is required to be exported
         assert 'root' in groups
-        row_dict = self.structure.gen_empty_row_dict(groups)
+        row_dict = self.structure.gen_empty_row_dict(groups, columns)
         row_dict.update(patient_info)
         row_dict_list.append(row_dict)
         continue
 
       while len(dict_of_rec_lists) > 0:
         # (2.3.1) Initialize an empty row dict for the current record
-        row_dict = self.structure.gen_empty_row_dict(groups)
+        row_dict = self.structure.gen_empty_row_dict(groups, columns)
 
         # (2.3.2) Update row_dict with patient info if required
         if 'root' in groups: row_dict.update(patient_info)
@@ -381,6 +438,28 @@ class MedBase(Nomear):
 
   # region: Private Methods
 
+  def _build_query_index(self) -> QueryIndex:
+    index = QueryIndex(self.structure)
+    for key, record_list in self.registered_record_dict.items():
+      index.add_records(key, record_list)
+    return index
+
+
+  def _get_valid_query_index(self) -> QueryIndex:
+    """Rebuild query index if database structure has been changed"""
+    if not self.query_index.is_valid(self.structure):
+      self.put_into_pocket('query_index', self._build_query_index(),
+                           exclusive=False, local=True)
+    return self.query_index
+
+
+  @staticmethod
+  def _merge_records(registry: OrderedDict, record_dict: OrderedDict):
+    for key, records in record_dict.items():
+      if key not in registry: registry[key] = []
+      registry[key].extend(records)
+
+
   def show_status(self, text): console.show_status(text, prompt=self.prompt)
 
   # endregion: Private Methods
@@ -34,7 +34,7 @@ class Patient(Nomear):
 
     # Scan through records and fill the root_dict
     for record in self.records:
-      root_group = record.group_dict.get('root', None)
+      root_group = record.get_group_dict(('root',)).get('root', None)
       if root_group is None: continue
       for key in od.keys():
         if od[key] is None: od[key] = root_group[key]
@@ -50,9 +50,12 @@ class Patient(Nomear):
     return f'Patient ({self.primary_key}, {self.n_records} records)'
 
 
-  def get_dict_of_rec_lists(self, groups: list):
+  def get_dict_of_rec_lists(self, groups: list, attributes=None,
+                            rec_filter=None):
     """Get a dictionary of records grouped by specified groups.
-    Only leaf groups are considered.
+    Only leaf groups are considered. If `attributes` is provided, only these
+    attributes will be extracted. If `rec_filter` is provided, records
+    (as dicts) for which `rec_filter` returns False will be dropped.
     """
     leaf_groups = [g.name for g in self.med_base.structure.leaf_groups]
 
@@ -61,11 +64,13 @@ class Patient(Nomear):
 
     # Scan through records and fill the dictionary
     for record in self.records:
-      rec_grp_dict = record.group_dict
+      rec_grp_dict = record.get_group_dict(groups, attributes=attributes)
 
       for group_name in groups:
         if group_name not in leaf_groups: continue
         if group_name in rec_grp_dict:
+          if rec_filter is not None and not rec_filter(
+              rec_grp_dict[group_name]): continue
           if group_name not in od: od[group_name] = []
           # TODO: merge same record !!
           od[group_name].append(rec_grp_dict[group_name])
@@ -0,0 +1,257 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date
+from roma import Nomear, io, console
+
+import re
+
+
+
+class Clause(object):
+  """A single predicate in a selector. Supported formats:
+    (1) <attribute> <op> <value>, op in (==, !=, >=, <=, >, <)
+        e.g., `gender == female`, `age >= 40`
+    (2) <attribute> in <low>..<high>, bounds are inclusive and can be omitted
+        e.g., `date in 2023-01-01..2023-12-31`, `age in ..18`
+    (3) has <group>
+        e.g., `has lab`
+  """
+
+  OPERATORS = ('==', '!=', '>=', '<=', '>', '<')
+
+  def __init__(self, text: str, structure):
+    self.text = text.strip()
+    self.attribute = None
+    self.group = None
+    self.op = None
+    self.value = None
+    self.low, self.high = None, None
+
+    self._parse(self.text, structure)
+
+  # region: Properties
+
+  @property
+  def is_group_clause(self) -> bool: return self.group is not None
+
+
+  @property
+  def is_range_clause(self) -> bool: return self.op == 'in'
+
+  # endregion: Properties
+
+  # region: Public Methods
+
+  def match(self, value) -> bool:
+    """Check whether a parsed value satisfies this clause."""
+    assert not self.is_group_clause
+    if value is None: return False
+    try:
+      if self.is_range_clause:
+        if self.low is not None and value < self.low: return False
+        if self.high is not None and value > self.high: return False
+        return True
+      return {'==': lambda: value == self.value,
+              '!=': lambda: value != self.value,
+              '>=': lambda: value >= self.value,
+              '<=': lambda: value <= self.value,
+              '>': lambda: value > self.value,
+              '<': lambda: value < self.value}[self.op]()
+    except TypeError:
+      # Values of incompatible types never match
+      return False
+
+  # endregion: Public Methods
+
+  # region: Private Methods
+
+  def _parse(self, text: str, structure):
+    # (1) Group presence
+    m = re.match(r'^has\s+(\S+)$', text)
+    if m is not None:
+      self.group = m.group(1)
+      if self.group not in [g.name for g in structure.leaf_groups]:
+        raise KeyError(f'!! Unknown group `{self.group}` in `{text}`')
+      return
+
+    # (2) Range
+    m = re.match(r'^(.+?)\s+in\s+(.*?)\.\.(.*?)$', text)
+    if m is not None:
+      self._set_attribute(m.group(1), structure)
+      self.op = 'in'
+      low, high = m.group(2).strip(), m.group(3).strip()
+      if low != '': self.low = self._parse_value(low)
+      if high != '': self.high = self._parse_value(high)
+      return
+
+    # (3) Comparison
+    m = re.match(r'^(.+?)\s*(==|!=|>=|<=|>|<)\s*(.+)$', text)
+    if m is not None:
+      self._set_attribute(m.group(1), structure)
+      self.op = m.group(2)
+      self.value = self._parse_value(m.group(3).strip())
+      return
+
+    raise AssertionError(f'!! Illegal selector clause `{text}`')
+
+
+  def _set_attribute(self, name: str, structure):
+    name = name.strip()
+    col2attribute = structure.col2attribute
+    if name not in col2attribute:
+      raise KeyError(f'!! Unknown attribute `{name}` in `{self.text}`')
+    self.attribute = col2attribute[name]
+
+
+  def _parse_value(self, text: str):
+    value = self.attribute.parse(text)
+    if value is None: raise AssertionError(
+      f'!! Failed to parse `{text}` as `{self.attribute.name}`')
+    return value
+
+  # endregion: Private Methods
+
+  def __repr__(self): return f'Clause({self.text})'
+
+
+
+class Selector(object):
+  """A selector consists of clauses separated by `;`. A patient is selected
+  if each clause is satisfied by at least one of its records. `*` selects all
+  patients.
+
+  Example: 'gender == female; age >= 40; date in 2023-01-01..; has lab'
+  """
+
+  def __init__(self, text: str, structure):
+    self.text = text
+    self.clauses: list[Clause] = []
+    if text.strip() != '*':
+      self.clauses = [Clause(t, structure) for t in text.split(';')
+                      if t.strip() != '']
+
+    shared_names = [a.name for a in structure.shared_group.attributes]
+    self.shared_clauses = [c for c in self.clauses if not c.is_group_clause
+                           and c.attribute.name in shared_names]
+
+
+  @property
+  def select_all(self) -> bool: return len(self.clauses) == 0
+
+
+  def select(self, index: 'QueryIndex', candidates) -> list:
+    """Select primary keys from candidates (keeping their order)."""
+    if self.select_all: return list(candidates)
+
+    # Evaluate clauses with fewer hits first
+    hits = sorted([index.evaluate(c) for c in self.clauses], key=len)
+    selected = set.intersection(*hits)
+    return [key for key in candidates if key in selected]
+
+
+  def filter_record(self, rec_dict: dict) -> bool:
+    """Check whether a leaf group record dict satisfies all clauses on shared
+    attributes, e.g., date ranges."""
+    for c in self.shared_clauses:
+      if c.attribute.name in rec_dict and not c.match(
+          rec_dict[c.attribute.name]): return False
+    return True
+
+
+
+class QueryIndex(Nomear):
+  """Per-attribute indexes of registered records. Keys in `value_dict` are
+  canonical attribute names, each maps values to sets of primary keys.
+  Keys in `group_dict` are group names, each maps to a set of primary keys.
+
+  Index should be updated via `add_records` each time new records are
+  registered, and becomes invalid once the database structure is changed.
+  """
+
+  def __init__(self, structure):
+    self.signature = self.get_signature(structure)
+    self.value_dict = OrderedDict()
+    self.group_dict = OrderedDict()
+
+  # region: Public Methods
+
+  @staticmethod
+  def get_signature(structure) -> tuple:
+    # Pending and dropped attributes are never extracted
+    return tuple((a.name, a.group, a.dtype, tuple(a.alias))
+                 for a in structure.attributes
+                 if a.group not in ('pending', 'dropped'))
+
+
+  def is_valid(self, structure) -> bool:
+    return self.signature == self.get_signature(structure)
+
+
+  def add_records(self, primary_key: str, records: list):
+    for record in records:
+      for group_name, od in record.group_dict.items():
+        if group_name != 'root':
+          if group_name not in self.group_dict:
+            self.group_dict[group_name] = set()
+          self.group_dict[group_name].add(primary_key)
+
+        for name, value in od.items():
+          if value is None: continue
+          if name not in self.value_dict: self.value_dict[name] = {}
+          if value not in self.value_dict[name]:
+            self.value_dict[name][value] = set()
+          self.value_dict[name][value].add(primary_key)
+
+    # Sorted keys should be regenerated
+    self._cloud_pocket.clear()
+
+
+  def evaluate(self, clause: Clause) -> set:
+    """Return a set of primary keys satisfying the given clause."""
+    if clause.is_group_clause:
+      return set(self.group_dict.get(clause.group, ()))
+
+    value_dict: dict = self.value_dict.get(clause.attribute.name, {})
+
+    # Hash lookup for equality
+    if clause.op == '==':
+      return set(value_dict.get(clause.value, ()))
+
+    # Binary search on sorted values for ranges
+    if clause.op != '!=':
+      values = self._get_sorted_values(clause.attribute)
+      if clause.is_range_clause: low, high = clause.low, clause.high
+      elif clause.op in ('>', '>='): low, high = clause.value, None
+      else: low, high = None, clause.value
+      try:
+        i = 0 if low is None else bisect_left(values, low)
+        j = len(values) if high is None else bisect_right(values, high)
+      except TypeError:
+        raise AssertionError(
+          f'!! Bound type does not match `{clause.attribute.name}`')
+      keys = set()
+      for v in values[i:j]:
+        if clause.match(v): keys.update(value_dict[v])
+      return keys
+
+    keys = set()
+    for v, pks in value_dict.items():
+      if clause.match(v): keys.update(pks)
+    return keys
+
+  # endregion: Public Methods
+
+  # region: Private Methods
+
+  def _get_sorted_values(self, attribute) -> list:
+    key = f'sorted_values::{attribute.name}'
+    if not self.in_pocket(key):
+      # Only values matching the attribute type are comparable
+      dtype = {'int': (int, float), 'float': (int, float),
+               'date': (date,)}.get(attribute.dtype, (str,))
+      values = [v for v in self.value_dict.get(attribute.name, {})
+                if isinstance(v, dtype)]
+      self.put_into_pocket(key, sorted(values), exclusive=False)
+    return self.get_from_pocket(key)
+
+  # endregion: Private Methods
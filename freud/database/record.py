@@ -32,12 +32,24 @@ class Record(Nomear):
       'lab': {'date': '2025-07-17', 'orexin': 71}
     }
     """
+    return self.get_group_dict()
+
+
+  def get_group_dict(self, groups=None, attributes=None) -> OrderedDict:
+    """Extract group_dict with column projection. Only groups in `groups` and
+    attributes in `attributes` will be extracted and parsed. Setting either
+    argument to None means no restriction.
+    """
     od = OrderedDict()
+    row_dict = self.row_dict
 
     try:
-      od['root'] = self.structure.root_group.extract(self.row_dict)
+      if groups is None or 'root' in groups:
+        od['root'] = self.structure.root_group.extract(
+          row_dict, attributes=attributes)
       for leaf_group in self.structure.leaf_groups:
-        extracted = leaf_group.extract(self.row_dict)
+        if groups is not None and leaf_group.name not in groups: continue
+        extracted = leaf_group.extract(row_dict, attributes=attributes)
         if extracted is not None: od[leaf_group.name] = extracted
     except Exception as e:
       console.warning(f'Error in extracting group_dict {self.raw_data} '
@@ -14,9 +14,11 @@ class Rule(Nomear):
     return OrderedDict()
 
 
-  @property
+  @Nomear.property(local=True)
   def internal_key_to_primary_key(self) -> OrderedDict:
-    """Map internal keys to primary keys"""
+    """Map internal keys to primary keys. This reverse index is maintained
+    along with `primary_key_dict` by `register`, it is rebuilt here only for
+    rules pickled before the index was introduced."""
     return OrderedDict((v, k) for k, v in self.primary_key_dict.items())
 
 
@@ -36,11 +38,12 @@ class Rule(Nomear):
     internal_key = f'{prefix}{len(self.primary_key_dict) + 1:0{n_digits}}'
 
     # Check if the internal key already exists
-    if internal_key in self.primary_key_dict.values():
+    if internal_key in self.internal_key_to_primary_key:
       raise AssertionError(f'Internal key `{internal_key}` already exists.')
 
-    # Register the primary key with the internal key
+    # Register the primary key with the internal key (in both directions)
     self.primary_key_dict[primary_key] = internal_key
+    self.internal_key_to_primary_key[internal_key] = primary_key
 
     # Return the internal key
     return internal_key
@@ -210,9 +210,11 @@ class DBStructure(Nomear, AttributeContainer, Logger):
     self.dropped_group.report(level=level + 1, prefix='Builtin-')
 
 
-  def gen_empty_row_dict(self, groups: list[str]) -> OrderedDict:
+  def gen_empty_row_dict(self, groups: list[str],
+                         attributes=None) -> OrderedDict:
     """Generate an empty row dictionary with specified groups.
-    This is for exporting data to Excel or other formats.
+    This is for exporting data to Excel or other formats. If `attributes` is
+    provided, only these attributes (and shared attributes) are included.
     """
     leaf_groups = [g.name for g in self.leaf_groups]
     # (1) Share common attributes among leaf groups
@@ -227,7 +229,10 @@ class DBStructure(Nomear, AttributeContainer, Logger):
     # (3) Add specified groups' attributes
     for group_name in groups:
       g: Group = self._get_group(group_name)
-      for attr in g.attributes: od[attr.name] = None
+      for attr in g.attributes:
+        if (attributes is not None and group_name not in ('root', 'shared')
+            and attr.name not in attributes): continue
+        od[attr.name] = None
 
     return od
 
@@ -293,13 +298,16 @@ class Group(Nomear, AttributeContainer):
     sup(f'{prefix}Group `{self.name}`: {len(self.attributes)} attributes')
 
 
-  def extract(self, row_dict: dict) -> OrderedDict:
+  def extract(self, row_dict: dict, attributes=None) -> OrderedDict:
     """Format: <primary_key>, <shared_keys>, <keys from leaves>
     TODO: Note that in MedBase.export, slots for <primary_key> and <shared_keys>
           will be created and the od extracted by this function is well-matched
           to its corresponding <primary_key>.
           Thus it works fine to omit <primary_key> and <shared_keys> here in
           this function.
+
+    If `attributes` is provided, only these attributes of this group will be
+    extracted. <primary_key> and <shared_keys> are always extracted.
     """
     assert self.name not in ('pending', 'shared', 'dropped')
 
@@ -316,6 +324,7 @@ class Group(Nomear, AttributeContainer):
     # (3) Extract self.keys
     flag = False
     for attr in self.attributes:
+      if attributes is not None and attr.name not in attributes: continue
       od[attr.name] = attr.extract(row_dict)
       flag = flag or od[attr.name] is not None
 
@@ -75,20 +75,9 @@ class HypnoDataset(Nomear):
 
     # If meta file is provided, then sg_file_list can be automatically generated
     if self.meta_file_name is not None:
-      from roma import finder
       meta_dict = self.load_meta()
       console.show_status(f'Generating sg_file_list from meta ...')
-      file_list = []
-      for i, key in enumerate(meta_dict.keys()):
-        console.print_progress(i, len(meta_dict))
-        result_list = finder.walk(self.signal_group_dir, pattern=f'{key}*.sg')
-        if len(result_list) != 1:
-          err_msg = f'Expected one file for key `{key}`, found {len(result_list)}'
-          if self.skip_invalid_sg:
-            console.warning(err_msg)
-            continue
-          raise AssertionError(err_msg)
-        file_list.append(result_list[0])
+      file_list = self.resolve_sg_files(list(meta_dict.keys()))
 
       console.show_status(f'Loaded sg_file_list (N={len(file_list)}) from meta file.')
       self.sg_file_list = file_list
@@ -149,6 +138,111 @@ class HypnoDataset(Nomear):
     return io.load_file(meta_path, verbose=True)
 
 
+  # region: SG File Index
+
+  SG_INDEX_FILE_NAME = '.sg_index'
+
+  def _scan_sg_dir(self):
+    """Walk signal group directory once, return (index, dir_mtimes), where
+    index = {sg_label: [relative_path, ...]}"""
+    from freud.talos_utils.slp_set import SleepSet
+
+    index, dir_mtimes = {}, {}
+    sg_dir = self.signal_group_dir
+    stack = ['']
+    while stack:
+      rel_dir = stack.pop()
+      abs_dir = os.path.join(sg_dir, rel_dir)
+      dir_mtimes[rel_dir] = os.stat(abs_dir).st_mtime
+      with os.scandir(abs_dir) as it:
+        for entry in it:
+          rel_path = os.path.join(rel_dir, entry.name)
+          if entry.is_dir():
+            # Skip preprocessed derivatives
+            if entry.name != SleepSet.PP_DIR_NAME: stack.append(rel_path)
+          elif entry.name.endswith('.sg'):
+            label = entry.name.split('(')[0]
+            index.setdefault(label, []).append(rel_path)
+
+    for paths in index.values(): paths.sort()
+    return index, dir_mtimes
+
+
+  def _is_sg_index_valid(self, dir_mtimes: dict) -> bool:
+    for rel_dir, mtime in dir_mtimes.items():
+      abs_dir = os.path.join(self.signal_group_dir, rel_dir)
+      if not os.path.isdir(abs_dir) or os.stat(abs_dir).st_mtime != mtime:
+        return False
+    return True
+
+
+  def get_sg_index(self) -> dict:
+    """Return {sg_label: [relative_path, ...]} of all .sg files under
+    signal group directory. The index is cached (in pocket and in
+    `.sg_index` under data directory) along with modification time
+    of each scanned directory, and rebuilt once any of them changes."""
+    # PITFALL: cache file should not be put into signal group directory,
+    #          otherwise saving it changes the directory's modification time
+    sg_dir = self.signal_group_dir
+    cache_path = os.path.join(self.data_dir, self.SG_INDEX_FILE_NAME)
+
+    cache = self.get_from_pocket('sg_index', default=None)
+    if cache is None and os.path.exists(cache_path):
+      cache = io.load_file(cache_path)
+    if (cache is not None and cache['sg_dir'] == sg_dir
+        and self._is_sg_index_valid(cache['dir_mtimes'])):
+      self.put_into_pocket('sg_index', cache, exclusive=False)
+      return cache['index']
+
+    console.show_status(f'Scanning `{sg_dir}` ...')
+    index, dir_mtimes = self._scan_sg_dir()
+    cache = {'sg_dir': sg_dir, 'index': index, 'dir_mtimes': dir_mtimes}
+    self.put_into_pocket('sg_index', cache, exclusive=False)
+    try: io.save_file(cache, cache_path)
+    except OSError: console.warning(f'Failed to save sg index `{cache_path}`')
+    return index
+
+
+  def resolve_sg_files(self, keys: list) -> list:
+    """Resolve each key to exactly one .sg file. A key matches files whose
+    label equals the key, or, if no such file exists, files whose name starts
+    with the key. Missing and duplicate keys are reported together, and are
+    skipped if `skip_invalid_sg` is True."""
+    index = self.get_sg_index()
+    sorted_labels = None
+
+    file_list, missing, duplicates = [], [], []
+    for key in keys:
+      paths = index.get(key, None)
+      if paths is None:
+        # Fall back to prefix matching as `finder.walk(pattern=f'{key}*.sg')`
+        import bisect
+
+        if sorted_labels is None: sorted_labels = sorted(index.keys())
+        paths = []
+        i = bisect.bisect_left(sorted_labels, key)
+        while i < len(sorted_labels) and sorted_labels[i].startswith(key):
+          paths.extend(index[sorted_labels[i]])
+          i += 1
+
+      if len(paths) == 0: missing.append(key)
+      elif len(paths) > 1: duplicates.append((key, len(paths)))
+      else: file_list.append(os.path.join(self.signal_group_dir, paths[0]))
+
+    # Report invalid keys in bulk
+    if missing or duplicates:
+      err_msg = (f'{len(missing)} keys have no .sg file, '
+                 f'{len(duplicates)} keys have multiple .sg files')
+      if missing: err_msg += f'. Missing: {missing[:5]}'
+      if duplicates: err_msg += f'. Duplicates (key, count): {duplicates[:5]}'
+      if not self.skip_invalid_sg: raise AssertionError(err_msg)
+      console.warning(err_msg)
+
+    return file_list
+
+  # endregion: SG File Index
+
+
   @staticmethod
   def is_in_linux(): return os.name == 'posix'
 
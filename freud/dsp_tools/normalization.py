@@ -0,0 +1,222 @@
+"""Streaming robust normalization. For data not held in memory (e.g.,
+np.memmap), per-channel quantiles are estimated in one pass with a mergeable
+quantile sketch, data is then rescaled in place chunk by chunk, so that
+normalizing long recordings runs in bounded memory. Quantiles of in-memory
+ndarrays are computed exactly unless sketching is requested (`exact=False`),
+which avoids the full copy made by `np.percentile`."""
+from roma import console
+
+import numpy as np
+
+
+
+class QuantileSketch(object):
+  """A KLL-style quantile sketch for data of shape [L, C], one sketch per
+  channel. Items on level h have weight 2^h. Once a level holds more than `k`
+  items, items are sorted (per channel) and every other one is promoted to
+  the next level. Sketches with the same `k` can be merged.
+
+  Rank error is roughly O(log(n/k) / k) of n. For k = 2048, estimated ranks
+  of quartiles stay within `RANK_ERROR` of exact ranks (see demo below).
+  """
+
+  RANK_ERROR = 1e-3
+
+  def __init__(self, k=2048, seed=None):
+    assert k >= 2, '!! k should be no less than 2'
+    self.k = k
+    self.n = 0
+    self.levels = []
+    # Exact extremes anchor ranks 0 and 1
+    self.min, self.max = None, None
+    self._rng = np.random.default_rng(seed)
+
+  # region: Public Methods
+
+  def update(self, chunk: np.ndarray):
+    """Add a chunk of shape [L, C] (or [L]) into sketch."""
+    chunk = np.asarray(chunk, dtype=np.float64)
+    if chunk.ndim == 1: chunk = chunk[:, None]
+    if len(chunk) == 0: return
+    self.n += len(chunk)
+    self._update_extremes(chunk.min(axis=0), chunk.max(axis=0))
+    self._push(0, chunk)
+    self._compact()
+
+
+  def merge(self, other: 'QuantileSketch'):
+    assert other.k == self.k, '!! Sketches with different k can not be merged'
+    self.n += other.n
+    if other.n > 0: self._update_extremes(other.min, other.max)
+    for h, items in enumerate(other.levels):
+      if items is not None: self._push(h, items)
+    self._compact()
+    return self
+
+
+  def quantile(self, q) -> np.ndarray:
+    """Return quantiles (q in [0, 1]) of shape [len(q), C] (or [C] if q is a
+    scalar)."""
+    assert self.n > 0, '!! Sketch is empty'
+    scalar = np.isscalar(q)
+    q = np.atleast_1d(q)
+
+    values, weights = [], []
+    for h, items in enumerate(self.levels):
+      if items is None: continue
+      values.append(items)
+      weights.append(np.full(len(items), 2 ** h, dtype=np.float64))
+    values, weights = np.concatenate(values), np.concatenate(weights)
+
+    # Sort values of each channel along with their weights
+    indices = np.argsort(values, axis=0)
+    values = np.take_along_axis(values, indices, axis=0)
+    sorted_weights = weights[indices]
+    cum_weights = np.cumsum(sorted_weights, axis=0)
+    total = cum_weights[-1]
+
+    # Each item stands for `weight` consecutive ranks, its value is placed at
+    #  the middle of them. Quantiles are linearly interpolated between items,
+    #  which coincides with `np.percentile` when all weights are 1
+    ranks = (cum_weights - sorted_weights / 2 - 0.5) / np.maximum(
+      total - 1, 1)
+    res = np.empty((len(q), values.shape[1]))
+    for c in range(values.shape[1]):
+      res[:, c] = np.interp(
+        q, np.concatenate([[0.], ranks[:, c], [1.]]),
+        np.concatenate([[self.min[c]], values[:, c], [self.max[c]]]))
+
+    return res[0] if scalar else res
+
+  # endregion: Public Methods
+
+  # region: Private Methods
+
+  def _update_extremes(self, lo, hi):
+    if self.min is None: self.min, self.max = lo, hi
+    else:
+      self.min, self.max = np.minimum(self.min, lo), np.maximum(self.max, hi)
+
+
+  def _push(self, h, items):
+    while len(self.levels) <= h: self.levels.append(None)
+    if self.levels[h] is None: self.levels[h] = items
+    else: self.levels[h] = np.concatenate([self.levels[h], items])
+
+
+  def _compact(self):
+    h = 0
+    while h < len(self.levels):
+      items = self.levels[h]
+      if items is not None and len(items) > self.k:
+        items = np.sort(items, axis=0)
+        # Keep the last item if number of items is odd
+        n = len(items) // 2 * 2
+        self.levels[h] = items[n:] if n < len(items) else None
+        offset = self._rng.integers(2)
+        self._push(h + 1, items[offset:n:2])
+      h += 1
+
+  # endregion: Private Methods
+
+
+
+def iter_chunks(length: int, chunk_size: int):
+  for start in range(0, length, chunk_size):
+    yield start, min(start + chunk_size, length)
+
+
+
+def estimate_quantiles(data: np.ndarray, q, chunk_size=1000000, k=2048,
+                       seed=0, exact=None) -> np.ndarray:
+  """Return per-channel quantiles of data (shape=[L, C]). If `exact` is
+  None, quantiles of in-memory ndarrays are computed exactly via
+  `np.percentile`, others (e.g., np.memmap) are estimated in one pass over
+  chunks using a quantile sketch."""
+  if exact is None:
+    exact = isinstance(data, np.ndarray) and not isinstance(data, np.memmap)
+  if exact: return np.percentile(data, np.asarray(q) * 100, axis=0)
+
+  sketch = QuantileSketch(k=k, seed=seed)
+  for a, b in iter_chunks(len(data), chunk_size): sketch.update(data[a:b])
+  return sketch.quantile(q)
+
+
+
+def copy_to_scratch(data: np.ndarray, chunk_size=1000000) -> np.memmap:
+  """Copy data chunk by chunk into an anonymous scratch memmap, so that
+  it can be modified in place without touching the file backing `data`.
+  Scratch file is deleted once the returned memmap is released."""
+  import tempfile
+
+  scratch = np.memmap(tempfile.TemporaryFile(), dtype=data.dtype,
+                      mode='w+', shape=data.shape)
+  for a, b in iter_chunks(len(data), chunk_size): scratch[a:b] = data[a:b]
+  return scratch
+
+
+
+def robust_normalize_(data: np.ndarray, iqr=1, max_abs_deviation=20,
+                      labels=None, chunk_size=1000000, k=2048, exact=None):
+  """Rescale data (shape=[L, C]) in place so that median of each channel is
+  0 and its IQR equals `iqr`, then clip values out of max deviation. This is
+  the streaming counterpart of `DigitalSignal.preprocess_iqr`.
+
+  Data should be of a floating dtype since it is modified in place. If
+  `exact` is None, quantiles are computed exactly for in-memory ndarrays
+  (see `estimate_quantiles`). Use `copy_to_scratch` to normalize a memmap
+  without writing into its file.
+  """
+  assert np.issubdtype(data.dtype, np.floating), (
+    '!! Data should be floating to be normalized in place')
+
+  # (1) Estimate median and IQR in one pass
+  q25, median, q75 = estimate_quantiles(
+    data, [0.25, 0.5, 0.75], chunk_size=chunk_size, k=k, exact=exact)
+  current_iqr = q75 - q25
+
+  # Handle 0 iqr issue
+  zero_mask = current_iqr == 0
+  if any(zero_mask):
+    C = data.shape[1]
+    if labels is None: labels = [f'Channel-{i+1}' for i in range(C)]
+    assert len(labels) == C
+    current_iqr[zero_mask] = 1.
+    mask_labels = [l for m, l in zip(zero_mask, labels) if m]
+    console.warning(
+      f'Failed to rescale {",".join(mask_labels)} since IQR is 0.')
+
+  # (2) Rescale and clip chunk by chunk
+  scale = (iqr / current_iqr).astype(data.dtype)
+  median = median.astype(data.dtype)
+  M = None
+  if max_abs_deviation is not None and max_abs_deviation > 0:
+    M = max_abs_deviation * iqr
+
+  for a, b in iter_chunks(len(data), chunk_size):
+    chunk = data[a:b]
+    chunk -= median
+    chunk *= scale
+    if M is not None: np.clip(chunk, -M, M, out=chunk)
+
+  return data
+
+
+
+if __name__ == '__main__':
+  # Check that ranks of sketch estimates agree with exact ranks
+  x = np.random.randn(8 * 3600 * 128, 3)
+  x[:, 1] = x[:, 1] ** 3 + 2
+  q = np.array([0.0001, 0.01, 0.25, 0.5, 0.75, 0.99, 0.9999])
+  exact = estimate_quantiles(x, q)
+  approx = estimate_quantiles(x, q, exact=False)
+
+  sorted_x = np.sort(x, axis=0)
+  for c in range(x.shape[1]):
+    ranks = np.searchsorted(sorted_x[:, c], approx[:, c]) / (len(x) - 1)
+    err = np.max(np.abs(ranks - q))
+    print(f'Channel {c + 1}: max rank error = {err:.2e}')
+    assert err <= QuantileSketch.RANK_ERROR, '!! Rank error out of bound'
+
+  print('Exact:\n', exact)
+  print('Sketch:\n', approx)
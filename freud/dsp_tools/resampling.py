@@ -0,0 +1,103 @@
+"""Polyphase resampling for multi-channel recordings. Arbitrary rational rate
+changes are supported, all channels are filtered in one batched call, and long
+recordings are processed in overlapping chunks so that memory is bounded."""
+from fractions import Fraction
+from roma import console
+
+import time
+import numpy as np
+
+
+
+def get_up_down(fs_in: float, fs_out: float, max_denominator=1000):
+  """Return (up, down) so that fs_out / fs_in ~= up / down"""
+  ratio = Fraction(fs_out / fs_in).limit_denominator(max_denominator)
+  return ratio.numerator, ratio.denominator
+
+
+
+def resample_poly_chunked(data: np.ndarray, fs_in: float, fs_out: float,
+                          chunk_size=None, dtype=None):
+  """Resample data of shape [L, C] from `fs_in` to `fs_out`.
+
+  Each chunk is extended by a margin no shorter than half of the anti-aliasing
+  filter on both sides, so that the result is identical to resampling the
+  whole recording in one call.
+
+  :param chunk_size: number of input samples processed per call, 1 hour by
+                     default. If None or >= L, data is resampled in one call.
+  :return: resampled data of shape [ceil(L * up / down), C]
+  """
+  from scipy.signal import resample_poly
+
+  if dtype is None: dtype = data.dtype
+  up, down = get_up_down(fs_in, fs_out)
+  if up == down: return data.astype(dtype)
+
+  L = len(data)
+  n_out = -(-L * up // down)
+  if chunk_size is None: chunk_size = int(3600 * fs_in)
+
+  # Chunk boundaries and margins are aligned to multiples of `down`, so that
+  #  each chunk starts exactly at an output sample
+  chunk_size = max(int(chunk_size) // down, 1) * down
+  if chunk_size >= L: return resample_poly(data, up, down, axis=0).astype(dtype)
+
+  # Half length of filter used by resample_poly (in upsampled domain)
+  half_len = 10 * max(up, down)
+  margin = -(-(half_len // up + 2) // down) * down
+
+  output = np.empty((n_out,) + data.shape[1:], dtype=dtype)
+  for start in range(0, L, chunk_size):
+    end = min(start + chunk_size, L)
+    a, b = max(start - margin, 0), min(end + margin, L)
+    y = resample_poly(data[a:b], up, down, axis=0)
+
+    i0 = start * up // down
+    i1 = n_out if end == L else end * up // down
+    offset = (start - a) * up // down
+    output[i0:i1] = y[offset:offset + i1 - i0]
+
+  return output
+
+
+
+def resample_digital_signal(ds, fs, chunk_duration=3600, verbose=True):
+  """Resample all channels of a DigitalSignal to `fs`. Throughput (input
+  samples per second, all channels counted) is reported if `verbose`."""
+  from pictor.objects.signals.digital_signal import DigitalSignal
+
+  tic = time.time()
+  data = resample_poly_chunked(ds.data, ds.sfreq, fs,
+                               chunk_size=int(chunk_duration * ds.sfreq))
+  elapsed = max(time.time() - tic, 1e-6)
+
+  if verbose:
+    n_samples = ds.data.size
+    console.show_status(
+      f'Resampled `{ds.label}` ({ds.sfreq}Hz -> {fs}Hz, {ds.num_channels} '
+      f'channels) at {n_samples / elapsed:.2e} samples/sec')
+
+  return DigitalSignal(data, fs, channel_names=ds.channels_names,
+                       label=ds.label, off_set=ds.ticks[0])
+
+
+
+if __name__ == '__main__':
+  # Check consistency and throughput against one-call resampling
+  from scipy.signal import resample_poly
+
+  for fs_in, fs_out in [(100, 128), (64, 128), (256, 100), (200, 128)]:
+    x = np.random.randn(int(2 * 3600 * fs_in), 4).astype(np.float32)
+
+    tic = time.time()
+    y1 = resample_poly(x, *get_up_down(fs_in, fs_out), axis=0)
+    t1 = time.time() - tic
+
+    tic = time.time()
+    y2 = resample_poly_chunked(x, fs_in, fs_out, chunk_size=600 * fs_in)
+    t2 = time.time() - tic
+
+    assert y1.shape == y2.shape and np.allclose(y1, y2, atol=1e-5)
+    print(f'{fs_in}Hz -> {fs_out}Hz: one call {x.size / t1:.2e} samples/sec, '
+          f'chunked {x.size / t2:.2e} samples/sec')
@@ -0,0 +1,107 @@
+"""Spectral utilities shared by data explorers and talos utilities."""
+import numpy as np
+
+
+
+def welch_psd(epochs: np.ndarray, fs: float, nperseg=None, nfft=None):
+  """Batched Welch PSD estimation over stacked epochs.
+
+  :param epochs: array of shape [..., L], e.g., [n_epochs, n_samples]
+  :param fs: sampling frequency
+  :param nperseg: segment length, 2 seconds by default
+  :param nfft: FFT length, determines the frequency resolution fs/nfft
+  :return: freqs of shape [F], psd of shape [..., F]
+  """
+  from scipy import signal
+
+  if nperseg is None: nperseg = int(2 * fs)
+  nperseg = int(min(nperseg, epochs.shape[-1]))
+  if nfft is not None: nfft = max(int(nfft), nperseg)
+
+  # Segments of all epochs are transformed in one call
+  return signal.welch(epochs, fs, nperseg=nperseg, nfft=nfft, axis=-1)
+
+
+
+def slice_band(freqs: np.ndarray, psd: np.ndarray, f_min=None, f_max=None):
+  """Truncate psd to range [f_min, f_max] along the last axis."""
+  mask = np.ones_like(freqs, dtype=bool)
+  if f_min is not None: mask &= freqs >= f_min
+  if f_max is not None: mask &= freqs <= f_max
+  return freqs[mask], psd[..., mask]
+
+
+
+def welch_spectrogram(x: np.ndarray, fs: float, window_size: int,
+                      overlap: int, nperseg=None):
+  """Calculate spectrogram using Welch's method. Sliding windows are
+  generated as a strided view of `x`, segments of all windows are then
+  transformed in one batched FFT and averaged within each window.
+
+  :param x: input signal of shape [L]
+  :param fs: sampling frequency
+  :param window_size: size of sliding window
+  :param overlap: overlap between windows
+  :param nperseg: segment length for Welch's method (default: window_size//8)
+  :return: frequencies of shape [F], times (window centers) of shape [W],
+           spectrogram of shape [F, W]
+  """
+  from numpy.lib.stride_tricks import sliding_window_view
+
+  window_size, overlap = int(window_size), int(overlap)
+  if nperseg is None: nperseg = window_size // 8
+  step = window_size - overlap
+  assert 0 < step and window_size <= len(x), '!! Illegal window settings'
+
+  # Strided view of shape [W, window_size], no data is copied
+  windows = sliding_window_view(x, window_size)[::step]
+
+  frequencies, psd = welch_psd(windows, fs, nperseg=nperseg)
+  times = (np.arange(len(windows)) * step + window_size / 2) / fs
+
+  return frequencies, times, psd.T
+
+
+
+def _welch_spectrogram_loop(x, fs, window_size, overlap, nperseg=None):
+  """Reference implementation calling `signal.welch` for each window."""
+  from scipy import signal
+
+  if nperseg is None: nperseg = window_size // 8
+  step = window_size - overlap
+  num_windows = (len(x) - window_size) // step + 1
+  frequencies, _ = signal.welch(x[:window_size], fs, nperseg=nperseg)
+  times = (np.arange(num_windows) * step + window_size / 2) / fs
+
+  spectrogram = np.zeros((len(frequencies), num_windows))
+  for i in range(num_windows):
+    start = i * step
+    segment = x[start:start + window_size]
+    frequencies, psd = signal.welch(segment, fs, nperseg=nperseg)
+    spectrogram[:, i] = psd
+
+  return frequencies, times, spectrogram
+
+
+
+if __name__ == '__main__':
+  # Micro-benchmark: vectorized vs. loop implementation of welch_spectrogram
+  import timeit
+
+  fs, n_repeats = 128, 20
+  x = np.random.randn(30 * fs)
+
+  for window_size, overlap, nperseg in [(512, 384, 256), (256, 128, 64),
+                                        (256, 240, 128)]:
+    args = (x, fs, window_size, overlap, nperseg)
+    f1, t1, s1 = _welch_spectrogram_loop(*args)
+    f2, t2, s2 = welch_spectrogram(*args)
+    assert np.allclose(f1, f2) and np.allclose(t1, t2) and np.allclose(s1, s2)
+
+    t_loop = timeit.timeit(lambda: _welch_spectrogram_loop(*args),
+                           number=n_repeats) / n_repeats
+    t_vec = timeit.timeit(lambda: welch_spectrogram(*args),
+                          number=n_repeats) / n_repeats
+    print(f'window={window_size}, overlap={overlap}, nperseg={nperseg}, '
+          f'#windows={s1.shape[1]}: loop {t_loop * 1000:.2f} ms, '
+          f'vectorized {t_vec * 1000:.2f} ms ({t_loop / t_vec:.1f}x)')
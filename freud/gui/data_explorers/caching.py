@@ -0,0 +1,115 @@
+"""Caching utilities for data explorers. Rendering data is cached in bounded
+LRU caches and can be precomputed by a background worker while the user is
+browsing.
+"""
+from collections import OrderedDict
+from roma import console
+
+import threading
+
+
+
+class LRUCache(object):
+  """A thread-safe cache holding at most `capacity` items. The least recently
+  used item is discarded when the cache is full."""
+
+  def __init__(self, capacity=256):
+    assert capacity > 0, '!! Capacity should be positive'
+    self.capacity = capacity
+    self._od = OrderedDict()
+    self._lock = threading.Lock()
+    # Events of items being initialized
+    self._pending = {}
+
+
+  def __contains__(self, key):
+    with self._lock: return key in self._od
+
+
+  def __len__(self): return len(self._od)
+
+
+  def get(self, key, initializer=None, default=None):
+    """Get item by key. If key is not found and `initializer` is provided,
+    the item will be created by `initializer()` and put into cache. If the
+    same item is being initialized in another thread, this method will wait
+    for it instead of initializing it again."""
+    with self._lock:
+      if key in self._od:
+        self._od.move_to_end(key)
+        return self._od[key]
+
+      if initializer is None: return default
+
+      event = self._pending.get(key, None)
+      if event is None: self._pending[key] = threading.Event()
+
+    if event is not None:
+      event.wait()
+      return self.get(key, initializer, default)
+
+    # Initializer is called outside the lock so that other threads will not
+    #  be blocked
+    try:
+      value = initializer()
+      self.put(key, value)
+    finally:
+      with self._lock: self._pending.pop(key).set()
+    return value
+
+
+  def put(self, key, value):
+    with self._lock:
+      self._od[key] = value
+      self._od.move_to_end(key)
+      while len(self._od) > self.capacity: self._od.popitem(last=False)
+
+
+  def clear(self):
+    with self._lock: self._od.clear()
+
+
+
+class BackgroundWorker(object):
+  """A daemon thread executing submitted jobs in FIFO order. Jobs with the
+  same key are submitted only once until executed. Pending jobs can be
+  discarded by calling `clear`, e.g., when the cursor has been moved."""
+
+  def __init__(self, name='BackgroundWorker'):
+    self.name = name
+    self._jobs = OrderedDict()
+    self._condition = threading.Condition()
+    self._thread = None
+
+
+  @property
+  def n_pending(self): return len(self._jobs)
+
+
+  def submit(self, key, func):
+    with self._condition:
+      if key in self._jobs: return
+      self._jobs[key] = func
+      self._condition.notify()
+
+    # Start thread lazily
+    if self._thread is None:
+      self._thread = threading.Thread(target=self._run, name=self.name,
+                                      daemon=True)
+      self._thread.start()
+
+
+  def clear(self):
+    with self._condition: self._jobs.clear()
+
+
+  def _run(self):
+    while True:
+      with self._condition:
+        while len(self._jobs) == 0: self._condition.wait()
+        key, func = self._jobs.popitem(last=False)
+
+      try:
+        func()
+      except Exception as e:
+        console.warning(f'[{self.name}] Failed to execute job `{key}`: {e}')
@@ -1,6 +1,9 @@
 """Timestamp: 2025-08-05
 """
+from .caching import LRUCache, BackgroundWorker
 from .explorer_base import ExplorerBase
+from freud.dsp_tools.kernels import butter_filt, moving_average, running_max_min
+from freud.dsp_tools.spectral import welch_spectrogram
 from pictor import Pictor
 from pictor.plotters.plotter_base import Plotter
 from pictor.objects.signals.signal_group import SignalGroup, Annotation
@@ -136,6 +139,8 @@ class EpochExplorer(ExplorerBase):
   @staticmethod
   def explore(signal_groups, title='EpochExplorer', figure_size=(10, 6),
               add_layer_2=False, plotter_cls=None, dont_show=False, **kwargs):
+    """`signal_groups` can be a list of SignalGroups or paths to .sg files.
+    Paths will be loaded on demand."""
     if plotter_cls is None: plotter_cls = RhythmPlotter
     ee = EpochExplorer(title, figure_size, add_layer_2=add_layer_2,
                        plotter_class=plotter_cls)
@@ -185,9 +190,16 @@ class RhythmPlotter(Plotter):
 
     self.new_settable_attr('ymax', None, float, 'ymax in Welch plot')
 
+    self.new_settable_attr('prefetch', 2, int,
+                           'Number of neighbouring epochs to precompute')
+
     # Set configs
     self.configs = kwargs
 
+    # Render data are cached and precomputed in background
+    self.render_cache = LRUCache(kwargs.get('cache_size', 512))
+    self.worker = BackgroundWorker(name=self.class_name)
+
   # region: Properties
 
   # endregion: Properties
@@ -205,66 +217,40 @@ class RhythmPlotter(Plotter):
     title = f'[{stage}] {channel_name} {suffix}'
     ax.set_title(title)
 
+    # Precompute render data of neighbouring epochs
+    self.prefetch()
+
   @staticmethod
   def welch_spectrogram(x, fs, window_size, overlap, nperseg=None):
-    """TODO
-    Calculate spectrogram using Welch's method
-
-    Parameters:
-    - x: input signal
-    - fs: sampling frequency
-    - window_size: size of sliding window
-    - overlap: overlap between windows
-    - nperseg: segment length for Welch's method (default: window_size//8)
-    """
-    from scipy import signal
-
-    if nperseg is None:
-      nperseg = window_size // 8
-
-      # Calculate step size
-    step = window_size - overlap
-
-    # Initialize time and frequency arrays
-    num_windows = (len(x) - window_size) // step + 1
-    frequencies, _ = signal.welch(x[:window_size], fs, nperseg=nperseg)
-    times = np.arange(num_windows) * step / fs
+    """Calculate spectrogram using Welch's method, see
+    `freud.dsp_tools.spectral.welch_spectrogram`"""
+    return welch_spectrogram(x, fs, window_size, overlap, nperseg)
 
-    # Initialize spectrogram array
-    spectrogram = np.zeros((len(frequencies), num_windows))
-
-    # Calculate PSD for each window
-    for i in range(num_windows):
-      start = i * step
-      end = start + window_size
-      segment = x[start:end]
-      frequencies, psd = signal.welch(segment, fs, nperseg=nperseg)
-      spectrogram[:, i] = psd
-
-    return frequencies, times, spectrogram
-
-  def _get_spectrum(self, s, ymin=None, ymax=None):
+  def _get_spectrum(self, s, ymin=None, ymax=None, fs=None):
     from scipy.signal import stft
 
+    if fs is None:
+      fs = self.explorer.selected_signal_group.digital_signals[0].sfreq
+
     if self.configs.get('layer', 1) == 2:
       x = self._low_freq_signal(s)
       s = s - x
     elif self.get('filter'):
-      s = self._butter_filt(s)
+      s = self._butter_filt(s, fs=fs)
 
     # Compute the Short Time Fourier Transform (STFT)
-    fs = self.explorer.selected_signal_group.digital_signals[0].sfreq
 
     if self.get('welch'):
-      f, t, Zxx = stft(s, fs=fs, nperseg=256)
-      # TODO
-      # f, t, Zxx = self.welch_spectrogram(
-      #   s, fs, 256, 128, 256)
+      # Each window consists of 3 half-overlapped segments, hop size and
+      #  frequency resolution are the same as STFT below
+      f, t, psd = self.welch_spectrogram(s, fs, 512, 384, 256)
+      # Use amplitude to keep consistent with STFT
+      spectrum = np.sqrt(psd)
     else:
       f, t, Zxx = stft(s, fs=fs, nperseg=256)
 
-    # Plot STFT result
-    spectrum = np.abs((Zxx))
+      # Plot STFT result
+      spectrum = np.abs((Zxx))
 
     # Cut value
     if ymin is None: ymin = self.get('min_freq')
@@ -279,8 +265,9 @@ class RhythmPlotter(Plotter):
 
     return f, t, spectrum
 
-  def _calc_dominate_freq_curve_v1(self, s: np.ndarray, ymin=None, ymax=None):
-    f, secs, spectrum = self._get_spectrum(s, ymin, ymax)
+  def _calc_dominate_freq_curve_v1(self, s: np.ndarray, ymin=None, ymax=None,
+                                   fs=None):
+    f, secs, spectrum = self._get_spectrum(s, ymin, ymax, fs=fs)
     dom_f = np.sum(f[..., np.newaxis] * spectrum, axis=0) / np.sum(
       spectrum, axis=0)
     return f, secs, spectrum, dom_f
@@ -293,7 +280,7 @@ class RhythmPlotter(Plotter):
 
   def _plot_spectrum(self, ax: plt.Axes):
     if self.get('stft'):
-      f, t, spectrum = self._get_spectrum(self.explorer.selected_signal)
+      f, t, spectrum = self.get_render_data('spectrum')
 
       # ax.pcolormesh(t, f, spectrum, vmin=0, shading='gouraud')
       ax.pcolormesh(t, f, spectrum, vmin=0)
@@ -386,15 +373,13 @@ class RhythmPlotter(Plotter):
 
 
   def _low_freq_signal(self, s: np.ndarray):
-    ks = int(self.get('dev_arg'))
-    x = np.convolve(s, [1/ks] * ks, 'same')
-    return x
+    return moving_average(s, int(self.get('dev_arg')))
 
 
-  def _extract_so(self, s: np.ndarray):
+  def _extract_so(self, s: np.ndarray, fs=None):
     from scipy.signal import hilbert
 
-    so = self._butter_filt(s, low_high=(0.4, 1.5))
+    so = self._butter_filt(s, low_high=(0.4, 1.5), fs=fs)
 
     analytic_signal = hilbert(so)
     amplitude_envelope = np.abs(analytic_signal)
@@ -404,28 +389,13 @@ class RhythmPlotter(Plotter):
 
 
   def pooling(self, s, size):
-    # `size` should be an odd integer
-    # assert size - size // 2 * 2 == 1
-    p = (size - 1) // 2
-
-    shifted_signals = [s]
-    for i in range(1, p + 1):
-      # i = 1, 2, ..., p
-      s_l = np.concatenate([[s[0]] * i, s[:-i]])
-      s_r = np.concatenate([s[i:], [s[-1]] * i])
-      shifted_signals.extend([s_l, s_r])
-
-    aligned_signals = np.stack(shifted_signals, axis=-1)
-    upper = np.max(aligned_signals, axis=-1)
-    lower = np.min(aligned_signals, axis=-1)
-
-    return upper, lower
+    # Running max/min over windows of 2p+1 samples, p = (size - 1) // 2
+    return running_max_min(s, size)
 
 
   def _get_summits(self, s: np.ndarray):
     """TODO"""
-    ks = int(self.get('dev_arg'))
-    x = np.convolve(s, [1/ks] * ks, 'same')
+    x = moving_average(s, int(self.get('dev_arg')))
 
     d_x = x[1:] - x[:-1]
     sign_d_x = np.sign(d_x)
@@ -436,11 +406,8 @@ class RhythmPlotter(Plotter):
     return indices
 
 
-  def _butter_filt(self, s: np.ndarray, low_high=None):
+  def _butter_filt(self, s: np.ndarray, low_high=None, fs=None):
     # Filter signal if required
-    from scipy.signal import sosfilt
-    from scipy.signal import butter
-
     if low_high is None:
       filter_args: str = self.get('filter_arg').split(',')
       assert len(filter_args) == 2
@@ -448,11 +415,10 @@ class RhythmPlotter(Plotter):
     else:
       low, high = low_high
 
-    fs = self.explorer.selected_signal_group.digital_signals[0].sfreq
-    sos = butter(10, [low, high], 'bandpass', fs=fs, output='sos')
-    s = sosfilt(sos, s)
-
-    return s
+    if fs is None:
+      fs = self.explorer.selected_signal_group.digital_signals[0].sfreq
+    # Filter design is cached per (fs, band)
+    return butter_filt(s, fs, low, high)
 
 
   def _plot_signal(self, ax: plt.Axes):
@@ -460,10 +426,9 @@ class RhythmPlotter(Plotter):
     t = np.linspace(0, 30, num=len(s))
 
     if self.configs.get('layer', 1) == 2:
-      x = self._low_freq_signal(s)
-      ax.plot(t, s - x)
+      ax.plot(t, self.get_render_data('signal'))
     else:
-      if self.get('filter'): s = self._butter_filt(s)
+      s = self.get_render_data('signal')
 
       # Plot signal
       ax.plot(t, s)
@@ -474,7 +439,7 @@ class RhythmPlotter(Plotter):
         ax.plot(t, x, 'r-')
       elif self.get('so'):
         # Filter signal x to 0.4~1.5 Hz
-        x, phase, envelop = self._extract_so(s)
+        x, phase, envelop = self.get_render_data('so')
 
         ax.plot(t, x, 'r-', label='Slow Oscillation')
         # ax.plot(t, envelop, 'r:', label='Amplitude Envelope')
@@ -503,8 +468,7 @@ class RhythmPlotter(Plotter):
     # (2) Plot frequency estimation
     if self.get('summit'):
       # (2.1)
-      f, secs, spectrum, dom_f = self._calc_dominate_freq_curve_v1(
-        self.explorer.selected_signal)
+      f, secs, spectrum, dom_f = self.get_render_data('dom_freq')
 
       ax2 = ax.twinx()
       ax2.plot(secs, dom_f, 'r:', linewidth=2)
@@ -513,8 +477,7 @@ class RhythmPlotter(Plotter):
       ax2.set_ylim([0, 12])
 
       # (2.2)
-      upper, lower = self.pooling(
-        self.explorer.selected_signal, int(self.get('dev_arg')))
+      upper, lower = self.get_render_data('envelope')
       ax.plot(t, upper, ':', color='gray')
       ax.plot(t, lower, ':', color='green')
 
@@ -597,14 +560,114 @@ class RhythmPlotter(Plotter):
     """m is percentile margin, should be in (0, 50)"""
 
     def _init_percentile():
-      return [np.percentile(sg.digital_signals[0].data, q, axis=0)
-              for q in (m, 100 - m)]
+      # Both percentiles are calculated in one pass
+      return list(np.percentile(sg.digital_signals[0].data, [m, 100 - m],
+                                axis=0))
 
     key = f'percentile_{m}'
     return sg.get_from_pocket(key, initializer=_init_percentile)
 
   # endregion: Processing Methods
 
+  # region: Render Data
+
+  RENDER_SETTINGS = {
+    'signal': ('filter', 'filter_arg', 'dev_arg'),
+    'so': ('filter', 'filter_arg', 'dev_arg'),
+    'envelope': ('dev_arg',),
+    'spectrum': ('filter', 'filter_arg', 'dev_arg', 'welch', 'min_freq',
+                 'max_freq', 'column_norm'),
+    'dom_freq': ('filter', 'filter_arg', 'dev_arg', 'welch', 'min_freq',
+                 'max_freq', 'column_norm'),
+  }
+
+  def _get_render_settings(self, key) -> tuple:
+    if key not in self.RENDER_SETTINGS:
+      raise KeyError(f'!! Unknown render data key `{key}`')
+    return (self.configs.get('layer', 1),) + tuple(
+      self.get(k) for k in self.RENDER_SETTINGS[key])
+
+  def get_render_data(self, key, sg: SignalGroup = None, stage=None,
+                      epoch=None, channel=None):
+    """Get render data of the given epoch (the selected epoch by default)
+    from cache. Supported keys are 'signal', 'so', 'envelope', 'spectrum'
+    and 'dom_freq'.
+    """
+    if sg is None: sg = self.explorer.selected_signal_group
+    if stage is None: stage = self.explorer.selected_stage
+    if epoch is None: epoch = self.explorer.get_element(
+      self.explorer.Keys.EPOCHS)
+    if channel is None: channel = self.explorer.selected_channel_index
+
+    settings = self._get_render_settings(key)
+    cache_key = (key, sg.label, id(sg), stage, epoch, channel) + settings
+    data = self.render_cache.get(cache_key)
+    if data is None:
+      data = self._calc_render_data(key, sg, stage, epoch, channel)
+      # Settings may have been changed during calculation in background
+      if settings == self._get_render_settings(key):
+        self.render_cache.put(cache_key, data)
+    return data
+
+  def _calc_render_data(self, key, sg: SignalGroup, stage, epoch, channel):
+    se = self.explorer.get_sg_stage_epoch_dict(sg)
+    s = se[stage][epoch][:, channel]
+    fs = sg.digital_signals[0].sfreq
+
+    if key == 'signal':
+      if self.configs.get('layer', 1) == 2: return s - self._low_freq_signal(s)
+      if self.get('filter'): return self._butter_filt(s, fs=fs)
+      return s
+    elif key == 'so':
+      s = self.get_render_data('signal', sg, stage, epoch, channel)
+      return self._extract_so(s, fs=fs)
+    elif key == 'envelope': return self.pooling(s, int(self.get('dev_arg')))
+    elif key == 'spectrum': return self._get_spectrum(s, fs=fs)
+    elif key == 'dom_freq':
+      return self._calc_dominate_freq_curve_v1(s, fs=fs)
+
+    raise KeyError(f'!! Unknown render data key `{key}`')
+
+  def _get_visible_render_keys(self) -> list:
+    if not self.get('plot_wave'):
+      return ['spectrum'] if self.get('stft') else []
+
+    keys = ['signal']
+    if self.configs.get('layer', 1) == 2: return keys
+    if not self.get('dev_mode') and self.get('so'): keys.append('so')
+    if self.get('summit'): keys.extend(['dom_freq', 'envelope'])
+    return keys
+
+  def prefetch(self):
+    """Precompute render data of neighbouring epochs in background. Pending
+    jobs for previous cursor positions are discarded."""
+    self.worker.clear()
+    n = self.get('prefetch')
+    if n is None or n <= 0: return
+
+    sg = self.explorer.selected_signal_group
+    stage = self.explorer.selected_stage
+    epoch = self.explorer.get_element(self.explorer.Keys.EPOCHS)
+    channel = self.explorer.selected_channel_index
+    num_epochs = len(self.explorer.get_sg_stage_epoch_dict(sg)[stage])
+
+    # Percentiles are calculated over the whole night
+    m = self.get('pctile_margin')
+    self.worker.submit(('percentile', id(sg), m),
+                       lambda: self.get_sg_pencentiles(sg, m))
+
+    keys = self._get_visible_render_keys()
+    for d in range(1, n + 1):
+      for e in (epoch + d, epoch - d):
+        if not 0 <= e < num_epochs: continue
+        for key in keys:
+          self.worker.submit(
+            (key, id(sg), stage, e, channel),
+            lambda _k=key, _e=e: self.get_render_data(
+              _k, sg, stage, _e, channel))
+
+  # endregion: Render Data
+
 
 
 if __name__ == '__main__':
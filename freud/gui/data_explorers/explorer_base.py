@@ -1,6 +1,8 @@
+from .caching import LRUCache, BackgroundWorker
 from pictor import Pictor
 from pictor.plotters.plotter_base import Plotter
 from pictor.objects.signals.signal_group import SignalGroup, Annotation
+from roma import io
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -20,12 +22,89 @@ class ExplorerBase(Pictor):
     ANNO_KEY_GT_STAGE = 'stage Ground-Truth'
     MAP_DICT = 'Keys::map_dict'
 
+    SG_CACHE = 'Keys::sg_cache'
+    SG_LOADER = 'Keys::sg_loader'
+
+  # Maximum number of signal groups (loaded from paths) kept in memory
+  MAX_CACHED_SIGNAL_GROUPS = 8
+
+  # region: Properties
 
   @property
   def selected_signal_group(self) -> SignalGroup:
     return self.get_element(self.Keys.OBJECTS)
 
 
+  @property
+  def sg_cache(self) -> LRUCache:
+    return self.get_from_pocket(
+      self.Keys.SG_CACHE,
+      initializer=lambda: LRUCache(self.MAX_CACHED_SIGNAL_GROUPS))
+
+
+  @property
+  def sg_loader(self) -> BackgroundWorker:
+    return self.get_from_pocket(
+      self.Keys.SG_LOADER,
+      initializer=lambda: BackgroundWorker(name='SGLoader'))
+
+  # endregion: Properties
+
+  # region: Lazy Objects
+
+  def get_element(self, key):
+    element = super().get_element(key)
+    if key == self.Keys.OBJECTS: element = self.load_object(element)
+    return element
+
+
+  def load_object(self, obj):
+    """Objects can be SignalGroups, paths to .sg files, or lists/tuples of
+    them (e.g., pairs of nights). Paths are loaded on demand and kept in a
+    bounded LRU cache, so that only a few signal groups reside in memory.
+    """
+    if isinstance(obj, str):
+      return self.sg_cache.get(obj, initializer=lambda: self._load_sg(obj))
+    if isinstance(obj, (list, tuple)) and any(
+        isinstance(o, str) for o in obj):
+      return [self.load_object(o) for o in obj]
+    return obj
+
+
+  def set_cursor(self, key: str, step: int = 0, cursor=None,
+                 refresh: bool = False):
+    super().set_cursor(key, step, cursor, refresh)
+    if key == self.Keys.OBJECTS: self.prefetch_objects()
+
+
+  def prefetch_objects(self):
+    """Load the next and previous objects in background"""
+    self.sg_loader.clear()
+
+    objects = self.objects
+    n = len(objects)
+    if n < 2: return
+    i = self.cursors[self.Keys.OBJECTS]
+    for j in sorted({(i + 1) % n, (i - 1) % n}):
+      if not isinstance(objects[j], (str, list, tuple)): continue
+      self.sg_loader.submit(j, lambda o=objects[j]: self._prefetch_object(o))
+
+
+  def _prefetch_object(self, obj):
+    sg_list = self.load_object(obj)
+    if isinstance(sg_list, SignalGroup): sg_list = [sg_list]
+    for sg in sg_list: self.get_sg_stage_epoch_dict(sg)
+
+
+  @staticmethod
+  def _load_sg(path: str) -> SignalGroup:
+    sg = io.load_file(path, verbose=True)
+    assert isinstance(sg, SignalGroup), f'!! `{path}` is not a SignalGroup'
+    return sg
+
+  # endregion: Lazy Objects
+
+
   @classmethod
   def get_map_dict(cls, sg: SignalGroup):
     """This method unifies the stage labels in the annotation to the following
@@ -2,14 +2,16 @@
    exploring the heterogeneity of individuals based on nonREM signal spectra
    across different derivations.
 """
+from freud.dsp_tools.spectral import welch_psd, slice_band
 from freud.gui.data_explorers.explorer_base import ExplorerBase
 from pictor import Pictor
 from pictor.plotters.plotter_base import Plotter
 from pictor.objects.signals.signal_group import SignalGroup, Annotation
-from roma import console
+from roma import console, io
 
 import matplotlib.pyplot as plt
 import numpy as np
+import os
 
 
 
@@ -37,6 +39,8 @@ class SpectraExplorer(ExplorerBase):
   def explore(signal_groups, channels, title='Spectra Explorer',
               figure_size=(10, 6), plotter_cls=None, dont_show=False,
               meta=None, **kwargs):
+    """Each item in `signal_groups` can be a SignalGroup, a path to .sg file,
+    or a list of them. Paths will be loaded on demand."""
     if plotter_cls is None: plotter_cls = SpectraViewer
     se = SpectraExplorer(channels, title, figure_size, plotter_cls=plotter_cls,
                          meta=meta)
@@ -73,6 +77,9 @@ class SpectraViewer(Plotter):
     self.new_settable_attr('log', False, bool,
                            'Whether to use logarithm')
 
+    self.new_settable_attr('cache_dir', '', str,
+                           'Directory for caching spectra, empty to disable')
+
     self.new_settable_attr('dev_arg', '0', str, 'Developer mode argument')
 
     self.new_settable_attr('bool_a', False , bool, 'Boolean A')
@@ -94,10 +101,12 @@ class SpectraViewer(Plotter):
 
   @property
   def signal_groups(self):
-    if isinstance(self.explorer.objects[0], SignalGroup):
-      return self.explorer.objects
+    """Signal groups or paths to .sg files, the latter should be loaded via
+    `self.explorer.load_object`"""
     sg_list = []
-    for sg_group in self.explorer.objects: sg_list.extend(sg_group)
+    for obj in self.explorer.objects:
+      if isinstance(obj, (list, tuple)): sg_list.extend(obj)
+      else: sg_list.append(obj)
     return sg_list
 
   # endregion: Properties
@@ -185,61 +194,129 @@ class SpectraViewer(Plotter):
 
     ax.set_title(title)
 
-  def preload(self):
+  def preload(self, n_workers=1):
+    """Precompute spectra of all signal groups. Set `n_workers` > 1 to
+    compute in parallel across signal groups."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    n_workers = int(n_workers)
     with self.explorer.busy('Preloading ...'):
       N = len(self.signal_groups)
-      for i, sg in enumerate(self.signal_groups):
-        console.print_progress(i, N)
-        self.get_channel_spectra(sg)
+      if n_workers > 1:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+          futures = [executor.submit(self._preload_one, sg)
+                     for sg in self.signal_groups]
+          for i, future in enumerate(futures):
+            console.print_progress(i, N)
+            future.result()
+      else:
+        for i, sg in enumerate(self.signal_groups):
+          console.print_progress(i, N)
+          self._preload_one(sg)
       console.show_status('Preloading completed.')
   pl = preload
 
-  def get_channel_spectra(self, sg: SignalGroup):
-    from scipy import signal
+  def _preload_one(self, sg):
+    self.get_channel_spectra(self.explorer.load_object(sg))
 
+  def get_channel_spectra(self, sg: SignalGroup):
     # (0) Fetch settings
-    f_min, f_max, f_reso = [self.get(k) for k in ('f_min', 'f_max', 'f_reso')]
-    fs = sg.digital_signals[0].sfreq
-    nfft = int(fs / f_reso)
-
-    # (1) Return from pocket if exists
-    key = (sg.label, f_min, f_max, f_reso, self.get('stages'),
-           ','.join(self.explorer.channels))
+    f_min, f_max = self.freq_range
 
-    if self.in_pocket(key): return self.get_from_pocket(key)
+    # (1) Get full-band spectra of each stage, which are independent of
+    #     `f_min`, `f_max` and `stages`
+    stage_spectra = self._get_stage_spectra(sg)
+    freqs = stage_spectra.get('freqs', None)
 
-    # (2) Calculate spectra_dict if not exists
-    # (2.1) Gather channel_epoch_dict
-    channel_epoch_dict = {ck: [] for ck in self.explorer.channels}
-    se = self.explorer.get_sg_stage_epoch_dict(sg)
+    # (2) Merge spectra of selected stages
+    spectra_dict, n = {}, 0
     for ck in self.explorer.channels:
-      for sk in self.stages:
-        ci = sg.channel_names.index(ck)
-        channel_epoch_dict[ck].extend([s[:, ci] for s in se[sk]])
+      psd_sum = sum([stage_spectra[ck][sk][0] for sk in self.stages])
+      n = sum([stage_spectra[ck][sk][1] for sk in self.stages])
+      if n == 0: return None, None, 0.
+      spectra_dict[ck] = psd_sum / n
 
-    # (2.2) Calculate spectrum for each epoch
-    spectrum_list_dict = {ck: [] for ck in self.explorer.channels}
-    freqs = None
+    # (3) Truncate psd to range (f_min, f_max)
+    _freqs = freqs
     for ck in self.explorer.channels:
-      for s in channel_epoch_dict[ck]:
-        # win_len = 8 * fs
-        # nperseg = min(nfft, len(s))
-        nperseg = 2.0 * fs
-        freqs, psd = signal.welch(s, fs, nperseg=nperseg, nfft=nfft)
+      freqs, spectra_dict[ck] = slice_band(_freqs, spectra_dict[ck],
+                                           f_min, f_max)
 
-        # (2.2.1) Truncate psd to range (f_min, f_max)
-        freq_indices = (freqs >= f_min) & (freqs <= f_max)
-        freqs, psd = freqs[freq_indices], psd[freq_indices]
+    duration = n * 30 / 3600
+    return freqs, spectra_dict, duration
+
+  def _get_stage_spectra(self, sg: SignalGroup) -> dict:
+    """Returns a dict of {'freqs': freqs, <ck>: {<sk>: (psd_sum, n_epochs)}},
+    spectra are calculated at the finest resolution over the whole band.
+    """
+    fs = sg.digital_signals[0].sfreq
+    f_reso = self.freq_resolution
 
-        spectrum_list_dict[ck].append(psd)
+    # (1) Get cache from pocket or disk
+    fp = self._get_sg_fingerprint(sg)
+    key = ('stage_spectra', sg.label, fp, fs, f_reso)
+    cache: dict = self.get_from_pocket(
+      key, initializer=lambda: self._load_spectra_cache(sg, fp, fs, f_reso))
 
-    # (2.3) Merge spectra
-    duration = len(spectrum_list_dict[ck]) * 30 / 3600
-    spectra_dict = {ck: np.mean(spectrum_list_dict[ck], axis=0)
-                    for ck in self.explorer.channels}
+    channels = [ck for ck in self.explorer.channels if ck not in cache]
+    if len(channels) == 0: return cache
 
-    self.put_into_pocket(key, (freqs, spectra_dict, duration), local=True)
-    return freqs, spectra_dict, duration
+    # (2) Calculate spectra for channels not cached
+    # (2.1) Stack epochs of each stage, tape shape = [n_epochs, T, C]
+    se = self.explorer.get_sg_stage_epoch_dict(sg)
+    stage_tapes = {sk: np.stack(se[sk]) for sk in self.explorer.STAGE_KEYS
+                   if len(se[sk]) > 0}
+
+    # (2.2) Run batched Welch for each channel
+    for ck in channels:
+      ci = sg.channel_names.index(ck)
+      cache[ck] = {}
+      for sk in self.explorer.STAGE_KEYS:
+        if sk not in stage_tapes:
+          cache[ck][sk] = (0., 0)
+          continue
+        freqs, psd = welch_psd(stage_tapes[sk][:, :, ci], fs,
+                               nperseg=2 * fs, nfft=int(fs / f_reso))
+        cache['freqs'] = freqs
+        cache[ck][sk] = (np.sum(psd, axis=0), psd.shape[0])
+
+    # (3) Save to disk if required
+    self._save_spectra_cache(sg, fp, fs, f_reso, cache)
+    return cache
+
+  @staticmethod
+  def _get_sg_fingerprint(sg: SignalGroup, n_samples=65536) -> str:
+    """Short fingerprint of signal content, so that variants sharing the
+    same label (e.g., raw and preprocessed) do not share spectra cache.
+    Channel names, shapes and a strided subset of samples are hashed."""
+    import hashlib
+
+    md5 = hashlib.md5()
+    for ds in sg.digital_signals:
+      data = ds.data
+      stride = max(1, len(data) // n_samples)
+      md5.update(f'{ds.channels_names}|{ds.sfreq}|{data.shape}'.encode())
+      md5.update(np.ascontiguousarray(data[::stride]).tobytes())
+    return md5.hexdigest()[:8]
+
+  def _get_cache_path(self, sg: SignalGroup, fp, fs, f_reso):
+    cache_dir = self.get('cache_dir')
+    if cache_dir in ('', None): return None
+    return os.path.join(cache_dir,
+                        f'{sg.label}(spectra,{fp},{fs}Hz,{f_reso}).spec')
+
+  def _load_spectra_cache(self, sg: SignalGroup, fp, fs, f_reso) -> dict:
+    path = self._get_cache_path(sg, fp, fs, f_reso)
+    if path is None or not os.path.exists(path): return {}
+    return io.load_file(path)
+
+  def _save_spectra_cache(self, sg: SignalGroup, fp, fs, f_reso,
+                          cache: dict):
+    path = self._get_cache_path(sg, fp, fs, f_reso)
+    if path is None: return
+    if not os.path.exists(self.get('cache_dir')):
+      os.makedirs(self.get('cache_dir'))
+    io.save_file(cache, path)
 
   # endregion: Plot Methods
 
@@ -1,9 +1,10 @@
+from freud.data_io.lod import LODPyramid, open_edf_lazily
 from freud.data_io.mne_based import read_digital_signals_mne
 from freud.gui.sleep_monitor import SleepMonitor
 from pictor import Pictor
 from pictor.objects.signals.signal_group import SignalGroup, Annotation
 from pictor.plugins import DialogUtilities
-from roma import console
+from roma import console, io
 
 import os
 import numpy as np
@@ -19,9 +20,15 @@ class Freud(Pictor, DialogUtilities):
 
   # region: Commands
 
-  def open(self, edf_path: str = None, dtype=float, auto_refresh=True):
+  def open(self, edf_path: str = None, dtype=float, auto_refresh=True,
+           lazy=False):
     """Open an EDF file. If `edf_path` is not provided, an `open_file` dialog
-    will be popped up for manually selecting file."""
+    will be popped up for manually selecting file.
+
+    If `lazy` is True, only a LOD pyramid (persisted beside the EDF file) is
+    kept in memory, full-rate data are read window by window on demand.
+    A .sg file can also be opened, its LOD pyramid will be persisted beside.
+    """
     if edf_path is None:
       edf_path = self.load_file_dialog('Please select an EDF file')
     if edf_path in ('', ): return
@@ -29,8 +36,15 @@ class Freud(Pictor, DialogUtilities):
     fn = os.path.basename(edf_path)
 
     with self.busy(f'Reading data from `{edf_path}` ...', auto_refresh):
-      digital_signals = read_digital_signals_mne(edf_path, dtype=dtype)
-      sg = SignalGroup(digital_signals, label=f'{fn}')
+      if edf_path.endswith('.sg'):
+        sg: SignalGroup = io.load_file(edf_path, verbose=True)
+        LODPyramid.load_or_build_for_sg(sg, edf_path)
+      elif lazy:
+        sg = open_edf_lazily(edf_path, label=f'{fn}',
+                             dtype=np.float32 if dtype is float else dtype)
+      else:
+        digital_signals = read_digital_signals_mne(edf_path, dtype=dtype)
+        sg = SignalGroup(digital_signals, label=f'{fn}')
       self.objects.append(sg)
 
     # Refresh if necessary
@@ -59,7 +73,11 @@ class Freud(Pictor, DialogUtilities):
   ssa = standardize_stage_annotation
 
   def show_stage_num_histogram(self):
-    data = [sg.total_duration // 30  for sg in self.objects]
+    from freud.data_io.sidecar import load_sidecar
+
+    # Durations of objects given as paths are read from .sg sidecars
+    data = [(load_sidecar(sg)['duration'] if isinstance(sg, str)
+             else sg.total_duration) // 30 for sg in self.objects]
 
     import matplotlib.pyplot as plt
     fig = plt.figure()
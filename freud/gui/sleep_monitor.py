@@ -1,18 +1,85 @@
 import numpy as np
 
+from freud.data_io.lod import LODPyramid, EDFWindowReader
+from pictor.objects.signals.scrolling import Scrolling
 from pictor.plotters import Monitor
 from roma import console
 
 
 
+class LODScrolling(Scrolling):
+  """A Scrolling drawing at most `max_ticks` points for each channel. When
+  the window contains more samples than `max_ticks`, min/max envelopes from
+  LOD pyramids are drawn, otherwise full-rate data of the window are drawn.
+  """
+
+  ENABLED_KEY = 'LODScrolling::enabled'
+
+  def get_channels(self, channels: str, max_ticks=None):
+    pyramids = self.get_from_pocket(LODPyramid.POCKET_KEY, default=None)
+    if (pyramids is None or not self.get_from_pocket(self.ENABLED_KEY, True)
+        or not isinstance(max_ticks, int) or max_ticks <= 0):
+      return super(LODScrolling, self).get_channels(channels, max_ticks)
+
+    pyramid_dict = {name: p for p in pyramids for name in p.channel_names}
+    if channels == '*': names = self.channel_names
+    else: names = [name for name in channels.split(',')
+                   if name in pyramid_dict]
+
+    # Get time window
+    start_time = (self.dominate_signal.ticks[0] +
+                  self.start_position * self.total_duration)
+    end_time = start_time + self.window_duration
+
+    res = []
+    for name in names:
+      pyramid: LODPyramid = pyramid_dict[name]
+      if (end_time - start_time) * pyramid.sfreq > max_ticks:
+        x, y = pyramid.get_envelope(name, start_time, end_time, max_ticks)
+      else: x, y = self._get_full_rate_window(name, start_time, end_time)
+      res.append((name, x, y))
+    return res
+
+  def _get_full_rate_window(self, name, start_time, end_time):
+    # Read window from file if full-rate data is not in memory
+    reader: EDFWindowReader = self.get_from_pocket(
+      EDFWindowReader.__name__, default=None)
+    if reader is not None: return reader.read_window(start_time, end_time)[name]
+
+    x, y = self.name_tick_data_dict[name]
+    i0, i1 = np.searchsorted(x, [start_time, end_time])
+    return x[i0:i1 + 1], y[i0:i1 + 1]
+
+
+
 class SleepMonitor(Monitor):
 
+  def __init__(self, pictor=None, window_duration=60, channels: str='*'):
+    super(SleepMonitor, self).__init__(pictor, window_duration, channels)
+
+    self.new_settable_attr(
+      'lod', True, bool,
+      'Whether to draw min/max envelopes when window contains too many ticks')
+
   def register_shortcuts(self):
     super(SleepMonitor, self).register_shortcuts()
 
     self.register_a_shortcut('O', self.pictor.open,
                              description='Open a .edf file')
 
+  def _get_scroll(self, x, i: int) -> Scrolling:
+    s = super(SleepMonitor, self)._get_scroll(x, i)
+
+    if self.get('lod') and not isinstance(s, LODScrolling):
+      # Pyramids will be built if not loaded beside the .sg file
+      LODPyramid.load_or_build_for_sg(s)
+      s.__class__ = LODScrolling
+
+    if isinstance(s, LODScrolling):
+      s.put_into_pocket(LODScrolling.ENABLED_KEY, self.get('lod'),
+                        exclusive=False)
+    return s
+
   # region: Auto Sttaging
 
   def stage(self,
@@ -1,6 +1,8 @@
 import os.path
 
+from collections import OrderedDict
 from freud.benchmarks.algorithm import Algorithm
+from freud.data_io.instrumentation import instrument, profiled
 from freud.datasets.dataset_base import HypnoDataset
 from hypnomics.freud.freud import Freud
 from hypnomics.freud.nebula import Nebula
@@ -8,6 +10,7 @@ from hypnomics.hypnoprints.extractor import Extractor
 from roma import check_type
 from roma import console, io
 
+from .nebula_store import NebulaStore
 from .probe_tools import get_extractor_dict, get_probe_keys
 
 import numpy as np
@@ -51,6 +54,22 @@ class HOAlgorithm(Algorithm):
     def probe_keys_for_extracting_features(self):
       return self._get_probe_keys(True)
 
+    @property
+    def extractor_settings(self) -> dict:
+      return {
+        'include_statistical_features': 1,
+        'include_inter_stage_features': 1,
+        'include_inter_channel_features': 1,
+
+        # Deprecated features
+        'include_proportion': False,
+        'include_stage_mean': False,
+        'include_stage_shift': False,
+        'include_stage_wise_covariance': False,
+        'include_channel_shift': False,
+        'include_all_mean_std': False,
+      }
+
     def _get_probe_keys(self, for_extracting_features):
       if isinstance(self.probe_config, (tuple, list)): return self.probe_config
       assert isinstance(self.probe_config, str), f'Invalid probe configuration: {self.probe_config}'
@@ -58,6 +77,13 @@ class HOAlgorithm(Algorithm):
 
     # region: Public Methods
 
+    def get_cache_config(self) -> dict:
+      config = super().get_cache_config()
+      config['probe_keys'] = self.probe_keys_for_extracting_features
+      config['extractor_settings'] = self.extractor_settings
+      return config
+
+
     def extract_features(self, **kwargs):
       """Extract feature vectors from a list of signal group filenames
       """
@@ -81,19 +107,7 @@ class HOAlgorithm(Algorithm):
 
       # (3) Type-I Features
       show_status('Generating features ...')
-      extractor_settings = {
-        'include_statistical_features': 1,
-        'include_inter_stage_features': 1,
-        'include_inter_channel_features': 1,
-
-        # Deprecated features
-        'include_proportion': False,
-        'include_stage_mean': False,
-        'include_stage_shift': False,
-        'include_stage_wise_covariance': False,
-        'include_channel_shift': False,
-        'include_all_mean_std': False,
-      }
+      extractor_settings = self.extractor_settings
       extractor = Extractor(**extractor_settings)
       feature_dict = extractor.extract(nebula, return_dict=True)
       features = np.stack([np.array(list(v.values()))
@@ -115,6 +129,7 @@ class HOAlgorithm(Algorithm):
                         'sg_labels': self.hypno_data.sg_labels, }
 
 
+    @profiled('ho.generate_clouds')
     def generate_clouds(self, time_resolution, probe_keys, overwrite=False,
                         sg_file_list=None):
       # Sanity check
@@ -131,20 +146,31 @@ class HOAlgorithm(Algorithm):
       console.show_status(f'Sampling frequency: {fs} Hz', prompt=self.prompt)
 
       extractor_dict = get_extractor_dict(probe_keys, fs=fs)
-      freud.generate_clouds(self.hypno_data.signal_group_dir,
-                            pattern=self.hypno_data.sg_fn_pattern,
-                            channels=self.hypno_data.channels,
-                            time_resolutions=time_resolution,
-                            overwrite=overwrite,
-                            sg_file_list=sg_file_list,
-                            extractor_dict=extractor_dict)
-
-      # Generate macro features (Type-III)
-      pass
+      with instrument.stage('ho.generate_clouds.extract'):
+        freud.generate_clouds(self.hypno_data.signal_group_dir,
+                              pattern=self.hypno_data.sg_fn_pattern,
+                              channels=self.hypno_data.channels,
+                              time_resolutions=time_resolution,
+                              overwrite=overwrite,
+                              sg_file_list=sg_file_list,
+                              extractor_dict=extractor_dict)
+
+      # Append newly generated clouds to nebula store, note that each probe
+      #  group produces clouds of its expanded probe keys
+      if 'power_group' in probe_keys:
+        probe_keys = self.probe_keys_for_extracting_features
+      sg_labels = self.hypno_data.sg_labels if sg_file_list is None else [
+        os.path.basename(path).split('(')[0] for path in sg_file_list]
+      for tr in time_resolution:
+        with instrument.stage('ho.generate_clouds.import', tr=tr):
+          NebulaStore(self.hypno_data.nebula_dir, tr).import_clouds(
+            self.hypno_data.cloud_dir, sg_labels, self.hypno_data.channels,
+            probe_keys, overwrite=overwrite)
 
       # Generate macro features (Type-III)
-      freud.generate_macro_features(self.hypno_data.signal_group_dir,
-                                    sg_file_list=sg_file_list)
+      with instrument.stage('ho.generate_clouds.macro'):
+        freud.generate_macro_features(self.hypno_data.signal_group_dir,
+                                      sg_file_list=sg_file_list)
 
 
     def load_nebula_from_clouds(self, time_resolution: int,
@@ -153,12 +179,13 @@ class HOAlgorithm(Algorithm):
       if probe_keys is None:
         probe_keys = self.probe_keys_for_extracting_features
 
-      # (1) Load nebula
-      freud = Freud(self.hypno_data.cloud_dir)
-      nebula = freud.load_nebula(sg_labels=self.hypno_data.sg_labels,
-                                 channels=self.hypno_data.channels,
-                                 time_resolution=time_resolution,
-                                 probe_keys=probe_keys)
+      # (1) Load nebula from consolidated store
+      nebula = NebulaStore.load_nebula_with_fallback(
+        self.hypno_data.nebula_dir, self.hypno_data.cloud_dir,
+        sg_labels=self.hypno_data.sg_labels,
+        channels=self.hypno_data.channels,
+        time_resolution=time_resolution,
+        probe_keys=probe_keys)
 
       if not load_meta: return nebula
       # (2) Set metadata
@@ -177,20 +204,30 @@ class HOAlgorithm(Algorithm):
 
 
     def load_macro_alpha(self, config='alpha'):
+      """Load macro features from `macro_<config>.ftab` under cloud directory.
+      Features of recordings missing in table, or whose `macro_<config>.od`
+      files have been changed since, are read from these files and appended
+      to table in one batch."""
+      from freud.data_io.feature_table import FeatureTable, get_source_stat
+
       freud = Freud(self.hypno_data.cloud_dir)
-      features, feature_names = [], None
+      table_path = os.path.join(self.hypno_data.cloud_dir,
+                                f'macro_{config}' + FeatureTable.EXTENSION)
+      table = FeatureTable.load(table_path)
 
-      for sg_label in self.hypno_data.sg_labels:
+      rows, provenance = OrderedDict(), {}
+      for sg_label in table.get_outdated_labels(self.hypno_data.sg_labels):
         cloud_path = freud._check_hierarchy(sg_label, create_if_not_exist=False)
         macro_path = os.path.join(cloud_path, f'macro_{config}.od')
 
-        macro_dict: dict = io.load_file(macro_path)
-        features.append(list(macro_dict.values()))
+        rows[sg_label] = io.load_file(macro_path)
+        provenance[sg_label] = {'source': macro_path,
+                                'source_stat': get_source_stat(macro_path)}
 
-        if feature_names is None:
-          feature_names = [f'Macro_{n}' for n in macro_dict.keys()]
+      if rows: table.append(rows, provenance)
 
-      features = np.stack(features, axis=0)
+      features, feature_names = table.get_matrix(self.hypno_data.sg_labels)
+      feature_names = [f'Macro_{n}' for n in feature_names]
       return features, feature_names
 
     # endregion: Public Methods
@@ -0,0 +1,305 @@
+"""Consolidated storage of clouds. Instead of one `.clouds` file per
+`sg_label/channel/<tr>s/<probe>`, clouds of all recordings with the same time
+resolution are appended to one flat binary file, along with an index
+
+  {(sg_label, channel, probe_key): {stage_key: (offset, length)}}
+
+so that a nebula can be loaded selectively via one memory map.
+
+Files in store directory (per time resolution):
+  nebula-<tr>s[.<generation>].data   raw values (float64 by default),
+                                     append-only
+  nebula-<tr>s.index                 index dict saved via `roma.io`
+
+Size and modification time of each imported `.clouds` file are kept in
+index (`sources`), so that files regenerated after import (e.g., by
+`Freud.generate_clouds(overwrite=True)`) are imported again.
+
+Overwritten entries leave garbage in data file, which is reclaimed by
+`compact`. Compaction writes live values into a data file of the next
+generation, so that the index (flushed atomically) always points to a
+complete data file.
+
+The store assumes a single writer at a time. Readers only see data once the
+index has been flushed, which is done atomically.
+"""
+from roma import console, io
+
+import os
+import numpy as np
+
+
+
+class NebulaStore(object):
+
+  def __init__(self, store_dir, time_resolution: int, dtype=np.float64):
+    self.store_dir = store_dir
+    self.time_resolution = time_resolution
+
+    self.index = {'dtype': np.dtype(dtype).str, 'size': 0, 'entries': {},
+                  'garbage': 0, 'generation': 0, 'sources': {}}
+    if os.path.exists(self.index_path):
+      self.index = io.load_file(self.index_path)
+      # Index saved by earlier versions
+      self.index.setdefault('garbage', 0)
+      self.index.setdefault('generation', 0)
+      self.index.setdefault('sources', {})
+
+    self._buffer = None
+
+  # region: Properties
+
+  @property
+  def data_path(self): return self._get_data_path(self.index['generation'])
+
+  @property
+  def index_path(self):
+    return os.path.join(self.store_dir, f'nebula-{self.time_resolution}s.index')
+
+  @property
+  def dtype(self): return np.dtype(self.index['dtype'])
+
+  @property
+  def entries(self) -> dict: return self.index['entries']
+
+  @property
+  def buffer(self) -> np.ndarray:
+    if self._buffer is None:
+      if self.index['size'] == 0: return np.zeros(0, dtype=self.dtype)
+      self._buffer = np.memmap(self.data_path, dtype=self.dtype, mode='r',
+                               shape=(self.index['size'],))
+    return self._buffer
+
+  # endregion: Properties
+
+  # region: Public Methods
+
+  def contains(self, sg_labels, channels, probe_keys) -> bool:
+    return all([(lb, ck, pk) in self.entries for lb in sg_labels
+                for ck in channels for pk in probe_keys])
+
+
+  def get_clouds(self, sg_label, channel, probe_key) -> dict:
+    entry = self.entries[(sg_label, channel, probe_key)]
+    buffer = self.buffer
+    return {sk: np.array(buffer[offset:offset + length])
+            for sk, (offset, length) in entry.items()}
+
+
+  def append(self, cloud_dict: dict, flush=True):
+    """Append clouds to store.
+
+    :param cloud_dict: {(sg_label, channel, probe_key): {stage_key: array}}.
+                       Existing entries are overwritten in index, their old
+                       values are counted as garbage until `compact`.
+    """
+    # Bytes after `size` may be left by an interrupted append, overwrite them
+    size = self.index['size']
+    self._buffer = None
+    with open(self.data_path, 'r+b' if os.path.exists(self.data_path)
+              else 'wb') as f:
+      f.seek(size * self.dtype.itemsize)
+      for key, clouds in cloud_dict.items():
+        entry = {}
+        for sk, values in clouds.items():
+          values = np.ascontiguousarray(values, dtype=self.dtype).ravel()
+          f.write(values.tobytes())
+          entry[sk] = (size, len(values))
+          size += len(values)
+        if key in self.entries: self.index['garbage'] += sum(
+          [length for _, length in self.entries[key].values()])
+        self.entries[key] = entry
+      f.truncate()
+
+    self.index['size'] = size
+    if flush: self.flush()
+
+
+  def flush(self):
+    tmp_path = self.index_path + '.tmp'
+    io.save_file(self.index, tmp_path)
+    os.replace(tmp_path, self.index_path)
+
+
+  def compact(self, verbose=False) -> int:
+    """Rewrite live values into a data file of the next generation, so that
+    garbage left by overwritten entries is reclaimed. Return number of
+    reclaimed values."""
+    garbage = self.index['garbage']
+    if garbage == 0: return 0
+
+    # (1) Copy live values entry by entry into new data file
+    old_path, buffer = self.data_path, self.buffer
+    generation = self.index['generation'] + 1
+    new_path = self._get_data_path(generation)
+    entries, size = {}, 0
+    with open(new_path, 'wb') as f:
+      for key, entry in self.entries.items():
+        new_entry = {}
+        for sk, (offset, length) in entry.items():
+          values = np.ascontiguousarray(buffer[offset:offset + length])
+          f.write(values.tobytes())
+          new_entry[sk] = (size, length)
+          size += length
+        entries[key] = new_entry
+
+    # (2) Switch index to new data file, then remove the old one
+    self._buffer, buffer = None, None
+    self.index.update({'entries': entries, 'size': size, 'garbage': 0,
+                       'generation': generation})
+    self.flush()
+    if os.path.exists(old_path): os.remove(old_path)
+
+    if verbose: console.show_status(
+      f'Reclaimed {garbage} values in `{self.data_path}`.')
+    return garbage
+
+
+  def import_clouds(self, cloud_dir, sg_labels, channels, probe_keys,
+                    overwrite=False, verbose=True, chunk_size=1000) -> int:
+    """Import `.clouds` files generated by `hypnomics.freud.Freud` into store.
+    Entries are imported if missing in store, or if their source file has
+    been changed (in size or modification time) since last import.
+    Clouds are appended in chunks of `chunk_size` entries so that memory
+    usage is bounded. If more than half of data file becomes garbage after
+    overwriting, store is compacted. Return number of imported entries."""
+    sources = self.index['sources']
+
+    # (1) Find entries to import
+    keys, stats, n_recorded = [], [], 0
+    for key in [(lb, ck, pk) for lb in sg_labels for ck in channels
+                for pk in probe_keys]:
+      stat = self._get_source_stat(self._get_cloud_path(cloud_dir, *key))
+      if key in self.entries and not overwrite:
+        # Keep entries whose source is unchanged or no longer available
+        if stat is None: continue
+        # Sources of entries imported by earlier versions were not recorded
+        if key not in sources:
+          sources[key] = stat
+          n_recorded += 1
+        if sources[key] == stat: continue
+      keys.append(key)
+      stats.append(stat)
+
+    # (2) Import clouds chunk by chunk
+    cloud_dict, N = {}, len(keys)
+    for i, (key, stat) in enumerate(zip(keys, stats)):
+      if verbose and i % 100 == 0: console.print_progress(i, N)
+      path = self._get_cloud_path(cloud_dir, *key)
+      if stat is None: raise FileNotFoundError(f'!! `{path}` not found')
+      cloud_dict[key] = io.load_file(path)
+      sources[key] = stat
+
+      if len(cloud_dict) >= chunk_size:
+        self.append(cloud_dict, flush=False)
+        cloud_dict = {}
+
+    if cloud_dict: self.append(cloud_dict, flush=False)
+    if N + n_recorded > 0: self.flush()
+    if self.index['garbage'] > self.index['size'] // 2: self.compact(verbose)
+
+    if verbose and N > 0: console.show_status(
+      f'{N} clouds imported into `{self.data_path}`.')
+    return N
+
+
+  def load_nebula(self, sg_labels, channels, probe_keys, verbose=False):
+    from hypnomics.freud.nebula import Nebula
+
+    nebula = Nebula(self.time_resolution)
+    nebula.labels = list(sg_labels)
+    nebula.channels = list(channels)
+    nebula.probe_keys = list(probe_keys)
+
+    N = len(sg_labels)
+    for i, lb in enumerate(sg_labels):
+      if verbose and i % 100 == 0: console.print_progress(i, N)
+      for ck in channels:
+        for pk in probe_keys:
+          nebula.data_dict[(lb, ck, pk)] = self.get_clouds(lb, ck, pk)
+
+    if verbose: console.show_status(
+      f'Nebula (N={N}) loaded from `{self.data_path}`.')
+    return nebula
+
+  # endregion: Public Methods
+
+  # region: Private Methods
+
+  def _get_cloud_path(self, cloud_dir, sg_label, channel, probe_key):
+    return os.path.join(cloud_dir, sg_label, channel,
+                        f'{self.time_resolution}s', f'{probe_key}.clouds')
+
+
+  @staticmethod
+  def _get_source_stat(path):
+    """Return (size, mtime_ns) of file, or None if it does not exist"""
+    try: stat = os.stat(path)
+    except FileNotFoundError: return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+  def _get_data_path(self, generation: int):
+    suffix = '' if generation == 0 else f'.{generation}'
+    return os.path.join(self.store_dir,
+                        f'nebula-{self.time_resolution}s{suffix}.data')
+
+  # endregion: Private Methods
+
+  # region: Class Methods
+
+  @classmethod
+  def load_nebula_with_fallback(cls, store_dir, cloud_dir, sg_labels,
+                                channels, time_resolution, probe_keys,
+                                verbose=False):
+    """Load nebula from store. Clouds missing in store, or whose `.clouds`
+    files under `cloud_dir` have been changed since import, are imported
+    first."""
+    store = cls(store_dir, time_resolution)
+    store.import_clouds(cloud_dir, sg_labels, channels, probe_keys,
+                        verbose=verbose)
+    return store.load_nebula(sg_labels, channels, probe_keys, verbose=verbose)
+
+  # endregion: Class Methods
+
+
+
+if __name__ == '__main__':
+  # Compare loading clouds from per-file storage and from store
+  import tempfile, time
+
+  work_dir = tempfile.mkdtemp()
+  cloud_dir = os.path.join(work_dir, 'clouds')
+  labels = [f'sg-{i:04d}' for i in range(100)]
+  channels, probe_keys = ['EEG C3-M2', 'EEG C4-M1'], ['AMP-1', 'FREQ-20']
+  stages = ['W', 'N1', 'N2', 'N3', 'R']
+
+  for lb in labels:
+    for ck in channels:
+      d = os.path.join(cloud_dir, lb, ck, '30s')
+      os.makedirs(d)
+      for pk in probe_keys:
+        io.save_file({sk: np.random.randn(np.random.randint(20, 400))
+                      for sk in stages}, os.path.join(d, f'{pk}.clouds'))
+
+  store = NebulaStore(work_dir, 30)
+  store.import_clouds(cloud_dir, labels, channels, probe_keys)
+
+  tic = time.time()
+  for lb in labels:
+    for ck in channels:
+      for pk in probe_keys:
+        clouds = io.load_file(os.path.join(cloud_dir, lb, ck, '30s',
+                                           f'{pk}.clouds'))
+  t1 = time.time() - tic
+
+  tic = time.time()
+  store = NebulaStore(work_dir, 30)
+  for lb in labels:
+    for ck in channels:
+      for pk in probe_keys:
+        _clouds = store.get_clouds(lb, ck, pk)
+  t2 = time.time() - tic
+
+  assert all([np.array_equal(clouds[sk], _clouds[sk]) for sk in stages])
+  print(f'Per-file: {t1 * 1000:.1f} ms, store: {t2 * 1000:.1f} ms')
@@ -1,13 +1,16 @@
 from collections import OrderedDict
+from freud.talos_utils.longitudinal_pairing import SessionTable
 from roma import console, io, Nomear
 
 import os
+import numpy as np
 
 
 
 class LongitudinalManager(Nomear):
 
   META_EXTENSION = '.csv'
+  ACQ_TIME_KEY = None
 
   @property
   def meta_path(self): raise NotImplementedError
@@ -24,3 +27,39 @@ class LongitudinalManager(Nomear):
 
   @staticmethod
   def generate_patient_dict(meta_path) -> OrderedDict: raise NotImplementedError
+
+  # region: Longitudinal Pairing
+
+  @classmethod
+  def get_pair_label(cls, pid, ses_id): return f'{pid}_{ses_id}'
+
+
+  def get_session_table(self, patient_dict: dict = None) -> SessionTable:
+    if patient_dict is None: patient_dict = self.patient_dict
+    return SessionTable.from_patient_dict(
+      patient_dict, self.get_pair_label, acq_key=self.ACQ_TIME_KEY)
+
+
+  def get_longitudinal_pairs(self, patient_dict: dict = None,
+                             return_age_delta=False, max_age_delta=None):
+    """Return all session pairs (sorted by session key) of each subject.
+    Age delta of each pair is computed from acquisition time if available,
+    otherwise from ages."""
+    table = self.get_session_table(patient_dict)
+    i, j = table.get_all_pairs()
+
+    if return_age_delta and self.ACQ_TIME_KEY is not None:
+      assert not np.isnat(table.acq_dates[i]).any(), (
+        f'!! `{self.ACQ_TIME_KEY}` not found in patient_dict')
+
+    deltas = table.get_age_deltas(i, j)
+    if max_age_delta is not None:
+      mask = deltas <= max_age_delta
+      i, j, deltas = i[mask], j[mask], deltas[mask]
+
+    label_pairs = table.to_label_pairs(i, j)
+    if return_age_delta:
+      return label_pairs, OrderedDict(zip(label_pairs, deltas.tolist()))
+    return label_pairs
+
+  # endregion: Longitudinal Pairing
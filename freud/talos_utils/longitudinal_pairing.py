@@ -0,0 +1,198 @@
+"""Vectorized pairing of longitudinal sessions. A `SessionTable` holds one row
+per session (subject, session key, label, acquisition date, age) as numpy
+arrays. Subjects are hashed into integer codes once, and pairs are produced
+from the sorted table without any per-subject Python loops.
+
+Pair types:
+  first/second  the first two sessions of each subject
+  all           all (i, j) session pairs (i < j) of each subject
+  age-delta     any of the above, filtered by age delta between sessions
+"""
+import numpy as np
+
+
+
+DAYS_PER_YEAR = 365.25
+
+
+def to_days(dates) -> np.ndarray:
+  """Convert a list of dates (datetime, 'YYYY-MM-DD[...]' strings or None)
+  into datetime64[D] array. Missing dates (including NaN and NaT used by
+  pandas) and invalid values are NaT"""
+  from datetime import date
+
+  def _convert(d):
+    # NaN and NaT are not equal to themselves
+    if d is None or d != d: return None
+    if isinstance(d, str): d = d[:10]
+    elif not isinstance(d, (date, np.datetime64)): return None
+    try: return np.datetime64(d, 'D')
+    except ValueError: return None
+
+  return np.array([_convert(d) for d in dates], dtype='datetime64[D]')
+
+
+
+class SessionTable(object):
+
+  def __init__(self, subjects, session_keys, labels, acq_dates=None,
+               ages=None):
+    self.subjects = np.asarray(subjects, dtype=str)
+    self.session_keys = np.asarray(session_keys, dtype=str)
+    self.labels = np.asarray(labels, dtype=str)
+
+    N = len(self.labels)
+    self.acq_dates = (np.full(N, 'NaT', dtype='datetime64[D]')
+                      if acq_dates is None else to_days(acq_dates))
+    self.ages = (np.full(N, np.nan) if ages is None
+                 else np.asarray(ages, dtype=float))
+
+    # Hash subjects into integer codes following order of first appearance,
+    #  so that pairs are ordered as subjects appear in table
+    _, first, inverse = np.unique(self.subjects, return_index=True,
+                                  return_inverse=True)
+    self.subject_codes = np.argsort(np.argsort(first))[inverse]
+
+  # region: Properties
+
+  @property
+  def size(self): return len(self.labels)
+
+  # endregion: Properties
+
+  # region: Construction
+
+  @classmethod
+  def from_patient_dict(cls, patient_dict: dict, label_func,
+                        acq_key=None, age_key='age') -> 'SessionTable':
+    """patient_dict = {pid: {ses_id: {key: value}}}, label_func(pid, ses_id)
+    returns label of each session"""
+    subjects, session_keys, labels, acq_dates, ages = [], [], [], [], []
+    for pid, sess_dict in patient_dict.items():
+      for ses_id, info in sess_dict.items():
+        subjects.append(pid)
+        session_keys.append(ses_id)
+        labels.append(label_func(pid, ses_id))
+        acq_dates.append(None if acq_key is None else info.get(acq_key, None))
+        ages.append(info.get(age_key, np.nan))
+
+    return cls(subjects, session_keys, labels, acq_dates, ages)
+
+
+  @classmethod
+  def from_labels(cls, labels, subject_func, meta: dict = None,
+                  acq_key=None, age_key='age') -> 'SessionTable':
+    """Build table from labels (e.g., nebula.labels) in their given order.
+    Session key of each row is its label."""
+    subjects = [subject_func(lb) for lb in labels]
+    acq_dates, ages = None, None
+    if meta is not None:
+      if acq_key is not None:
+        acq_dates = [meta.get(lb, {}).get(acq_key, None) for lb in labels]
+      ages = [meta.get(lb, {}).get(age_key, np.nan) for lb in labels]
+
+    return cls(subjects, labels, labels, acq_dates, ages)
+
+  # endregion: Construction
+
+  # region: Pairing
+
+  def _get_groups(self, sort_sessions=True):
+    """Return (order, starts, counts), where `order` sorts rows by subject
+    (and session key if `sort_sessions`, otherwise by row order), each
+    subject occupies order[starts[k]:starts[k] + counts[k]]"""
+    if sort_sessions:
+      order = np.lexsort((self.session_keys, self.subject_codes))
+    else: order = np.argsort(self.subject_codes, kind='stable')
+
+    codes = self.subject_codes[order]
+    is_start = np.ones(len(codes), dtype=bool)
+    is_start[1:] = codes[1:] != codes[:-1]
+    starts = np.flatnonzero(is_start)
+    counts = np.diff(np.append(starts, len(codes)))
+    return order, starts, counts
+
+
+  def get_first_second_pairs(self, sort_sessions=True):
+    """Return (i, j) row indices of the first two sessions of subjects with
+    at least two sessions, ordered by subject"""
+    order, starts, counts = self._get_groups(sort_sessions)
+    starts = starts[counts >= 2]
+    return order[starts], order[starts + 1]
+
+
+  def get_all_pairs(self, sort_sessions=True):
+    """Return (i, j) row indices of all session pairs within each subject"""
+    order, starts, counts = self._get_groups(sort_sessions)
+
+    # Group subjects by number of sessions, so that pairs of all subjects
+    #  with n sessions are generated at once via broadcasting
+    I, J, S = [], [], []
+    for n in np.unique(counts[counts >= 2]):
+      s = starts[counts == n]
+      a, b = np.triu_indices(n, k=1)
+      I.append((s[:, None] + a[None, :]).ravel())
+      J.append((s[:, None] + b[None, :]).ravel())
+      S.append(np.repeat(s, len(a)))
+
+    if not I: return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    # Keep pairs of the same subject contiguous, following subject order
+    I, J, S = [np.concatenate(x) for x in (I, J, S)]
+    ind = np.lexsort((J, I, S))
+    return order[I[ind]], order[J[ind]]
+
+
+  def get_age_deltas(self, i, j, fallback_to_age=True) -> np.ndarray:
+    """Age delta (in years) of each pair computed from acquisition dates.
+    If date delta is missing or negative and `fallback_to_age` is True,
+    difference of ages is used instead."""
+    days = (self.acq_dates[j] - self.acq_dates[i]).astype(float)
+    days[np.isnat(self.acq_dates[i]) | np.isnat(self.acq_dates[j])] = np.nan
+    deltas = days / DAYS_PER_YEAR
+
+    if fallback_to_age:
+      mask = ~(deltas >= 0)
+      deltas[mask] = self.ages[j[mask]] - self.ages[i[mask]]
+    return deltas
+
+
+  def filter_by_age_delta(self, i, j, max_delta, min_delta=0.,
+                          fallback_to_age=False):
+    """Keep pairs with min_delta < age delta <= max_delta, return
+    (i, j, deltas)"""
+    deltas = self.get_age_deltas(i, j, fallback_to_age)
+    mask = (deltas > min_delta) & (deltas <= max_delta)
+    return i[mask], j[mask], deltas[mask]
+
+
+  def to_label_pairs(self, i, j) -> list:
+    return list(zip(self.labels[i].tolist(), self.labels[j].tolist()))
+
+  # endregion: Pairing
+
+
+
+if __name__ == '__main__':
+  import time
+
+  # Generate 100k sessions of 40k subjects
+  rng = np.random.RandomState(0)
+  N = 100000
+  pids = rng.randint(0, 40000, size=N)
+  subjects = [f'sub-{p}' for p in pids]
+  session_keys = [f'ses-{k}' for k in rng.randint(1, 10, size=N)]
+  labels = [f'{s}_{k}_{i}' for i, (s, k) in enumerate(
+    zip(subjects, session_keys))]
+  days = np.datetime64('2010-01-01') + rng.randint(0, 3650, size=N)
+
+  tic = time.perf_counter()
+  table = SessionTable(subjects, session_keys, labels, days.astype(str),
+                       ages=rng.randint(20, 80, size=N))
+  i1, j1 = table.get_first_second_pairs()
+  i2, j2 = table.get_all_pairs()
+  i3, j3, d3 = table.filter_by_age_delta(i2, j2, max_delta=1)
+  elapsed = time.perf_counter() - tic
+
+  print(f'{len(i1)} first/second pairs, {len(i2)} pairs, {len(i3)} pairs '
+        f'within 1 year. Elapsed time: {elapsed:.3f} sec')
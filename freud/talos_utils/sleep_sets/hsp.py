@@ -1,5 +1,7 @@
 from collections import OrderedDict
 from datetime import datetime
+from freud.data_io.instrumentation import instrument, profiled
+from freud.data_io.sidecar import save_sg
 from freud.talos_utils.slp_set import SleepSet
 from freud.talos_utils.longitudinal_manager import LongitudinalManager
 from roma import console, io, Nomear
@@ -59,6 +61,9 @@ class HSPSet(SleepSet):
 
   BIPOLAR_GROUPS = [('Fpz', 'Cz', 'Pz', 'Oz')]
 
+  VALID_KWARGS = SleepSet.VALID_KWARGS + [
+    'subset_path', 'max_subjects', 'n_workers', 'pp_dir']
+
   @staticmethod
   def channel_map(edf_ck):
     """Map EDF channel names to standard channel names. Used in reading raw data
@@ -246,6 +251,7 @@ class HSPSet(SleepSet):
 
 
   @classmethod
+  @profiled('hsp.convert_rawdata_to_signal_groups')
   def convert_rawdata_to_signal_groups(
       cls, ses_folder_list: list, tgt_dir, dtype=np.float16, max_sfreq=128,
       bipolar=False, **kwargs):
@@ -281,11 +287,13 @@ class HSPSet(SleepSet):
       console.print_progress(i, n_convert)
 
       try:
-        sg: SignalGroup = cls.load_sg_from_raw_files(
-          ses_dir=ses_path, dtype=dtype, max_sfreq=max_sfreq, bipolar=bipolar)
+        with instrument.item('hsp.convert_rawdata_to_signal_groups', ses_path):
+          sg: SignalGroup = cls.load_sg_from_raw_files(
+            ses_dir=ses_path, dtype=dtype, max_sfreq=max_sfreq,
+            bipolar=bipolar)
 
-        # TODO: sg.label does not match sg_path ?????
-        io.save_file(sg, sg_path, verbose=True)
+          # TODO: sg.label does not match sg_path ?????
+          save_sg(sg, sg_path, verbose=True)
         success_sg_path_list.append(sg_path)
         n_success += 1
       except Exception as e:
@@ -302,60 +310,93 @@ class HSPSet(SleepSet):
     return success_sg_path_list
 
 
+  @classmethod
+  def get_sg_paths(cls, src_dir, subset_dict: dict = None, dtype=np.float16,
+                   max_sfreq=128, bipolar=False) -> List[str]:
+    """Get paths of converted .sg files in `src_dir`. If `subset_dict`
+    ({sub_id: {ses_id: ...}}) is provided, only sessions in it are included,
+    otherwise all converted files are included."""
+    suffix = HSPOrganization.get_sg_suffix(dtype, max_sfreq, bipolar)
+
+    if subset_dict is None:
+      from roma.spqr.finder import walk
+      return sorted([p for p in walk(src_dir, 'file', '*.sg')
+                     if p.endswith(suffix)])
+
+    sg_paths, n_missing = [], 0
+    for sub_id, ses_dict in subset_dict.items():
+      for ses_id in ses_dict:
+        sg_path = os.path.join(src_dir, f'{sub_id}_{ses_id}{suffix}')
+        if os.path.exists(sg_path): sg_paths.append(sg_path)
+        else: n_missing += 1
+
+    if n_missing > 0:
+      console.warning(f'{n_missing} sessions in subset are not converted.')
+    return sg_paths
+
+
+  @classmethod
+  def _load_one_sg(cls, sg_path, cfg_str, pp_dir, just_conversion):
+    sg = cls.load_preprocessed_sg(sg_path, cfg_str, cache_dir=pp_dir)
+    # Avoid sending data back to main process if not required
+    return None if just_conversion else sg
+
+
   @classmethod
   def load_as_signal_groups(cls, src_dir, max_sfreq=128,
                             **kwargs) -> List[SignalGroup]:
-
+    """Load converted HSP .sg files (see `convert_rawdata_to_signal_groups`)
+    from `src_dir`.
+
+    Optional kwargs
+    ---------------
+    subset_dict: {sub_id: {ses_id: ...}}, e.g., from HSPAgent.load_subset_dict
+    subset_path: path of subset dict file, used if subset_dict is not provided
+    max_subjects: maximum number of subjects to load
+    preprocess: preprocess config string, derivatives are cached
+    pp_dir: directory of preprocessed derivatives, `derivatives/` under
+            src_dir by default
+    n_workers: number of processes for loading, 1 by default
+    """
     # (0) Get configs
     JUST_CONVERSION = kwargs.get('just_conversion', False)
     PREPROCESS = kwargs.get('preprocess', '')
+    dtype = kwargs.get('dtype', np.float16)
+    bipolar = kwargs.get('bipolar', False)
 
-    # TODO: Implement this
-
-    return
-
-    # (1) Find patient IDs
-    ss_path = os.path.join(data_dir, f'mass{ssid}')
-    pids = [fn[3:10] for fn in walk(
-      ss_path, 'file', '*Base.edf', return_basename=True)]
-    n_patients = len(pids)
-
-    # (2) Load signal groups
-    signal_groups: List[SignalGroup] = []
-
-    for i, pid in enumerate(pids):
-      # (2.1) Create a function to load raw signal group
-      load_raw_sg = lambda: cls.load_as_raw_sg(
-        data_dir, pid, n_patients=n_patients, i=i,
-        max_sfreq=max_sfreq, **kwargs)
-
-      # (2.2) Parse pre-process configs
-      pp_configs, suffix = cls.parse_preprocess_configs(PREPROCESS)
-      # TODO: currently we don't support suffix
-      assert suffix == ''
-
-      # (2.3) Try to load raw signal group
-      if suffix == '':
-        try:
-          sg = load_raw_sg()
-        except Exception as e:
-          import traceback
-          console.warning(f'Failed to load {pid}. Error: {e}')
-          traceback.print_exc()
-          continue
+    # (1) Find .sg files
+    subset_dict = kwargs.get('subset_dict', None)
+    if subset_dict is None and kwargs.get('subset_path', None):
+      subset_dict = io.load_file(kwargs['subset_path'], verbose=True)
 
-        if not JUST_CONVERSION: signal_groups.append(sg)
-        continue
+    max_subjects = kwargs.get('max_subjects', None)
+    if subset_dict is not None and max_subjects is not None:
+      subset_dict = {k: subset_dict[k]
+                     for k in list(subset_dict.keys())[:int(max_subjects)]}
+
+    sg_paths = cls.get_sg_paths(src_dir, subset_dict, dtype, max_sfreq,
+                                bipolar)
+    console.show_status(f'Loading {len(sg_paths)} HSP signal groups ...')
+
+    # (2) Load signal groups in parallel
+    args_list = [(p, PREPROCESS, kwargs.get('pp_dir', None), JUST_CONVERSION)
+                 for p in sg_paths]
+    results = cls.map_in_pool(cls._load_one_sg, args_list,
+                              n_workers=int(kwargs.get('n_workers', 1)),
+                              desc='signal groups')
 
-      # (2.4) TODO
+    return [sg for sg, error in results if sg is not None]
 
 
-      # This is for 00-data-conversion scripts
-      if JUST_CONVERSION: signal_groups.clear()
+  @classmethod
+  def load_as_sleep_set(cls, data_dir, **kwargs):
+    try:
+      from tframe import hub as th
+      for key in ('subset_path', 'max_subjects', 'n_workers', 'pp_dir'):
+        if key in th.data_kwargs: kwargs[key] = th.data_kwargs[key]
+    except: pass
 
-    # (-1) Show status
-    console.show_status(f'Successfully read {n_patients} files.')
-    return signal_groups
+    return super(HSPSet, cls).load_as_sleep_set(data_dir, **kwargs)
 
   # endregion: Data Conversion
 
@@ -400,6 +441,19 @@ class HSPAgent(LongitudinalManager):
     io.save_file(od, psq_dict_path, verbose=True)
     return od
 
+  @property
+  def inventory_path(self): return self.meta_path.replace('.csv', '.inv')
+
+  @property
+  def inventory(self):
+    """Session inventory built by `build_inventory`, None if not built"""
+    def _init_inventory():
+      from freud.talos_utils.sleep_sets.hsp_inventory import HSPInventory
+
+      if not os.path.exists(self.inventory_path): return None
+      return HSPInventory.load(self.inventory_path)
+    return self.get_from_pocket('inventory', initializer=_init_inventory)
+
   @Nomear.property()
   def pre_sleep_questionnaire_dataframe(self):
     import pandas as pd
@@ -419,45 +473,53 @@ class HSPAgent(LongitudinalManager):
 
   @staticmethod
   def get_dual_nebula(nebula, max_age_diff=1):
-    night_1, buffer_1 = [], []
-    night_2, buffer_2 = [], []
-
-    for label in nebula.labels:
-      pid = label.split('-')[1].split('_')[0]
-      if pid not in buffer_1:
-        buffer_1.append(pid)
-        night_1.append(label)
-      else:
-        if pid in buffer_2: continue
-        # assert pid not in buffer_2
-        buffer_2.append(pid)
-        night_2.append(label)
+    """Pair the first two nights (in order of nebula.labels) of each
+    subject, and keep pairs with 0 < acquisition time delta <= max_age_diff"""
+    from freud.talos_utils.longitudinal_pairing import SessionTable
+
+    table = SessionTable.from_labels(
+      nebula.labels, lambda lb: lb.split('-')[1].split('_')[0],
+      meta=nebula.meta, acq_key=HSPAgent.ACQ_TIME_KEY)
+    i, j = table.get_first_second_pairs(sort_sessions=False)
 
     # Filter by age diff
-    _night_1, _night_2 = [], []
-    for lb1, lb2 in zip(night_1, night_2):
-      acq_time_1 = datetime.strptime(nebula.meta[lb1][HSPAgent.ACQ_TIME_KEY], '%Y-%m-%d')
-      acq_time_2 = datetime.strptime(nebula.meta[lb2][HSPAgent.ACQ_TIME_KEY], '%Y-%m-%d')
-      delta = (acq_time_2 - acq_time_1).days / 365.25
-      if delta <= 0:
-        print(f'Error: {lb1} and {lb2} have negative age difference: {delta}')
-        continue
-      # assert delta > 0
-      if delta <= max_age_diff:
-      # if abs(nebula.meta[lb1]['age'] - nebula.meta[lb2]['age']) <= max_age_diff:
-        _night_1.append(lb1)
-        _night_2.append(lb2)
+    deltas = table.get_age_deltas(i, j, fallback_to_age=False)
+    n_invalid = int(np.sum(~(deltas > 0)))
+    if n_invalid > 0: console.warning(
+      f'{n_invalid} pairs have non-positive or missing age difference, '
+      f'e.g., {table.to_label_pairs(i[~(deltas > 0)], j[~(deltas > 0)])[:3]}')
 
-    console.show_status(f'Found {len(_night_1)} pairs within age_diff={max_age_diff}.')
-    return nebula[_night_1], nebula[_night_2]
+    i, j, _ = table.filter_by_age_delta(i, j, max_delta=max_age_diff)
+    night_1, night_2 = table.labels[i].tolist(), table.labels[j].tolist()
+
+    console.show_status(f'Found {len(night_1)} pairs within age_diff={max_age_diff}.')
+    return nebula[night_1], nebula[night_2]
 
   # endregion: - Match Logic
 
   # region: - Data Conversion
 
+  def build_inventory(self, patient_dict: dict = None, n_workers=1,
+                      overwrite=False):
+    """Crawl acquisition dates, channels and file sizes of all sessions in
+    `patient_dict` (all patients by default) into a session inventory, which
+    is then queried by `get_acq_time` and `filter_patients_by_channels`"""
+    from freud.talos_utils.sleep_sets.hsp_inventory import HSPInventory
+
+    if patient_dict is None: patient_dict = self.patient_dict
+    inventory = HSPInventory.load(self.inventory_path)
+    inventory.build(self.convert_to_folder_names(patient_dict, local=True),
+                    n_workers=n_workers, overwrite=overwrite)
+    self.put_into_pocket('inventory', inventory, exclusive=False)
+    return inventory
+
+
   def load_nebula_from_clouds(self, sub_dict, cloud_path, channels,
-                              time_resolution, probe_keys):
-    from hypnomics.freud.freud import Freud
+                              time_resolution, probe_keys, store_dir=None):
+    """Load nebula via consolidated NebulaStore located in `store_dir`
+    (`cloud_path` by default). Clouds not yet in store, or whose `.clouds`
+    files under `cloud_path` have changed since import, are imported."""
+    from freud.hypno_tools.nebula_store import NebulaStore
 
     ho_list = [HSPOrganization(p)
                for p in self.convert_to_folder_names(sub_dict, local=True)]
@@ -465,17 +527,17 @@ class HSPAgent(LongitudinalManager):
     # (1) Get sg_labels
     sg_labels = [ho.sg_label for ho in ho_list]
 
-    freud = Freud(cloud_path)
-    nebula = freud.load_nebula(sg_labels=sg_labels,
-                               channels=channels,
-                               time_resolution=time_resolution,
-                               probe_keys=probe_keys, verbose=True)
+    if store_dir is None: store_dir = cloud_path
+    nebula = NebulaStore.load_nebula_with_fallback(
+      store_dir, cloud_path, sg_labels=sg_labels, channels=channels,
+      time_resolution=time_resolution, probe_keys=probe_keys, verbose=True)
 
     # (2) Set metadata
     for ho in ho_list:
       nebula.meta[ho.sg_label] = {}
       nebula.meta[ho.sg_label]['age'] = sub_dict[ho.sub_id][ho.ses_id]['age']
-      acq_time = self.get_acq_time(ho.ses_path, return_str=True)
+      acq_time = self.get_acq_time(ho.ses_path, return_str=True,
+                                   inventory=self.inventory)
       nebula.meta[ho.sg_label][self.ACQ_TIME_KEY] = acq_time
 
       nebula.meta[ho.sg_label]['gender'] = sub_dict[ho.sub_id][ho.ses_id]['gender']
@@ -523,6 +585,7 @@ class HSPAgent(LongitudinalManager):
     if return_folder_names: return self.convert_to_folder_names(filtered_dict)
     return filtered_dict
 
+  @profiled('hsp.filter_patients_local')
   def filter_patients_local(self, patient_dict: dict, min_n_sessions=1,
                             should_have_annotation=False, verbose=False):
     """Filter patients based on AWS database downloaded to local."""
@@ -564,6 +627,7 @@ class HSPAgent(LongitudinalManager):
 
     return filtered_dict
 
+  @profiled('hsp.filter_patients_sg')
   def filter_patients_sg(self, patient_dict: dict, sg_dir, min_n_sessions=1,
                          verbose=False, dtype=np.float16, max_sfreq=128):
     """Filter patients based on sg with at least 8 channels (6 EEG + 2 EOG)"""
@@ -602,6 +666,7 @@ class HSPAgent(LongitudinalManager):
 
     return filtered_dict
 
+  @profiled('hsp.filter_patients_neb')
   def filter_patients_neb(self, patient_dict: dict, neb_dir, min_n_sessions=1,
                           verbose=True, time_resolution=30, pk='AMP-1',
                           ck='EEG C3-M2', min_hours=2):
@@ -633,7 +698,8 @@ class HSPAgent(LongitudinalManager):
           continue
 
         # (2) Make sure file exist
-        cloud: dict = io.load_file(cloud_path)
+        with instrument.item('hsp.filter_patients_neb', ho.sg_label):
+          cloud: dict = io.load_file(cloud_path)
         hours = sum([len(cloud[k]) for k in ['N1', 'N2', 'N3', 'R']]) * time_resolution / 3600
 
         if hours < min_hours:
@@ -667,6 +733,60 @@ class HSPAgent(LongitudinalManager):
 
     return filtered_dict
 
+  @profiled('hsp.filter_patients_by_hypnogram')
+  def filter_patients_by_hypnogram(
+      self, patient_dict: dict, sg_dir, min_n_sessions=1, verbose=True,
+      min_hours=2, dtype=np.float16, max_sfreq=128):
+    """Filter patients based on hypnograms in .sg sidecars (signals are not
+    loaded):
+       (1) sleep time >= min_hours
+       (2) have N2 stage
+    """
+    from freud.data_io.sidecar import load_sidecar
+
+    filtered_dict = OrderedDict()
+
+    if verbose: console.show_status('Scanning sidecars ...')
+    N = len(patient_dict)
+    n_invalid = 0
+    for i, (pid, sess_dict) in enumerate(patient_dict.items()):
+      if verbose and i % 10 == 0: console.print_progress(i, N)
+
+      folder_list = self.convert_to_folder_names({pid: sess_dict}, local=True)
+      path_ho_tuples = [(path, HSPOrganization(path)) for path in folder_list]
+
+      _path_ho_tuples = []
+      for p, ho in path_ho_tuples:
+        sg_path = os.path.join(sg_dir, ho.get_sg_file_name(dtype, max_sfreq))
+        if not os.path.exists(sg_path): continue
+
+        # stage_counts = [W, N1, N2, N3, R, ?]
+        with instrument.item('hsp.filter_patients_by_hypnogram', ho.sg_label):
+          counts = load_sidecar(sg_path)['stage_counts']
+        hours = sum(counts[1:5]) * 30 / 3600
+        if hours < min_hours or counts[2] == 0: continue
+        _path_ho_tuples.append((p, ho))
+
+      n_invalid += len(path_ho_tuples) - len(_path_ho_tuples)
+      path_ho_tuples = _path_ho_tuples
+
+      # Check session number
+      if len(path_ho_tuples) >= min_n_sessions:
+        _sess_dict = OrderedDict()
+        for (p, ho) in path_ho_tuples:
+          _sess_dict[ho.ses_id] = sess_dict[ho.ses_id]
+        filtered_dict[pid] = _sess_dict
+
+    if verbose:
+      console.show_status('Filtered dict generated.')
+      console.show_info('Details:')
+      N0, N1 = len(patient_dict), len(filtered_dict)
+      console.supplement(f'n_subjects: {N0} -> {N1} (-{N0 - N1})')
+      console.supplement(f'Invalid sessions: {n_invalid}', level=2)
+
+    return filtered_dict
+
+  @profiled('hsp.filter_patients_by_channels')
   def filter_patients_by_channels(
       self, patient_dict: dict, channels, min_n_sessions=1, verbose=False):
     filtered_dict = OrderedDict()
@@ -674,13 +794,23 @@ class HSPAgent(LongitudinalManager):
     if verbose: console.show_status('Examining channels ...')
     N = len(patient_dict)
 
+    # Sessions in inventory are checked at once
+    inventory = self.inventory
+    valid_labels = (set() if inventory is None
+                    else inventory.get_labels_with_channels(channels))
+
     for i, (pid, sess_dict) in enumerate(patient_dict.items()):
       if verbose and i % 10 == 0: console.print_progress(i, N)
 
       for ses_id, infor_dict in sess_dict.items():
-        ho = HSPOrganization(self.get_raw_path(pid, ses_id))
-        if any([ck not in ho.channel_dict for ck in channels]):
-          continue
+        label = self.get_pair_label(pid, ses_id)
+        if inventory is not None and inventory.has_channel_info(label):
+          missing = label not in valid_labels
+        else:
+          ho = HSPOrganization(self.get_raw_path(pid, ses_id))
+          with instrument.item('hsp.filter_patients_by_channels', label):
+            missing = any([ck not in ho.channel_dict for ck in channels])
+        if missing: continue
 
         if pid not in filtered_dict: filtered_dict[pid] = OrderedDict()
         filtered_dict[pid][ses_id] = infor_dict
@@ -737,14 +867,10 @@ class HSPAgent(LongitudinalManager):
     assert os.path.exists(ss_file_path), f'File not found: {ss_file_path}'
     subset_dict = io.load_file(ss_file_path, verbose=True)
 
-    nights_1, nights_2 = [], []
-    subject_ids = sorted(list(subset_dict.keys()))
-    for pid in subject_ids:
-      ses_keys = sorted(list(subset_dict[pid].keys()))
-      nights_1.append(f'{pid}_{ses_keys[0]}')
-      nights_2.append(f'{pid}_{ses_keys[1]}')
-
-    return nights_1, nights_2
+    # Pairs are ordered by subject ID, sessions are sorted within subject
+    table = self.get_session_table(OrderedDict(sorted(subset_dict.items())))
+    i, j = table.get_first_second_pairs()
+    return table.labels[i].tolist(), table.labels[j].tolist()
 
 
   def get_raw_path(self, pid, ses_id):
@@ -768,31 +894,6 @@ class HSPAgent(LongitudinalManager):
     return folder_list
 
 
-  def get_longitudinal_pairs(self, patient_dict: dict, return_age_delta=False):
-    label_pairs = []
-    age_delta_dict = OrderedDict()
-    for pid, sess_dict in patient_dict.items():
-      sess_keys = sorted(list(sess_dict.keys()))
-      if len(sess_keys) < 2: continue
-      for i in range(len(sess_keys) - 1):
-        for j in range(i + 1, len(sess_keys)):
-          si, sj = sess_keys[i], sess_keys[j]
-          pair_key = (f'{pid}_{si}', f'{pid}_{sj}')
-          label_pairs.append(pair_key)
-
-          if not return_age_delta: continue
-          assert self.ACQ_TIME_KEY in sess_dict[si]
-
-          ad = (sess_dict[sj][self.ACQ_TIME_KEY] -
-                sess_dict[si][self.ACQ_TIME_KEY]).days / 365.25
-          if ad < 0: ad = sess_dict[sj]['age'] - sess_dict[si]['age']
-
-          age_delta_dict[pair_key] = ad
-
-    if return_age_delta: return label_pairs, age_delta_dict
-    return label_pairs
-
-
   @staticmethod
   def generate_patient_dict(meta_path) -> OrderedDict:
     import pandas as pd
@@ -855,13 +956,21 @@ class HSPAgent(LongitudinalManager):
     return True
 
   @staticmethod
-  def get_acq_time(ses_path, return_str=False):
+  def get_acq_time(ses_path, return_str=False, inventory=None):
+    """Read acquisition date from inventory if the session has been
+    crawled with a valid date (see `build_inventory`), otherwise from
+    `*_scans.tsv`"""
     import pandas as pd
 
     ho = HSPOrganization(ses_path)
-    if not os.path.exists(ho.tsv_path): return None
-    df = pd.read_csv(ho.tsv_path, sep='\t')
-    date_str = df['acq_time'].str.split('T').str[0].iloc[0]
+    date_str = None
+    if inventory is not None and ho.sg_label in inventory:
+      date_str = inventory.get_acq_date(ho.sg_label)
+
+    if date_str is None:
+      if not os.path.exists(ho.tsv_path): return None
+      df = pd.read_csv(ho.tsv_path, sep='\t')
+      date_str = df['acq_time'].str.split('T').str[0].iloc[0]
 
     # Check data_str format
     try:
@@ -921,7 +1030,8 @@ class HSPAgent(LongitudinalManager):
           # df = pd.read_csv(ho.tsv_path, sep='\t')
           # acq_time = df['acq_time'].str.split('T').str[0].iloc[0]
           # _od['acq_time'] = acq_time
-          _od['acq_time'] = self.get_acq_time(ses_path, return_str=True)
+          _od['acq_time'] = self.get_acq_time(
+            ses_path, return_str=True, inventory=self.inventory)
 
         # (3) Insert questionnaire data
         df = pd.read_csv(pre_path)
@@ -1151,14 +1261,19 @@ class HSPOrganization(Nomear):
     import pandas as pd
 
     df = pd.read_csv(self.channel_path, sep='\t')
-    cd = {row['name']: row.drop('name').to_dict() for _, row in df.iterrows()}
+    cd = {name: row for name, row in zip(
+      df['name'], df.drop(columns='name').to_dict('records'))}
     return cd
 
-  def get_sg_file_name(self, dtype, max_sfreq, bipolar=False):
+  @staticmethod
+  def get_sg_suffix(dtype, max_sfreq, bipolar=False):
     dtype_str = str(dtype).split('.')[-1].replace('>', '')
     dtype_str = dtype_str.replace("'", '')
     bipolar_str = ',bipolar' if bipolar else ''
-    return f'{self.sg_label}({dtype_str},{max_sfreq}Hz{bipolar_str}).sg'
+    return f'({dtype_str},{max_sfreq}Hz{bipolar_str}).sg'
+
+  def get_sg_file_name(self, dtype, max_sfreq, bipolar=False):
+    return self.sg_label + self.get_sg_suffix(dtype, max_sfreq, bipolar)
 
 
 if __name__ == '__main__':
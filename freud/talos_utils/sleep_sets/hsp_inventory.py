@@ -0,0 +1,300 @@
+"""Cohort-wide inventory of HSP sessions. Acquisition dates (`*_scans.tsv`),
+channels (`*_channels.tsv`) and file sizes of all sessions are crawled once,
+in a process pool, and kept in a compact columnar table, so that queries such
+as `HSPAgent.get_acq_time` or channel filtering do not re-read TSV files.
+
+Table dict keys:
+  labels          list of session labels `<sub_id>_<ses_id>` (rows)
+  ses_paths       list of session paths
+  acq_dates       datetime64[D] array of shape [N], NaT if missing
+  edf_sizes       int64 array of shape [N], -1 if file is missing
+  anno_sizes      int64 array of shape [N], -1 if file is missing
+  channel_offsets int64 array of shape [N + 1], channels of row i are
+                  entries [channel_offsets[i], channel_offsets[i + 1]) in
+                  the following flat arrays; rows without channel files
+                  have no entries and are marked in `has_channels`
+  has_channels    bool array of shape [N]
+  channel_ids     int32 indices into `channel_names`
+  type_ids        int16 indices into `channel_types`
+  unit_ids        int16 indices into `units`
+  sfreqs          float32 sampling frequencies, NaN if not numeric
+  extra_ids       int32 indices into `channel_extras`, i.e., other columns
+                  of `*_channels.tsv` as tuples of (column, value) pairs
+  channel_names, channel_types, units, channel_extras   vocabularies
+"""
+from collections import OrderedDict
+from roma import console, io
+
+import os
+import numpy as np
+
+
+
+def read_tsv(path) -> list:
+  """Read a tsv file as a list of row dicts"""
+  import csv
+
+  with open(path, newline='') as f:
+    return list(csv.DictReader(f, delimiter='\t'))
+
+
+def parse_acq_date(acq_time: str):
+  """e.g., '2019-01-01T22:00:00' -> '2019-01-01'. Return None if
+  `acq_time` is not a valid date."""
+  if not isinstance(acq_time, str): return None
+  date_str = acq_time.split('T')[0]
+  if ':' in date_str: date_str = date_str.split(' ')[0]
+  try: np.datetime64(date_str, 'D')
+  except ValueError: return None
+  return date_str
+
+
+def parse_tsv_value(value):
+  """Parse a tsv value as `pandas.read_csv` does, i.e., empty values and
+  the BIDS placeholder 'n/a' are NaN, numeric values are float"""
+  if value in (None, '', 'n/a', 'N/A', 'NaN', 'nan'): return np.nan
+  try: return float(value)
+  except ValueError: return value
+
+
+def parse_float(value) -> float:
+  value = parse_tsv_value(value)
+  return value if isinstance(value, float) else np.nan
+
+
+def _crawl_session(ses_path) -> dict:
+  """Collect inventory record of a session, run in worker processes"""
+  from freud.talos_utils.sleep_sets.hsp import HSPOrganization
+
+  ho = HSPOrganization(ses_path)
+  get_size = lambda p: os.path.getsize(p) if os.path.exists(p) else -1
+  record = {'label': ho.sg_label, 'ses_path': ses_path, 'acq_date': None,
+            'edf_size': get_size(ho.edf_path),
+            'anno_size': get_size(ho.anno_path), 'channels': None}
+
+  if os.path.exists(ho.tsv_path):
+    rows = read_tsv(ho.tsv_path)
+    if rows: record['acq_date'] = parse_acq_date(rows[0].get('acq_time'))
+
+  if os.path.exists(ho.channel_path):
+    main_columns = ('name', 'type', 'units', 'sampling_frequency')
+    record['channels'] = [
+      (row['name'], row.get('type', ''), row.get('units', ''),
+       parse_float(row.get('sampling_frequency')),
+       tuple([(k, v) for k, v in row.items()
+              if k is not None and k not in main_columns]))
+      for row in read_tsv(ho.channel_path)]
+
+  return record
+
+
+
+class HSPInventory(object):
+
+  EXTENSION = '.inv'
+  prompt = '[HSP_INVENTORY] >>'
+
+  def __init__(self, path):
+    self.path = path
+    self.table = self._get_empty_table()
+
+    self._row_index = {}
+
+  # region: Properties
+
+  @property
+  def labels(self): return self.table['labels']
+
+  # endregion: Properties
+
+  # region: Public Methods
+
+  @classmethod
+  def load(cls, path) -> 'HSPInventory':
+    inventory = cls(path)
+    if os.path.exists(path):
+      table = io.load_file(path)
+      # Inventory saved by earlier versions lacks columns, build it again
+      if set(table.keys()) != set(inventory.table.keys()):
+        console.warning(f'Inventory `{path}` is outdated and will be rebuilt.')
+        return inventory
+      inventory.table = table
+      inventory._row_index = {lb: i for i, lb in enumerate(inventory.labels)}
+    return inventory
+
+
+  def build(self, ses_paths: list, n_workers=1, overwrite=False, save=True):
+    """Crawl sessions not yet in inventory (or all if `overwrite`) and
+    append them to the table. Known sessions without acquisition date or
+    channel info are crawled again, since their files may have been added
+    or fixed since last build."""
+    from freud.talos_utils.slp_set import SleepSet
+
+    if overwrite: self.table, self._row_index = self._get_empty_table(), {}
+    t = self.table
+    incomplete = np.isnat(t['acq_dates']) | ~t['has_channels']
+    complete_paths = set(np.asarray(t['ses_paths'])[~incomplete].tolist())
+    ses_paths = [p for p in ses_paths if p not in complete_paths]
+    if not ses_paths: return
+
+    console.show_status(f'Crawling {len(ses_paths)} sessions ...',
+                        prompt=self.prompt)
+    results = SleepSet.map_in_pool(
+      _crawl_session, [(p,) for p in ses_paths], n_workers=n_workers,
+      desc='sessions')
+    records = [r for r, error in results if r is not None]
+    self._remove([r['label'] for r in records if r['label'] in self])
+    self._append(records)
+
+    if save: self.save()
+    console.show_status(f'Inventory contains {len(self)} sessions.',
+                        prompt=self.prompt)
+
+
+  def save(self):
+    tmp_path = self.path + '.tmp'
+    io.save_file(self.table, tmp_path)
+    os.replace(tmp_path, self.path)
+
+
+  def get_acq_date(self, label) -> str:
+    date = self.table['acq_dates'][self._row_index[label]]
+    return None if np.isnat(date) else str(date)
+
+
+  def get_file_sizes(self, label) -> dict:
+    i = self._row_index[label]
+    return {'edf': int(self.table['edf_sizes'][i]),
+            'anno': int(self.table['anno_sizes'][i])}
+
+
+  def has_channel_info(self, label) -> bool:
+    return label in self and bool(
+      self.table['has_channels'][self._row_index[label]])
+
+
+  def get_channel_dict(self, label) -> OrderedDict:
+    """Return {name: {column: value}} with all columns of
+    `*_channels.tsv`, as `HSPOrganization.channel_dict` does. Values are
+    parsed via `parse_tsv_value`."""
+    t = self.table
+    i = self._row_index[label]
+    start, end = t['channel_offsets'][i], t['channel_offsets'][i + 1]
+
+    cd = OrderedDict()
+    for c in range(start, end):
+      info = {'type': parse_tsv_value(t['channel_types'][t['type_ids'][c]]),
+              'units': parse_tsv_value(t['units'][t['unit_ids'][c]]),
+              'sampling_frequency': float(t['sfreqs'][c])}
+      for k, v in t['channel_extras'][t['extra_ids'][c]]:
+        info[k] = parse_tsv_value(v)
+      cd[t['channel_names'][t['channel_ids'][c]]] = info
+    return cd
+
+
+  def get_labels_with_channels(self, channels) -> set:
+    """Return labels of sessions containing all given channels"""
+    t = self.table
+    vocab = {ck: j for j, ck in enumerate(t['channel_names'])}
+    if any([ck not in vocab for ck in channels]): return set()
+
+    # Count matched channels of each session
+    target_ids = np.unique([vocab[ck] for ck in channels])
+    rows = np.repeat(np.arange(len(self)), np.diff(t['channel_offsets']))
+    mask = np.isin(t['channel_ids'], target_ids)
+    counts = np.bincount(rows[mask], minlength=len(self))
+    return set(np.asarray(self.labels)[counts == len(target_ids)].tolist())
+
+  # endregion: Public Methods
+
+  # region: Private Methods
+
+  @staticmethod
+  def _get_empty_table() -> dict:
+    return {'labels': [], 'ses_paths': [],
+            'acq_dates': np.zeros(0, dtype='datetime64[D]'),
+            'edf_sizes': np.zeros(0, dtype=np.int64),
+            'anno_sizes': np.zeros(0, dtype=np.int64),
+            'channel_offsets': np.zeros(1, dtype=np.int64),
+            'has_channels': np.zeros(0, dtype=bool),
+            'channel_ids': np.zeros(0, dtype=np.int32),
+            'type_ids': np.zeros(0, dtype=np.int16),
+            'unit_ids': np.zeros(0, dtype=np.int16),
+            'sfreqs': np.zeros(0, dtype=np.float32),
+            'extra_ids': np.zeros(0, dtype=np.int32),
+            'channel_names': [], 'channel_types': [], 'units': [],
+            'channel_extras': []}
+
+
+  def _append(self, records: list):
+    t = self.table
+    records = [r for r in records if r['label'] not in self._row_index]
+    if not records: return
+
+    def _encode(vocab_key, values):
+      vocab = t[vocab_key]
+      index = {v: j for j, v in enumerate(vocab)}
+      ids = []
+      for v in values:
+        if v not in index:
+          index[v] = len(vocab)
+          vocab.append(v)
+        ids.append(index[v])
+      return ids
+
+    # (1) Session columns
+    N0 = len(self)
+    for i, r in enumerate(records): self._row_index[r['label']] = N0 + i
+    t['labels'] = t['labels'] + [r['label'] for r in records]
+    t['ses_paths'] = t['ses_paths'] + [r['ses_path'] for r in records]
+    for key, dtype in (('acq_dates', 'datetime64[D]'), ('edf_sizes', np.int64),
+                       ('anno_sizes', np.int64)):
+      values = np.array([r[key[:-1]] for r in records], dtype=dtype)
+      t[key] = np.concatenate([t[key], values])
+    t['has_channels'] = np.concatenate([t['has_channels'], np.array(
+      [r['channels'] is not None for r in records], dtype=bool)])
+
+    # (2) Channel columns
+    channels = [c for r in records for c in (r['channels'] or [])]
+    counts = [len(r['channels'] or []) for r in records]
+    t['channel_offsets'] = np.concatenate([t['channel_offsets'], np.cumsum(
+      counts, dtype=np.int64) + t['channel_offsets'][-1]])
+    for key, vocab_key, j, dtype in (
+        ('channel_ids', 'channel_names', 0, np.int32),
+        ('type_ids', 'channel_types', 1, np.int16),
+        ('unit_ids', 'units', 2, np.int16),
+        ('extra_ids', 'channel_extras', 4, np.int32)):
+      ids = _encode(vocab_key, [c[j] for c in channels])
+      t[key] = np.concatenate([t[key], np.array(ids, dtype=dtype)])
+    t['sfreqs'] = np.concatenate([t['sfreqs'], np.array(
+      [c[3] for c in channels], dtype=np.float32)])
+
+
+  def _remove(self, labels: list):
+    """Remove rows of given labels, vocabularies are kept"""
+    if not labels: return
+    t = self.table
+    keep = np.ones(len(self), dtype=bool)
+    keep[[self._row_index[lb] for lb in labels]] = False
+
+    # (1) Channel columns
+    counts = np.diff(t['channel_offsets'])
+    channel_keep = np.repeat(keep, counts)
+    for key in ('channel_ids', 'type_ids', 'unit_ids', 'sfreqs',
+                'extra_ids'):
+      t[key] = t[key][channel_keep]
+    t['channel_offsets'] = np.concatenate(
+      [[0], np.cumsum(counts[keep])]).astype(np.int64)
+
+    # (2) Session columns
+    for key in ('labels', 'ses_paths'):
+      t[key] = np.asarray(t[key], dtype=object)[keep].tolist()
+    for key in ('acq_dates', 'edf_sizes', 'anno_sizes', 'has_channels'):
+      t[key] = t[key][keep]
+    self._row_index = {lb: i for i, lb in enumerate(self.labels)}
+
+  # endregion: Private Methods
+
+  def __contains__(self, label): return label in self._row_index
+
+  def __len__(self): return len(self.labels)
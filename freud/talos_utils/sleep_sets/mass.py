@@ -101,52 +101,16 @@ class MASS(SleepSet):
     ----------
     :param data_dir: MASS_ROOT
     """
-    # (0) Get configs
-    JUST_CONVERSION = kwargs.get('just_conversion', False)
-    PREPROCESS = kwargs.get('preprocess', '')
-
     # (1) Find patient IDs
     ss_path = os.path.join(data_dir, f'mass{ssid}')
     pids = [fn[3:10] for fn in walk(
       ss_path, 'file', '*Base.edf', return_basename=True)]
-    n_patients = len(pids)
-
-    # (2) Load signal groups
-    signal_groups: List[SignalGroup] = []
-
-    for i, pid in enumerate(pids):
-      # (2.1) Create a function to load raw signal group
-      load_raw_sg = lambda: cls.load_as_raw_sg(
-        data_dir, pid, n_patients=n_patients, i=i,
-        max_sfreq=max_sfreq, **kwargs)
-
-      # (2.2) Parse pre-process configs
-      pp_configs, suffix = cls.parse_preprocess_configs(PREPROCESS)
-      # TODO: currently we don't support suffix
-      assert suffix == ''
-
-      # (2.3) Try to load raw signal group
-      if suffix == '':
-        try:
-          sg = load_raw_sg()
-        except Exception as e:
-          import traceback
-          console.warning(f'Failed to load {pid}. Error: {e}')
-          traceback.print_exc()
-          continue
-
-        if not JUST_CONVERSION: signal_groups.append(sg)
-        continue
-
-      # (2.4) TODO
-
-
-      # This is for 00-data-conversion scripts
-      if JUST_CONVERSION: signal_groups.clear()
 
-    # (-1) Show status
-    console.show_status(f'Successfully read {n_patients} files.')
-    return signal_groups
+    # (2) Load signal groups, preprocessed derivatives are cached under
+    #     `derivatives/` of data_dir
+    jobs = [(pid, {}) for pid in pids]
+    return cls.load_signal_groups_in_pool(data_dir, jobs, max_sfreq=max_sfreq,
+                                          **kwargs)
 
 # endregion: Data Loading
 
@@ -87,43 +87,13 @@ class RRSHSCv1(SleepSet):
     :param data_dir: a directory contains pairs of *.edf and *.xml.XML files
     :param max_sfreq: maximum sampling frequency
     """
-    signal_groups: List[SignalGroup] = []
-
     # Traverse all .edf files
     edf_file_names: List[str] = walk(data_dir, 'file', '*.edf',
                                      return_basename=True)
-    n_patients = len(edf_file_names)
-
-    for i, edf_fn in enumerate(edf_file_names):
-      # Parse patient ID and get find PSG file name
-      pid = edf_fn.split('.')[0]
-
-      load_raw_sg = lambda: cls.load_as_raw_sg(
-        data_dir, pid, n_patients=n_patients, i=i, edf_fn=edf_fn,
-        suffix='(max_sf_128)', **kwargs)
-
-      # Parse pre-process configs
-      pp_configs, suffix = cls.parse_preprocess_configs(
-        kwargs.get('preprocess', ''))
-
-      if suffix == '':
-        signal_groups.append(load_raw_sg())
-        continue
-
-      # If the corresponding .sg file exists, read it directly
-      sg_path = os.path.join(data_dir, pid + f'({suffix})' + '.sg')
-      if cls.try_to_load_sg_directly(pid, sg_path, n_patients, i,
-                                     signal_groups, **kwargs): continue
-
-      # Load raw signal group and preprocess
-      sg = cls.preprocess_sg(load_raw_sg(), pp_configs)
-      signal_groups.append(sg)
-
-      # Save sg if necessary
-      cls.save_sg_file_if_necessary(pid, sg_path, n_patients, i, sg, **kwargs)
 
-    console.show_status(f'Successfully read {n_patients} files.')
-    return signal_groups
+    jobs = [(edf_fn.split('.')[0], {'edf_fn': edf_fn, 'suffix': '(max_sf_128)'})
+            for edf_fn in edf_file_names]
+    return cls.load_signal_groups_in_pool(data_dir, jobs, **kwargs)
 
 
   @classmethod
@@ -1,3 +1,5 @@
+from freud.data_io.instrumentation import instrument, profiled
+from freud.data_io.sidecar import save_sg
 from freud.talos_utils.slp_set import SleepSet
 from freud.talos_utils.longitudinal_manager import LongitudinalManager
 from pictor.objects.signals.signal_group import SignalGroup, DigitalSignal
@@ -47,6 +49,7 @@ class SRRSH(SleepSet):
     return edf_ck
 
   @classmethod
+  @profiled('rrshv2.convert_rawdata_to_signal_groups')
   def convert_rawdata_to_signal_groups(
       cls, edf_path_list, tgt_dir, dtype=np.float16, max_sfreq=100, **kwargs):
 
@@ -77,10 +80,13 @@ class SRRSH(SleepSet):
       console.print_progress(i, n)
 
       try:
-        sg: SignalGroup = cls.load_sg_from_raw_files(edf_path, max_sfreq, dtype)
+        with instrument.item('rrshv2.convert_rawdata_to_signal_groups',
+                             sg_label):
+          sg: SignalGroup = cls.load_sg_from_raw_files(
+            edf_path, max_sfreq, dtype)
 
-        sg_path = SRRSHAgent.edf_path_to_sg_path(tgt_dir, edf_path)
-        io.save_file(sg, sg_path, verbose=True)
+          sg_path = SRRSHAgent.edf_path_to_sg_path(tgt_dir, edf_path)
+          save_sg(sg, sg_path, verbose=True)
         n_success += 1
       except Exception as e:
         if kwargs.get('skip_error', True):
@@ -1,5 +1,7 @@
 from collections import OrderedDict
 from datetime import datetime
+from freud.data_io.instrumentation import instrument, profiled
+from freud.data_io.sidecar import save_sg
 from freud.talos_utils.slp_set import SleepSet
 from freud.talos_utils.longitudinal_manager import LongitudinalManager
 from roma import console, io, Nomear
@@ -99,6 +101,7 @@ class SHHSet(SleepSet):
 
 
   @classmethod
+  @profiled('shhs.convert_rawdata_to_signal_groups')
   def convert_rawdata_to_signal_groups(
       cls, edf_anno_label_tuples, tgt_dir, dtype=np.float16, max_sfreq=100,
       **kwargs):
@@ -126,12 +129,13 @@ class SHHSet(SleepSet):
       console.show_status(f'Converting {i + 1}/{n} {sg_label} ...')
       console.print_progress(i, n)
 
-      sg: SignalGroup = cls.load_sg_from_raw_files(
-        edf_path, anno_path, sg_label, dtype, max_sfreq)
+      with instrument.item('shhs.convert_rawdata_to_signal_groups', sg_label):
+        sg: SignalGroup = cls.load_sg_from_raw_files(
+          edf_path, anno_path, sg_label, dtype, max_sfreq)
 
-      sg_path = os.path.join(
-        tgt_dir, SHHSAgent.get_sg_file_name(sg_label, dtype, max_sfreq))
-      io.save_file(sg, sg_path, verbose=True)
+        sg_path = os.path.join(
+          tgt_dir, SHHSAgent.get_sg_file_name(sg_label, dtype, max_sfreq))
+        save_sg(sg, sg_path, verbose=True)
 
     console.show_status(f'Successfully converted {n} files.')
 
@@ -272,6 +276,9 @@ class SHHSAgent(LongitudinalManager):
   @classmethod
   def get_sg_label(cls, pid, sid): return f'{pid}-{sid}'
 
+  @classmethod
+  def get_pair_label(cls, pid, ses_id): return cls.get_sg_label(pid, ses_id)
+
   @classmethod
   def get_sg_file_name(cls, sg_label, dtype=np.float16, max_sfreq=100):
     dtype_str = str(dtype).split('.')[-1].replace('>', '')
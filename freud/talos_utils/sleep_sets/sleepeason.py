@@ -1,6 +1,7 @@
 from fnmatch import fnmatch
 
 import tframe as tfr
+from freud.data_io.sidecar import CohortIndex, save_sg
 from freud.talos_utils.slp_config import SleepConfig
 from freud.talos_utils.slp_set import SleepSet, DataSet
 from pictor.objects.signals.signal_group import SignalGroup, DigitalSignal
@@ -83,6 +84,8 @@ class SleepEason(SleepSet):
       # TODO: without this line, model will be trained on same batch of file
       et_key = 'epoch_table'
       if et_key in self._cloud_pocket: self._cloud_pocket.pop(et_key)
+      # Tape store of batch workers is built upon former signal groups
+      self.release_tape_store()
 
       for sg in self.signal_groups:
         assert isinstance(sg, SignalGroup)
@@ -127,38 +130,43 @@ class SleepEason(SleepSet):
 
   # region: Generator
 
+  LOWER_MATCH_DICT = {
+    'EEG': ['eeg*', 'c3a2', 'c4a1', '[fco]?-m[12]'],
+    'EOG': ['eog*', 'lefteye', 'righteye', 'e?-m2'],
+    'EMG': ['emg*', 'chin 1-chin 2'],
+    'ECG': ['*ecg*']
+  }
+
   @classmethod
-  def find_signals_by_name(cls, ds: DigitalSignal, rule='alpha',
-                           lower_match_dict=None):
-    assert rule == 'alpha'
+  def match_channel_name(cls, src_name: str, lower_match_dict=None):
+    """Return canonical name of a source channel, or None if not matched"""
+    if lower_match_dict is None: lower_match_dict = cls.LOWER_MATCH_DICT
 
-    if lower_match_dict is None: lower_match_dict = {
-      'EEG': ['eeg*', 'c3a2', 'c4a1', '[fco]?-m[12]'],
-      'EOG': ['eog*', 'lefteye', 'righteye', 'e?-m2'],
-      'EMG': ['emg*', 'chin 1-chin 2'],
-      'ECG': ['*ecg*']
-    }
+    for prefix, pats in lower_match_dict.items():
+      if any([fnmatch(src_name.lower(), p) for p in pats]):
+        if src_name.startswith(prefix): return src_name
+        return f'{prefix} {src_name}'
+    return None
 
-    # Fill-in prefixes and pattern according to lower_match_dict
-    prefixes, patterns = [], []
-    for key, pats in lower_match_dict.items():
-      for p in pats:
-        prefixes.append(key)
-        patterns.append(p)
+  @classmethod
+  def find_signals_by_name(cls, ds: DigitalSignal, rule='alpha',
+                           lower_match_dict=None, memo: dict = None):
+    """Find channels to be extracted. If `memo` ({src_name: tgt_name}) is
+    provided, each distinct channel name is matched only once."""
+    assert rule == 'alpha'
 
     channel_names, data_list, offset = [], [], None
     for src_name in ds.channels_names:
-      matched_keys = [k for k, p in zip(prefixes, patterns)
-                      if fnmatch(src_name.lower(), p)]
-      if len(matched_keys) == 0: continue
-
-      # Append data
+      if memo is None:
+        tgt_name = cls.match_channel_name(src_name, lower_match_dict)
+      else:
+        if src_name not in memo:
+          memo[src_name] = cls.match_channel_name(src_name, lower_match_dict)
+        tgt_name = memo[src_name]
+      if tgt_name is None: continue
+
+      # Append data and channel name
       data_list.append(ds[src_name])
-
-      # Append channel name
-      prefix = matched_keys[0]
-      tgt_name = src_name
-      if not tgt_name.startswith(prefix): tgt_name = f'{prefix} {tgt_name}'
       channel_names.append(tgt_name)
 
       # Set offset
@@ -166,67 +174,116 @@ class SleepEason(SleepSet):
 
     return channel_names, data_list, offset
 
+  @classmethod
+  def _convert_one(cls, sg_path, tgt_path, file_prefix, sfreq, memo: dict):
+    """Convert a single sg file. Return a manifest entry along with channel
+    name decisions newly added to memo."""
+    n_memo = len(memo)
+    src_sg: SignalGroup = io.load_file(sg_path)
+
+    # Extract digital signal
+    data_list, channel_names, layout, offset = [], [], [], None
+    for src_ds in src_sg.digital_signals:
+      if src_ds.sfreq != sfreq: continue
+      layout.extend(src_ds.channels_names)
+
+      # Find channels
+      names, data, offset = cls.find_signals_by_name(src_ds, memo=memo)
+      channel_names.extend(names)
+      data_list.extend(data)
+
+    # Raise if found no valid signal
+    if len(data_list) == 0: raise AssertionError(
+      f'!! Failed to find valid signal in `{sg_path}`')
+
+    data = np.stack(data_list, axis=-1)
+    ds = DigitalSignal(data, sfreq=sfreq, channel_names=channel_names,
+                       off_set=offset, label=','.join(channel_names))
+    tgt_sg = SignalGroup(ds, label=src_sg.label, **src_sg.properties)
+    tgt_sg.label = file_prefix + tgt_sg.label
+    tgt_sg.annotations = src_sg.annotations
+
+    # Save sg file to target_dir
+    save_sg(tgt_sg, tgt_path)
+
+    entry = {'source': sg_path, 'source_fp': cls.get_file_fingerprint(sg_path),
+             'channels': channel_names, 'layout': tuple(layout)}
+    return entry, dict(list(memo.items())[n_memo:])
+
   @classmethod
   def convert_to_eason_sg(cls, src_dir, tgt_dir, src_pattern='*.sg',
-                          format='alpha',  file_prefix=''):
+                          format='alpha',  file_prefix='', n_workers=1,
+                          overwrite=False):
     """Format details:
 
     alpha
     -----
     1. Contains EEG, EOG, EMG, ECG channels, fs=128Hz;
     2. preprocess=IQR
+
+    Files whose source is unchanged since last conversion are skipped.
+    A manifest `<file_prefix>eason.manifest` is kept in `tgt_dir`, which
+    contains (1) `files`: {tgt_file_name: entry}, each entry records source
+    path and fingerprint, target channels and source channel layout; and (2)
+    `channel_memo`: {src_channel_name: tgt_channel_name or None}.
     """
+    from collections import Counter, OrderedDict
+
     assert format == 'alpha'
     sfreq = 128
+    if not os.path.exists(tgt_dir): os.makedirs(tgt_dir)
 
-    # Read sg files from src_dir
-    sg_file_list = walk(src_dir, 'file', src_pattern, return_basename=True)
+    # (0) Load manifest
+    manifest_path = os.path.join(tgt_dir, f'{file_prefix}eason.manifest')
+    if os.path.exists(manifest_path): manifest = io.load_file(manifest_path)
+    else: manifest = {'files': OrderedDict(), 'channel_memo': {}}
+    memo: dict = manifest['channel_memo']
 
-    # Process and save each sg file to tgt_dir
-    N = len(sg_file_list)
-    for i, sg_fn in enumerate(sg_file_list):
+    # (1) Find files to be converted
+    sg_file_list = walk(src_dir, 'file', src_pattern, return_basename=True)
+    jobs = []
+    for sg_fn in sg_file_list:
       sg_path = os.path.join(src_dir, sg_fn)
+      tgt_sg_fn = file_prefix + re.sub(r'\([\d\w;,-]*\)', '', sg_fn)
+      # Preprocessed derivatives (*.ppsg) are converted to .sg files
+      stem, ext = os.path.splitext(tgt_sg_fn)
+      if ext == cls.PP_EXTENSION: tgt_sg_fn = stem + '.sg'
+      tgt_path = os.path.join(tgt_dir, tgt_sg_fn)
 
-      # Show status
-      console_symbol = f'[{i + 1}/{N}]'
-      console.show_status(
-        f'Loaded `{sg_fn}` data from `{src_dir}`.', symbol=console_symbol)
+      # Skip if up-to-date
+      entry = manifest['files'].get(tgt_sg_fn, None)
+      if not overwrite and entry is not None and os.path.exists(tgt_path):
+        known = entry['source_fp']
+        fp = cls.get_file_fingerprint(sg_path, known=known)
+        if entry['source'] == sg_path and fp['md5'] == known['md5']: continue
 
-      src_sg: SignalGroup = io.load_file(sg_path)
+      jobs.append((tgt_sg_fn, (sg_path, tgt_path, file_prefix, sfreq, memo)))
 
-      # Extract digital signal
-      data_list, channel_names, offset = [], [], None
-      for src_ds in src_sg.digital_signals:
-        if src_ds.sfreq != sfreq: continue
-
-        # Find channels
-        names, data, offset = cls.find_signals_by_name(src_ds)
-        channel_names.extend(names)
-        data_list.extend(data)
-
-      # Continue if found no valid signal
-      if len(data_list) == 0:
-        console.show_status(f'!! failed to find valid signal in `{sg_fn}`')
-        continue
-
-      data = np.stack(data_list, axis=-1)
-      ds = DigitalSignal(data, sfreq=sfreq, channel_names=channel_names,
-                         off_set=offset, label=','.join(channel_names))
-      tgt_sg = SignalGroup(ds, label=src_sg.label, **src_sg.properties)
-      tgt_sg.label = file_prefix + tgt_sg.label
-      tgt_sg.annotations = src_sg.annotations
-
-      # Save sg file to target_dir
-      tgt_sg_fn = file_prefix + re.sub('\([\d\w;,-]*\)', '', sg_fn)
-      io.save_file(tgt_sg, os.path.join(tgt_dir, tgt_sg_fn))
-      console.show_status(
-        f'`{tgt_sg_fn}` data extracted and saved to `{tgt_dir}`.',
-        symbol=console_symbol)
-
-      # Print progress
-      console.print_progress(i, N)
-
-    console.show_status(f'Successfully converted {N} files.')
+    N = len(sg_file_list)
+    console.show_status(f'{N - len(jobs)}/{N} files are up-to-date.')
+
+    # (2) Convert files
+    results = cls.map_in_pool(cls._convert_one, [args for _, args in jobs],
+                              n_workers=n_workers, desc='files')
+    for (tgt_sg_fn, _), (res, error) in zip(jobs, results):
+      if error is not None: continue
+      entry, new_decisions = res
+      manifest['files'][tgt_sg_fn] = entry
+      memo.update(new_decisions)
+
+    # (3) Save and report manifest
+    io.save_file(manifest, manifest_path)
+    console.show_status(f'Manifest saved to `{manifest_path}`.')
+
+    layouts = Counter([e['layout'] for e in manifest['files'].values()])
+    console.show_info(f'{len(layouts)} channel layouts found:')
+    for layout, n in layouts.most_common():
+      tgt_names = [memo.get(c, None) for c in layout]
+      console.supplement(f'[{n} files] ' + ', '.join(
+        [c if t is None else f'{c}->{t}' for c, t in zip(layout, tgt_names)
+         if t is not None]), level=2)
+
+    return manifest
 
   # endregion: Generator
 
@@ -264,30 +321,11 @@ class SleepEason(SleepSet):
     66  88   1
     71  88   2
     """
-    stage_distribution = []
-    RK2AASM= {0: 0, 1: 1, 2: 2, 3: 3, 4: 3, 5: 4}
-
-    # Read sg files from src_dir
-    sg_file_list = walk(src_dir, 'file', src_pattern, return_basename=True)
-    N = len(sg_file_list)
-    for i, sg_fn in enumerate(sg_file_list):
-      sg_path = os.path.join(src_dir, sg_fn)
-
-      # Show status
-      console_symbol = f'[{i + 1}/{N}]'
-      console.show_status(
-        f'Loaded `{sg_fn}` data from `{src_dir}`.', symbol=console_symbol)
-
-      src_sg: SignalGroup = io.load_file(sg_path)
-      annotations = src_sg.annotations['stage Ground-Truth']
-      labels_sets = np.zeros(5)
-      for anno, interval in zip(annotations.annotations, annotations.intervals):
-        if anno <= 5:
-          labels_sets[RK2AASM[anno]] += int((interval[1] - interval[0]) / 30)
-
-      stage_distribution.append(labels_sets)
-
-    return stage_distribution
+    # Stage counts are read from .sg sidecars, signals are not loaded. Since
+    #  this is a read-only report, nothing is written into src_dir
+    index = CohortIndex.load(src_dir, src_pattern, save=False)
+    return [index.records[fn]['stage_counts'][:5].astype(float)
+            for fn in index.file_names]
 
   BENCHMARK = {
     'alpha': {'val': ['SC4001', 'SC4102', 'ucddb025', 'ucddb026', 'rrsh-ZJK', 'rrsh-ZGC'],
@@ -78,8 +78,6 @@ class SleepEDFx(SleepSet):
     ----------
     :param data_dir: a directory contains pairs of *-PSG.edf and *-Hypnogram.edf
     """
-    signal_groups: List[SignalGroup] = []
-
     # Traverse all hypnogram files
     hypno_file_names: List[str] = walk(data_dir, 'file', '*Hypnogram*',
                                        return_basename=True)
@@ -88,42 +86,10 @@ class SleepEDFx(SleepSet):
       pat = kwargs['fn_pattern']
       hypno_file_names = [fn for fn in hypno_file_names if fnmatch(fn, pat)]
 
-    n_patients = len(hypno_file_names)
-    for i, hypno_fn in enumerate(hypno_file_names):
-      # Parse patient ID and get find PSG file name
-      pid = hypno_fn.split('-')[0][:7]
-
-      load_raw_sg = lambda: cls.load_as_raw_sg(
-        data_dir, pid, n_patients=n_patients, i=i, hypno_fn=hypno_fn, **kwargs)
-
-      # Parse pre-process configs
-      pp_configs, suffix = cls.parse_preprocess_configs(
-        kwargs.get('preprocess', ''))
-
-      if suffix == '':
-        signal_groups.append(load_raw_sg())
-        continue
-
-      # If the corresponding .sg file exists, read it directly
-      sg_path = os.path.join(data_dir, pid + f'({suffix})' + '.sg')
-      pp_kwargs = kwargs.copy()
-      if kwargs.get('overwrite_pp', False): pp_kwargs['overwrite'] = True
-      if cls.try_to_load_sg_directly(pid, sg_path, n_patients, i,
-                                     signal_groups, **pp_kwargs): continue
-
-      # Load raw signal group and preprocess
-      sg = cls.preprocess_sg(load_raw_sg(), pp_configs)
-      signal_groups.append(sg)
-
-      # Save sg if necessary
-      cls.save_sg_file_if_necessary(
-        pid, sg_path, n_patients, i, sg, **kwargs)
-
-      # This is for 00-data-conversion scripts
-      if kwargs.get('just_conversion', False): signal_groups.clear()
-
-    console.show_status(f'Successfully read {n_patients} files.')
-    return signal_groups
+    # Parse patient ID from hypnogram file name, e.g., SC4001EC -> SC4001E
+    jobs = [(hypno_fn.split('-')[0][:7], {'hypno_fn': hypno_fn})
+            for hypno_fn in hypno_file_names]
+    return cls.load_signal_groups_in_pool(data_dir, jobs, **kwargs)
 
   @classmethod
   def pp_trim(cls, sg, config):
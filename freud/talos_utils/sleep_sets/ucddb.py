@@ -91,47 +91,17 @@ class UCDDB(SleepSet):
     """
     import pandas as pd
 
-    signal_groups: List[SignalGroup] = []
-
     # Read SubjectDetails.xls
     xls_path = os.path.join(data_dir, 'SubjectDetails.xls')
     df = pd.read_excel(xls_path)
 
     # Get all .edf files
     rec_file_list: List[str] = walk(data_dir, 'file', '*.rec*')
-    n_patients = len(rec_file_list)
 
     # Read records in order
-    for i, rec_fp in enumerate(rec_file_list):
-      # Get id
-      pid: str = os.path.split(rec_fp)[-1].split('.r')[0]
-
-      load_raw_sg = lambda: cls.load_as_raw_sg(
-        data_dir, pid, n_patients=n_patients, i=i, df=df, rec_fp=rec_fp,
-        **kwargs)
-
-      # Parse pre-process configs
-      pp_configs, suffix = cls.parse_preprocess_configs(
-        kwargs.get('preprocess', ''))
-
-      if suffix == '':
-        signal_groups.append(load_raw_sg())
-        continue
-
-      # If the corresponding .sg file exists, read it directly
-      sg_path = os.path.join(data_dir, pid + f'({suffix})' + '.sg')
-      if cls.try_to_load_sg_directly(pid, sg_path, n_patients, i,
-                                     signal_groups, **kwargs): continue
-
-      # Load raw signal group and preprocess
-      sg = cls.preprocess_sg(load_raw_sg(), pp_configs)
-      signal_groups.append(sg)
-
-      # Save sg if necessary
-      cls.save_sg_file_if_necessary(pid, sg_path, n_patients, i, sg, **kwargs)
-
-    console.show_status(f'Successfully read {n_patients} files.')
-    return signal_groups
+    jobs = [(os.path.split(rec_fp)[-1].split('.r')[0], {'rec_fp': rec_fp})
+            for rec_fp in rec_file_list]
+    return cls.load_signal_groups_in_pool(data_dir, jobs, df=df, **kwargs)
 
   # endregion: Data Loading
 
@@ -5,6 +5,7 @@ from freud.talos_utils.sleep_sets.sleepeason import SleepEason
 from freud.talos_utils.sleep_sets.sleepedfx import SleepEDFx
 from freud.talos_utils.sleep_sets.ucddb import UCDDB
 from freud.talos_utils.sleep_sets.rrshv1 import RRSHSCv1
+from freud.talos_utils.sleep_sets.hsp import HSPSet
 
 from tframe import console
 from tframe.data.base_classes import DataAgent
@@ -17,7 +18,7 @@ class SleepAgent(DataAgent):
   """Load sleep data according to `th.data_config` whose syntax is
       '<data_name> (configs)*'
   Here, built-in <data_name>s include
-  (1) 'sleepedfx'; (2) 'ucddb'; (3) 'rrshv1'.
+  (1) 'sleepedfx'; (2) 'ucddb'; (3) 'rrshv1'; (4) 'hsp'.
   Note that <data_name> is also the corresponding folder name.
 
   Customized dataset can be registered into `roster` via
@@ -25,7 +26,8 @@ class SleepAgent(DataAgent):
   """
 
   roster = {'sleepedfx': SleepEDFx, 'ucddb': UCDDB, 'rrshv1': RRSHSCv1,
-            'sleepeason1': SleepEason, 'sleepeasonx': SleepEason}
+            'sleepeason1': SleepEason, 'sleepeasonx': SleepEason,
+            'hsp': HSPSet}
 
 
   @classmethod
@@ -21,6 +21,14 @@ class SleepConfig(SmartTrainerHub):
   sg_buffer_size = Flag.integer(10, 'Number of signal-groups loaded per round',
                                 is_key=None)
   epoch_pad = Flag.integer(0, 'Padding num when epoch_num is 1.', is_key=None)
+  batch_workers = Flag.integer(
+    0, 'Number of processes generating training batches from shared tapes',
+    is_key=None)
+  batch_queue_size = Flag.integer(
+    8, 'Maximum number of batches buffered by batch workers', is_key=None)
+  tape_dir = Flag.string(
+    None, 'Directory of memory-mapped tape store, system temp by default',
+    is_key=None)
 
   # endregion: SleepSet.gen_batches setting
 
@@ -1,3 +1,6 @@
+from freud.data_io.sidecar import save_sg
+from freud.dsp_tools.kernels import moving_average
+
 import numpy as np
 import os
 
@@ -31,6 +34,9 @@ class SleepSet(DataSet):
     tapes = 'SleepSet::Keys::tapes'
     map_dict = 'SleepSet::Keys::map_dict'
     epoch_tables = 'SleepSet::Keys::epoch_table'
+    provenance = 'SleepSet::Keys::provenance'
+    tape_store = 'SleepSet::Keys::tape_store'
+    tape_loader = 'SleepSet::Keys::tape_loader'
 
   ANNO_KEY_GT_STAGE = 'stage Ground-Truth'
 
@@ -301,6 +307,55 @@ class SleepSet(DataSet):
 
   # endregion: Single-epoch sampling
 
+  # region: Multi-process sampling
+
+  def _get_tape_loader(self, batch_size):
+    """Get a TapeLoader whose workers sample batches from tapes shared via
+    a memory-mapped TapeStore"""
+    from freud.talos_utils.tape_store import TapeStore, TapeLoader
+    from tframe import hub as th
+    assert isinstance(th, SleepConfig)
+
+    loader = self.get_from_pocket(self.Keys.tape_loader, default=None)
+    if loader is not None and loader.batch_size == batch_size: return loader
+    if loader is not None: loader.stop()
+
+    store = self.get_from_pocket(
+      self.Keys.tape_store, initializer=lambda: TapeStore.build(
+        self, scratch_dir=th.tape_dir))
+    loader = TapeLoader(store, batch_size, n_workers=th.batch_workers,
+                        queue_size=th.batch_queue_size,
+                        epoch_num=th.epoch_num, epoch_delta=th.epoch_delta,
+                        use_batch_mask=th.use_batch_mask)
+    self.put_into_pocket(self.Keys.tape_loader, loader, exclusive=False)
+    return loader
+
+  def release_tape_store(self):
+    """Stop batch workers and remove scratch file of tape store. Should be
+    called whenever `signal_groups` are replaced (e.g., by a data fetcher),
+    so that workers do not keep sampling from tapes of the former ones."""
+    if self.in_pocket(self.Keys.tape_loader):
+      self._cloud_pocket.pop(self.Keys.tape_loader).stop()
+    if self.in_pocket(self.Keys.tape_store):
+      self._cloud_pocket.pop(self.Keys.tape_store).remove()
+
+  def _get_sequence_from_workers(self, batch_size):
+    """Counterpart of `_get_sequence_randomly_fnn` using batch workers"""
+    from tframe import hub as th
+    assert isinstance(th, SleepConfig)
+
+    features, targets, masks = self._get_tape_loader(batch_size).get()
+
+    data_dict = {}
+    if th.use_batch_mask: data_dict[pedia.batch_mask] = masks
+    properties = {}
+    properties[BatchReshape.DEFAULT_PLACEHOLDER_KEY] = th.epoch_num
+    return DataSet(features, targets, data_dict=data_dict,
+                   NUM_CLASSES=self.NUM_STAGES, check_data=False,
+                   **properties)
+
+  # endregion: Multi-process sampling
+
   def gen_batches(self, batch_size, shuffle=False, is_training=False):
     """Generate FNN batches (xs, ys). Each xs[i] has a shape of [E, L, C].
     Here C represents number of channels, E is the number of epochs,
@@ -318,9 +373,15 @@ class SleepSet(DataSet):
     round_len = self.get_round_length(batch_size, training=is_training)
     assert batch_size != -1
 
+    # Batch workers support multi-epoch sampling without padding
+    use_workers = (th.batch_workers > 0 and th.epoch_num >= 1
+                   and th.epoch_pad == 0)
+
     # Generate batches
     for i in range(round_len):
-      if th.epoch_num >= 1:
+      if use_workers:
+        data_batch = self._get_sequence_from_workers(batch_size)
+      elif th.epoch_num >= 1:
         data_batch = self._get_sequence_randomly_fnn(batch_size)
       else:
         data_batch = self._get_branches_randomly(batch_size)
@@ -548,7 +609,7 @@ class SleepSet(DataSet):
 
     tape_list = []
     ks = int(configs[1])
-    red_line = np.convolve(x, [1/ks] * ks, 'same')
+    red_line = moving_average(x, ks)
 
     include_red = configs[0][-1] == '2'
     if include_red: tape_list.append(red_line)
@@ -806,6 +867,56 @@ class SleepSet(DataSet):
 
   # region: Common Utilities
 
+  @staticmethod
+  def _call_safely(func, args):
+    import traceback
+
+    try: return func(*args), None
+    except Exception: return None, traceback.format_exc()
+
+  @classmethod
+  def map_in_pool(cls, func, args_list: list, n_workers=1, desc='jobs'):
+    """Call `func(*args)` for each args in `args_list`, in a process pool if
+    `n_workers` > 1. Failed jobs do not affect others.
+
+    :return: a list of (result, error) in the same order as `args_list`,
+             error is the traceback string of a failed job, otherwise None
+    """
+    import time
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    N, tic = len(args_list), time.time()
+    results = [None] * N
+
+    def _report(i, n_done):
+      console.print_progress(n_done, N)
+      if results[i][1] is not None:
+        console.warning(f'Job {i + 1}/{N} failed:\n{results[i][1]}')
+
+    if n_workers <= 1:
+      for i, args in enumerate(args_list):
+        results[i] = cls._call_safely(func, args)
+        _report(i, i + 1)
+    else:
+      with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(cls._call_safely, func, args): i
+                   for i, args in enumerate(args_list)}
+        for n_done, future in enumerate(as_completed(futures)):
+          i = futures[future]
+          # Worker process may crash, e.g., due to memory error
+          try: results[i] = future.result()
+          except Exception as e: results[i] = (None, f'{e}')
+          _report(i, n_done + 1)
+
+    # Report metrics
+    elapsed = time.time() - tic
+    n_failed = sum([error is not None for _, error in results])
+    console.show_status(
+      f'{N - n_failed}/{N} {desc} done in {elapsed:.1f} sec '
+      f'({N / max(elapsed, 1e-6):.2f} {desc}/sec, {n_workers} worker(s)).')
+    if n_failed > 0: console.warning(f'{n_failed} {desc} failed.')
+    return results
+
   @staticmethod
   def try_to_load_sg_directly(
       pid, sg_path, n_patients, i, signal_groups, **kwargs):
@@ -823,12 +934,72 @@ class SleepSet(DataSet):
     console.print_progress(i, n_patients)
     return False
 
+  @classmethod
+  def _load_sg_job(cls, data_dir, pid, i, n_patients, raw_kwargs: dict):
+    import time
+
+    timings = {'raw': 0.}
+
+    def load_raw_sg():
+      tic = time.time()
+      sg = cls.load_as_raw_sg(data_dir, pid, n_patients=n_patients, i=i,
+                              **raw_kwargs)
+      timings['raw'] += time.time() - tic
+      return sg
+
+    # Preprocessed derivative is cached under `derivatives/` of data_dir
+    tic = time.time()
+    raw_sg_path = os.path.join(
+      data_dir, pid + raw_kwargs.get('suffix', '(raw)') + '.sg')
+    sg = cls.load_preprocessed_sg(
+      raw_sg_path, raw_kwargs.get('preprocess', ''), load_src=load_raw_sg,
+      cache_dir=raw_kwargs.get('pp_dir', None), **raw_kwargs)
+    timings['preprocess'] = time.time() - tic - timings['raw']
+
+    # Avoid sending data back to main process if not required
+    if raw_kwargs.get('just_conversion', False): sg = None
+    return sg, timings
+
+  @classmethod
+  def load_signal_groups_in_pool(cls, data_dir, jobs: list, **kwargs):
+    """Shared loading engine for datasets converted from raw files. For each
+    job, raw sg is loaded (or converted from raw files and saved) via
+    `load_as_raw_sg`, then preprocessed via `load_preprocessed_sg`.
+
+    :param jobs: a list of (pid, job_kwargs). job_kwargs (e.g., raw file
+                 names) are passed to `load_as_raw_sg` along with kwargs.
+    :param n_workers: number of processes, 1 by default
+    :param return_timings: whether to return timing of each stage per job
+    :return: signal groups in the same order as jobs, failed jobs skipped
+    """
+    n_workers = int(kwargs.pop('n_workers', 1))
+    return_timings = kwargs.pop('return_timings', False)
+
+    N = len(jobs)
+    args_list = [(data_dir, pid, i, N, {**kwargs, **job_kwargs})
+                 for i, (pid, job_kwargs) in enumerate(jobs)]
+    results = cls.map_in_pool(cls._load_sg_job, args_list, n_workers,
+                              desc='signal groups')
+
+    # Report timing of each stage
+    timings = [None if error else res[1] for res, error in results]
+    valid_timings = [t for t in timings if t is not None]
+    for key in ('raw', 'preprocess'):
+      total = sum([t[key] for t in valid_timings])
+      console.supplement(f'Stage `{key}`: {total:.1f} sec in total, '
+                         f'{total / max(len(valid_timings), 1):.2f} sec/file')
+
+    signal_groups = [res[0] for res, error in results
+                     if error is None and res[0] is not None]
+    if return_timings: return signal_groups, timings
+    return signal_groups
+
   @staticmethod
   def save_sg_file_if_necessary(pid, sg_path, n_patients, i, sg, **kwargs):
     if kwargs.get('save_sg', True):
       console.show_status(f'Saving `{pid}` data ...')
       console.print_progress(i, n_patients)
-      io.save_file(sg, sg_path)
+      save_sg(sg, sg_path)
       console.show_status(f'Data saved to `{sg_path}`.')
 
   @staticmethod
@@ -856,36 +1027,44 @@ class SleepSet(DataSet):
 
   @staticmethod
   def pp_resample(sg: SignalGroup, fs):
-    from scipy import signal
-
-    ds0: DigitalSignal = sg.digital_signals[0]
-
-    # TODO: 64 for ucddb EMG channels, 100 for sleepedfx EEG channels
-    #       for ucddb, ds0 happens to be the ds needed for resampling
-    assert ds0.sfreq in (64, 100)
+    """Resample all DigitalSignals in sg to `fs` using polyphase filtering"""
+    from freud.dsp_tools.resampling import resample_digital_signal
 
-    N = int(ds0.length // ds0.sfreq * fs)
-    data_new = np.stack([
-      signal.resample(ds0.data[:, i], num=N)
-      for i in range(ds0.num_channels)], axis=-1)
-
-    data_new = data_new.astype(ds0.data.dtype)
-
-    sg.digital_signals[0] = DigitalSignal(
-      data_new, fs, channel_names=ds0.channels_names, label=ds0.label)
+    for i, ds in enumerate(sg.digital_signals):
+      if ds.sfreq == fs: continue
+      sg.digital_signals[i] = resample_digital_signal(ds, fs)
 
   @classmethod
   def pp_trim(cls, sg, config):
     raise NotImplementedError
 
-  @staticmethod
-  def pp_normalize(sg: SignalGroup, config):
+  # Floating signals larger than this many bytes are normalized chunk by
+  #  chunk in place, with median and IQR estimated by a quantile sketch
+  #  (see `freud.dsp_tools.normalization`). None disables this for in-memory
+  #  data, memory-mapped data is always normalized this way.
+  STREAMING_NORM_BYTES = None
+
+  @classmethod
+  def pp_normalize(cls, sg: SignalGroup, config):
     norm = config
     if norm[0] == 'iqr':
       # Rescale data so that median value is 0, put 25 and 75 percentile to
       # [-0.5, 0.5], clip values out of max deviation
+      from freud.dsp_tools.normalization import (copy_to_scratch,
+                                                 robust_normalize_)
+
       iqr, mad = int(norm[1]), int(norm[2])
       for ds in sg.digital_signals:
+        is_memmap = isinstance(ds.data, np.memmap)
+        streaming = is_memmap or (cls.STREAMING_NORM_BYTES is not None and
+                                  ds.data.nbytes > cls.STREAMING_NORM_BYTES)
+        if streaming and np.issubdtype(ds.data.dtype, np.floating):
+          # Never write into the file backing a memmap
+          if is_memmap: ds.data = copy_to_scratch(ds.data)
+          robust_normalize_(ds.data, iqr=iqr, max_abs_deviation=mad,
+                            labels=ds.channels_names, exact=False)
+          continue
+
         dtype = ds.data.dtype
         ds.data = DigitalSignal.preprocess_iqr(
           ds.data, iqr=iqr, max_abs_deviation=mad, labels=ds.channels_names)
@@ -909,6 +1088,139 @@ class SleepSet(DataSet):
 
     return sg
 
+  # region: - Derivative Cache
+
+  PP_ORDER = ('sfreq', 'trim', 'norm')
+
+  # Derivatives are kept in a subdirectory of source directory by default,
+  #  and use a distinct extension so that `*.sg` scans never pick them up
+  PP_DIR_NAME = 'derivatives'
+  PP_EXTENSION = '.ppsg'
+
+  @classmethod
+  def get_canonical_suffix(cls, configs: dict) -> str:
+    """Suffix independent of the order of options in config string. Options
+    are listed in the order they are applied in `preprocess_sg`."""
+    suffix_list = []
+    for key in cls.PP_ORDER:
+      if key not in configs: continue
+      if key == 'sfreq': suffix_list.append(str(configs[key]))
+      elif key == 'trim': suffix_list.append(f'trim{configs[key]}')
+      else: suffix_list.append(','.join(configs[key]))
+    return ';'.join(suffix_list)
+
+  @classmethod
+  def get_preprocessed_sg_path(cls, src_path, suffix, cache_dir=None):
+    if cache_dir is None:
+      cache_dir = os.path.join(os.path.dirname(src_path), cls.PP_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(src_path))[0]
+    return os.path.join(cache_dir, f'{stem}({suffix}){cls.PP_EXTENSION}')
+
+  @staticmethod
+  def get_legacy_preprocessed_sg_path(src_path, suffix, cache_dir=None):
+    """Derivatives used to be saved as `{stem}({suffix}).sg` directly in
+    `cache_dir` (beside source by default), where `*.sg` scans found them"""
+    if cache_dir is None: cache_dir = os.path.dirname(src_path)
+    stem = os.path.splitext(os.path.basename(src_path))[0]
+    return os.path.join(cache_dir, f'{stem}({suffix}).sg')
+
+  @classmethod
+  def migrate_legacy_derivative(cls, src_path, suffix, pp_path,
+                                cache_dir=None) -> bool:
+    """Move legacy derivative of `src_path` (and its sidecar) to `pp_path`
+    if the latter does not exist. Return True if migrated."""
+    from freud.data_io.sidecar import get_sidecar_path
+
+    legacy_path = cls.get_legacy_preprocessed_sg_path(
+      src_path, suffix, cache_dir)
+    if os.path.exists(pp_path) or not os.path.exists(legacy_path):
+      return False
+
+    os.makedirs(os.path.dirname(pp_path), exist_ok=True)
+    os.replace(legacy_path, pp_path)
+    # Modification time is kept by os.replace, thus sidecar stays valid
+    legacy_sidecar_path = get_sidecar_path(legacy_path)
+    if os.path.exists(legacy_sidecar_path):
+      os.replace(legacy_sidecar_path, get_sidecar_path(pp_path))
+    console.show_status(f'Legacy derivative `{legacy_path}` moved to '
+                        f'`{pp_path}`.')
+    return True
+
+  @staticmethod
+  def get_file_fingerprint(file_path, known: dict = None) -> dict:
+    """Return {'size', 'mtime_ns', 'md5'} of a file. MD5 is reused from
+    `known` if size and modification time are unchanged."""
+    import hashlib
+
+    stat = os.stat(file_path)
+    fp = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if known is not None and all(known.get(k) == fp[k] for k in fp):
+      fp['md5'] = known['md5']
+      return fp
+
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+      for block in iter(lambda: f.read(1 << 20), b''): md5.update(block)
+    fp['md5'] = md5.hexdigest()
+    return fp
+
+  @classmethod
+  def is_provenance_valid(cls, sg: SignalGroup, src_path, suffix) -> bool:
+    prov: dict = sg.get_from_pocket(cls.Keys.provenance, default=None)
+    if prov is None or prov['config'] != suffix: return False
+    # Trimming is implemented by each dataset
+    if 'trim' in suffix and prov['preprocessor'] != cls.__name__: return False
+    # Derivative can not be verified without source file
+    if not os.path.exists(src_path): return True
+    fp = cls.get_file_fingerprint(src_path, known=prov['source'])
+    return fp['md5'] == prov['source']['md5']
+
+  @classmethod
+  def load_preprocessed_sg(cls, src_path, cfg_str: str, load_src=None,
+                           cache_dir=None, **kwargs) -> SignalGroup:
+    """Load the preprocessed derivative of `src_path`. The derivative is
+    computed once for each canonicalized preprocess config, and is recomputed
+    only if source file or config is changed.
+
+    :param src_path: path of the source .sg file
+    :param cfg_str: preprocess config string, e.g., '128;iqr'
+    :param load_src: function to load source sg, `io.load_file(src_path)` by
+                     default. Source file may be created by this function.
+    :param cache_dir: directory of derivatives, `derivatives/` under source
+                      directory by default
+    """
+    configs, _ = cls.parse_preprocess_configs(cfg_str)
+    suffix = cls.get_canonical_suffix(configs)
+    if load_src is None: load_src = lambda: io.load_file(src_path)
+    if suffix == '': return load_src()
+
+    # (1) Try to load derivative
+    pp_path = cls.get_preprocessed_sg_path(src_path, suffix, cache_dir)
+    cls.migrate_legacy_derivative(src_path, suffix, pp_path, cache_dir)
+    if os.path.exists(pp_path) and not kwargs.get('overwrite_pp', False):
+      sg = io.load_file(pp_path)
+      if cls.is_provenance_valid(sg, src_path, suffix): return sg
+      console.show_status(f'Source or config of `{pp_path}` has been changed.')
+
+    # (2) Preprocess source sg
+    sg = cls.preprocess_sg(load_src(), configs)
+
+    # (3) Save derivative with provenance if source file exists
+    if os.path.exists(src_path) and kwargs.get('save_sg', True):
+      prov = {'source': cls.get_file_fingerprint(src_path),
+              'source_path': src_path, 'config': suffix,
+              'preprocessor': cls.__name__}
+      sg.put_into_pocket(cls.Keys.provenance, prov, exclusive=False,
+                         local=True)
+      # Directory may be created by other workers at the same time
+      os.makedirs(os.path.dirname(pp_path), exist_ok=True)
+      save_sg(sg, pp_path)
+      console.show_status(f'Preprocessed sg saved to `{pp_path}`.')
+
+    return sg
+
+  # endregion: - Derivative Cache
+
   # endregion: Common Utilities
 
   # endregion: Data Reading
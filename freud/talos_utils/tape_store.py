@@ -0,0 +1,236 @@
+"""Tapes of all signal groups in a SleepSet are placed in one memory-mapped
+scratch file, so that worker processes generating training batches share
+the same buffer (via OS page cache) instead of holding their own copies.
+"""
+from roma import console
+
+import os
+import numpy as np
+
+
+
+class TapeStore(object):
+  """Stores the 1st tape (branch) of each signal group, i.e., tape of shape
+  [L_i, C], in a scratch file of shape [sum(L_i), C]. Epoch tables are stored
+  as index arrays so that sampling does not require signal groups.
+
+  epoch_index[sid] = array of (sg_index, start_time), shape = [N_sid, 2]
+  stage_ids[sg_index] = array of stage ids of each epoch, -1 for unknown
+  """
+
+  EPOCH_DURATION = 30.0
+
+  def __init__(self, path, shape, dtype, offsets, sfreqs, stage_ids,
+               epoch_index, num_stages):
+    self.path = path
+    self.shape = tuple(shape)
+    self.dtype = np.dtype(dtype)
+    self.offsets = list(offsets)
+    self.sfreqs = list(sfreqs)
+    self.stage_ids = stage_ids
+    self.epoch_index = epoch_index
+    self.num_stages = num_stages
+
+    self._buffer = None
+
+  # region: Properties
+
+  @property
+  def buffer(self) -> np.memmap:
+    """Memory map is opened lazily in each process"""
+    if self._buffer is None:
+      self._buffer = np.memmap(self.path, dtype=self.dtype, mode='r',
+                               shape=self.shape)
+    return self._buffer
+
+  @property
+  def num_signal_groups(self): return len(self.sfreqs)
+
+  # endregion: Properties
+
+  # region: Public Methods
+
+  def get_tape(self, i) -> np.ndarray:
+    return self.buffer[self.offsets[i]:self.offsets[i + 1]]
+
+
+  def sample_batch(self, rng: np.random.RandomState, batch_size,
+                   epoch_num=1, epoch_delta=0., use_batch_mask=False):
+    """Sample a batch as `SleepSet._get_sequence_randomly_fnn` does.
+
+    :return: features of shape [B, L, C], targets of shape [B * E, S],
+             masks of shape [B * E] (None if not `use_batch_mask`)
+    """
+    features, targets, masks = [], [], []
+    duration = epoch_num * self.EPOCH_DURATION
+
+    for sid in rng.randint(0, self.num_stages, batch_size):
+      index = self.epoch_index[sid]
+      sg_i, start_time = index[rng.randint(0, len(index))]
+      sg_i = int(sg_i)
+      tape, fs, stage_ids = (self.get_tape(sg_i), self.sfreqs[sg_i],
+                             self.stage_ids[sg_i])
+
+      # Make sure start_i is legal, see `SleepSet._sample_seqs_from_sg`
+      start_i, L = int(start_time * fs), int(duration * fs)
+      valid_L = min(len(tape), int(len(stage_ids) * fs * self.EPOCH_DURATION))
+      start_i = min(max(0, start_i), valid_L - L)
+
+      # Apply shift window augmentation
+      shift = int((rng.rand() * 2 - 1) * fs * self.EPOCH_DURATION
+                  * epoch_delta)
+      i1 = min(max(0, start_i + shift), valid_L - L)
+      features.append(np.array(tape[i1:i1 + L]))
+
+      start_j = int(start_i / fs / self.EPOCH_DURATION)
+      labels = stage_ids[start_j:start_j + epoch_num]
+      if use_batch_mask:
+        masks.append(labels >= 0)
+        labels = np.maximum(labels, 0)
+      elif np.any(labels < 0): raise ValueError(
+        '!! Invalid labels found while not `use_batch_mask`')
+
+      targets.append(np.eye(self.num_stages)[labels])
+
+    features = np.stack(features, axis=0)
+    targets = np.concatenate(targets, axis=0)
+    masks = np.concatenate(masks) if use_batch_mask else None
+    return features, targets, masks
+
+
+  def remove(self):
+    self._buffer = None
+    try:
+      if os.path.exists(self.path): os.remove(self.path)
+    except OSError: pass
+
+  # endregion: Public Methods
+
+  # region: Building
+
+  @classmethod
+  def build(cls, sleep_set, scratch_dir=None) -> 'TapeStore':
+    """Build store from tapes extracted by `SleepSet.extract_sg_tapes`. Tapes
+    in sg pockets are replaced by views of the memory map afterward."""
+    import tempfile, atexit
+
+    sgs = sleep_set.signal_groups
+    key = sleep_set.Keys.tapes
+    assert all([sg.in_pocket(key) for sg in sgs]), '!! Tapes not extracted'
+    tapes = [sg.get_from_pocket(key)[0] for sg in sgs]
+
+    # (1) Write tapes into scratch file
+    C = tapes[0][0].shape[1]
+    assert all([t.shape[1] == C for t, _ in tapes])
+    dtype = np.result_type(*[t.dtype for t, _ in tapes])
+    offsets = np.cumsum([0] + [len(t) for t, _ in tapes]).tolist()
+    shape = (offsets[-1], C)
+
+    if scratch_dir is None: scratch_dir = tempfile.gettempdir()
+    if not os.path.exists(scratch_dir): os.makedirs(scratch_dir)
+    path = os.path.join(
+      scratch_dir, f'{sleep_set.name}-{os.getpid()}-{id(sleep_set)}.tapes')
+
+    console.show_status(f'Writing tapes ({shape[0]}x{C}) to `{path}` ...')
+    mm = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+    for i, (tape, _) in enumerate(tapes):
+      mm[offsets[i]:offsets[i + 1]] = tape
+    mm.flush()
+    del mm
+
+    # (2) Convert epoch tables to index arrays
+    stage_ids = [np.array([-1 if s is None else s for s in
+                           sleep_set.get_sg_epoch_tables(sg)[1]], dtype=int)
+                 for sg in sgs]
+    sg_indices = {id(sg): i for i, sg in enumerate(sgs)}
+    epoch_index = [
+      np.array([(sg_indices[id(sg)], t) for sg, t, _ in table],
+               dtype=float).reshape(-1, 2)
+      for table in sleep_set.epoch_table]
+
+    store = cls(path, shape, dtype, offsets, [fs for _, fs in tapes],
+                stage_ids, epoch_index, sleep_set.NUM_STAGES)
+    # Scratch file is owned by this process, in `scratch_dir` or not
+    atexit.register(store.remove)
+
+    # (3) Release in-process copies
+    for i, sg in enumerate(sgs):
+      sg.put_into_pocket(key, [(store.get_tape(i), tapes[i][1])]
+                         + sg.get_from_pocket(key)[1:], exclusive=False)
+    return store
+
+  # endregion: Building
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_buffer'] = None
+    return state
+
+
+
+def _produce_batches(store: TapeStore, batch_size, sample_kwargs, seed,
+                     queue, stop_event):
+  from queue import Full
+
+  rng = np.random.RandomState(seed)
+  while not stop_event.is_set():
+    batch = store.sample_batch(rng, batch_size, **sample_kwargs)
+    while not stop_event.is_set():
+      try:
+        queue.put(batch, timeout=0.5)
+        break
+      except Full: continue
+
+
+
+class TapeLoader(object):
+  """N worker processes sampling batches from a TapeStore and pushing them
+  into a bounded queue."""
+
+  def __init__(self, store: TapeStore, batch_size, n_workers=2, queue_size=8,
+               seed=None, **sample_kwargs):
+    self.store = store
+    self.batch_size = batch_size
+    self.n_workers = n_workers
+    self.queue_size = queue_size
+    self.seed = np.random.randint(0, 2 ** 31 - n_workers) if seed is None \
+      else seed
+    self.sample_kwargs = sample_kwargs
+
+    self._queue = None
+    self._stop_event = None
+    self._processes = []
+
+  @property
+  def is_running(self): return len(self._processes) > 0
+
+
+  def start(self):
+    import multiprocessing as mp
+
+    if self.is_running: return
+    self._queue = mp.Queue(maxsize=self.queue_size)
+    self._stop_event = mp.Event()
+    for i in range(self.n_workers):
+      p = mp.Process(target=_produce_batches, daemon=True, args=(
+        self.store, self.batch_size, self.sample_kwargs, self.seed + i,
+        self._queue, self._stop_event))
+      p.start()
+      self._processes.append(p)
+    console.show_status(f'{self.n_workers} batch workers started.')
+
+
+  def get(self, timeout=600):
+    """Get a batch (features, targets, masks)"""
+    if not self.is_running: self.start()
+    return self._queue.get(timeout=timeout)
+
+
+  def stop(self):
+    if not self.is_running: return
+    self._stop_event.set()
+    for p in self._processes:
+      p.join(timeout=5)
+      if p.is_alive(): p.terminate()
+    self._processes = []
+    self._queue = None